@@ -0,0 +1,253 @@
+"""只读分析（dry run）：报告处理时将要做的修改，不修改也不保存文档
+
+对大批归档文档排版之前，先看看会发生什么：哪些正文段落按大纲级别提升为标题、
+哪些空标题降级为正文、哪些标题的原有序号被清除和替换、哪些样式上的编号被清除、
+哪些样式被跳过不设置格式。判断规则与 fast 引擎（_process_paragraph / _process_table）
+相同，但只读取：只解析正文和样式两个部件，不修改任何元素，也不序列化和保存，
+比完整处理快得多。
+
+analyze_document 返回单个文档的报告字典：
+    counts            段落、标题、提升、降级、重新编号、设置格式和跳过的段落等计数
+                      （runs 为改写序号之前的 run 数，清除序号可能删除整个 run）
+    changes           逐段落的修改：promote（提升为标题）、demote（空标题降级）、
+                      renumber（清除原有序号 old_prefix，写入新序号 new_number）
+    numbering_removed 将被清除编号的样式
+    skipped_styles    不设置格式的样式（表格内的以"表格内："开头）
+analyze_batch 并行分析一批文档并汇总（aggregate_reports），write_report 写出 JSON 或 CSV。
+"""
+import csv
+import json
+import os
+from collections import Counter
+from io import BytesIO
+from zipfile import ZipFile
+
+from docx import Document
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
+from docx.styles.styles import Styles
+
+from batch import process_batch
+from fast_engine import W_P, W_TBL, _DocumentContext, _next_heading_number
+from formatter import KNOWN_STYLES, NUMBERED_STYLES, OutlineLevelResolver
+from heading_numbers import HEADING_NUMBER_PATTERN
+from rules import load_profile
+from streaming_engine import _Unsupported, _main_parts
+from table_format import iter_cell_paragraphs
+
+W_DOCUMENT = qn('w:document')
+
+# 报告中摘录的段落文字长度
+EXCERPT_LENGTH = 40
+
+# CSV 报告的列，每行一项修改；文档级的清除编号和跳过样式分别记为
+# numbering_removed 和 skipped 行，分析失败的文档记为 error 行
+CSV_FIELDS = ("input", "paragraph", "action", "from_style", "to_style", "old_prefix", "new_number", "text")
+
+
+def _load_parts(file_bytes):
+    """只解析正文和样式部件，返回 (w:body, Styles, 样式元素)；包结构不常见时改用 python-docx 打开"""
+    try:
+        with ZipFile(BytesIO(file_bytes)) as src:
+            document_name, styles_name = _main_parts(src)
+            document = parse_xml(src.read(document_name))
+            if document.tag != W_DOCUMENT or document.body is None:
+                raise _Unsupported("正文部件中没有 w:body")
+            styles_element = parse_xml(src.read(styles_name))
+    except _Unsupported:
+        doc = Document(BytesIO(file_bytes))
+        return doc.element.body, doc.styles, doc.styles.element
+    return document.body, Styles(styles_element), styles_element
+
+
+def _excerpt(text):
+    return text if len(text) <= EXCERPT_LENGTH else text[:EXCERPT_LENGTH] + "…"
+
+
+def _numbered_styles(styles):
+    """kill_style_numbering 将清除编号的样式名列表"""
+    names = []
+    for name in NUMBERED_STYLES:
+        try:
+            style = styles[name]
+        except KeyError:
+            continue
+        if style._element.xpath('.//w:numId'):
+            names.append(name)
+    return names
+
+
+def _analyze_paragraph(p, index, ctx, changes):
+    """按 _process_paragraph 的规则判断正文中一个 w:p 将被如何修改，只读取不修改"""
+    counts = ctx.counts
+    counts["paragraphs"] += 1
+    text = p.text.lstrip()
+
+    style_name = ctx.style_name_of(p)
+    lvl = ctx.outline.level_of(p)
+    if lvl and style_name == "Normal" and ctx.heading_style_id(lvl) is not False:
+        style_name = f"Heading {lvl}"
+        counts["promoted"] += 1
+        changes.append({"paragraph": index, "action": "promote", "from_style": "Normal",
+                        "to_style": style_name, "text": _excerpt(text)})
+
+    is_heading = style_name.startswith("Heading")
+    empty = not text.strip()
+    if is_heading and empty:
+        counts["demoted"] += 1
+        changes.append({"paragraph": index, "action": "demote", "from_style": style_name,
+                        "to_style": "Normal", "text": ""})
+        style_name = "Normal"
+        is_heading = False
+
+    if text == "Ellipsis" or empty:
+        return
+
+    if is_heading:
+        number_str = _next_heading_number(int(style_name.split(' ')[1]) - 1, ctx)
+        counts["headings"] += 1
+        match = HEADING_NUMBER_PATTERN.match(text)
+        old_prefix = text[:match.end()].strip() if match else ""
+        body = text[match.end():].strip() if match else text.strip()
+        new_text = (number_str or "") + body
+        if new_text != text:
+            counts["renumbered"] += 1
+            counts["numbers_stripped"] += bool(old_prefix)
+            counts["numbers_added"] += bool(number_str)
+            changes.append({"paragraph": index, "action": "renumber", "from_style": style_name,
+                            "old_prefix": old_prefix, "new_number": number_str or "", "text": _excerpt(body)})
+        if new_text == "Ellipsis" or not new_text.strip():
+            return
+
+    if ctx.profile.skip_unknown_styles and style_name not in KNOWN_STYLES:
+        ctx.skipped.add(style_name)
+        counts["skipped_paragraphs"] += 1
+        return
+    if is_heading and int(style_name.split(' ')[1]) not in ctx.heading_rules:
+        return
+    counts["formatted_paragraphs"] += 1
+    counts["runs"] += len(p.r_lst)
+
+
+def _analyze_table(tbl, ctx):
+    """按 _process_table 的规则统计表格中将设置格式和跳过的段落"""
+    counts = ctx.counts
+    normal_only = ctx.profile.table_normal_only
+    for p in iter_cell_paragraphs(tbl, counts):
+        if normal_only:
+            style_name = ctx.style_name_of(p)
+            if style_name != "Normal":
+                ctx.skipped.add(f"表格内：{style_name}")
+                counts["skipped_table_paragraphs"] += 1
+                continue
+        counts["table_paragraphs"] += 1
+        counts["table_runs"] += len(p.r_lst)
+
+
+def analyze_document(file_bytes, profile=None):
+    """分析单个文档将被如何修改，返回报告字典（见模块说明）
+
+    profile 为格式规则名或规则文件路径（见 rules.py），影响跳过的样式和设置格式的段落。
+    """
+    body, styles, styles_element = _load_parts(file_bytes)
+    ctx = _DocumentContext(styles, OutlineLevelResolver(styles_element), profile=load_profile(profile))
+    changes = []
+    index = 0
+    for child in body.iterchildren(W_P, W_TBL):
+        if child.tag == W_P:
+            index += 1
+            _analyze_paragraph(child, index, ctx, changes)
+        else:
+            _analyze_table(child, ctx)
+    return {
+        "profile": ctx.profile.name,
+        "counts": dict(sorted(ctx.counts.items())),
+        "numbering_removed": _numbered_styles(styles),
+        "skipped_styles": sorted(ctx.skipped),
+        "changes": changes,
+    }
+
+
+def analyze_single_document(file_bytes, profile=None):
+    """供 batch.process_batch 在工作进程中调用：返回 UTF-8 编码的 JSON 报告"""
+    return json.dumps(analyze_document(file_bytes, profile), ensure_ascii=False).encode("utf-8")
+
+
+def aggregate_reports(files):
+    """汇总一批文档的报告：计数求和，样式按出现该样式的文档数统计"""
+    totals = Counter()
+    skipped = Counter()
+    numbering = Counter()
+    changed = 0
+    ok = [entry for entry in files if entry["status"] == "ok"]
+    for entry in ok:
+        totals.update(entry["counts"])
+        skipped.update(entry["skipped_styles"])
+        numbering.update(entry["numbering_removed"])
+        if entry["changes"] or entry["numbering_removed"]:
+            changed += 1
+    return {
+        "documents": len(files),
+        "succeeded": len(ok),
+        "failed": len(files) - len(ok),
+        "documents_changed": changed,
+        "counts": dict(sorted(totals.items())),
+        "numbering_removed": dict(numbering.most_common()),
+        "skipped_styles": dict(skipped.most_common()),
+    }
+
+
+def analyze_batch(items, max_workers=None, profile=None, limits=None):
+    """并行分析一批文档（items 和 limits 同 batch.process_batch），返回 {"files": [...], "aggregate": {...}}
+
+    files 按输入顺序排列，每项为 analyze_document 的报告加上 input、status、error 和 seconds。
+    """
+    items = list(items)
+    order = {key: i for i, (key, _) in enumerate(items)}
+    files = []
+    for result in process_batch(items, func=analyze_single_document, max_workers=max_workers,
+                                limits=limits, profile=profile):
+        entry = {
+            "input": result.key,
+            "status": "ok" if result.error is None else "error",
+            "error": result.error,
+            "seconds": round(result.seconds, 4),
+        }
+        if result.error is None:
+            entry.update(json.loads(result.data))
+        files.append(entry)
+    files.sort(key=lambda entry: order[entry["input"]])
+    return {"files": files, "aggregate": aggregate_reports(files)}
+
+
+def report_rows(report):
+    """把 analyze_batch 的结果展开为 CSV 行（字典，键为 CSV_FIELDS）"""
+    for entry in report["files"]:
+        base = dict.fromkeys(CSV_FIELDS, "")
+        base["input"] = entry["input"]
+        if entry["status"] != "ok":
+            yield dict(base, action="error", text=entry["error"])
+            continue
+        for name in entry["numbering_removed"]:
+            yield dict(base, action="numbering_removed", from_style=name)
+        for name in entry["skipped_styles"]:
+            yield dict(base, action="skipped", from_style=name)
+        for change in entry["changes"]:
+            yield dict(base, **change)
+
+
+def write_report(report, path=None, stream=None):
+    """写出分析报告：path 以 .csv 结尾时写 CSV（逐项修改），否则写 JSON；没有 path 时写到 stream"""
+    as_csv = path is not None and os.path.splitext(path)[1].lower() == ".csv"
+    f = open(path, "w", encoding="utf-8-sig" if as_csv else "utf-8", newline="") if path else stream
+    try:
+        if as_csv:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(report_rows(report))
+        else:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    finally:
+        if path:
+            f.close()
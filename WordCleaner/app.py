@@ -1,11 +1,18 @@
-import re, os
-from io import BytesIO
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.oxml.ns import qn
-from docx.shared import Cm
+import contextlib
+import html
+import os
+import uuid
+import zipfile
+from urllib.parse import quote
+
 import streamlit as st
 
+from governor import DEFAULT_LIMITS, MB, ResourceLimitExceeded, check_members
+from jobs import DONE, ERROR, QUEUED, RUNNING, JobManager, QueueFull, ResultStore
+from result_cache import ResultCache
+from rules import DEFAULT_PROFILE, available_profiles
+from zip_batch import is_document_member
+
 # 页面配置
 st.set_page_config(
     page_title="Word一键排版工具",
@@ -37,73 +44,122 @@ st.markdown("""
 # 文件上传区域
 st.markdown("### 📤 上传Word文档")
 uploaded_files = st.file_uploader(
-    "选择Word文档 (.docx) - 支持多选",
-    type=["docx"],
+    "选择Word文档 (.docx) 或包含多个文档的 .zip - 支持多选",
+    type=["docx", "zip"],
     accept_multiple_files=True,
-    help="支持批量上传多个文档",
+    help="支持批量上传多个文档，也可以上传包含多个 .docx 的 ZIP",
     label_visibility="collapsed"
 )
 
-# ========== 预设格式参数 ==========
-# 这些是预设的格式规则，用户无需设置
-PRESET_STYLES = {
-    # 正文样式
-    "body": {
-        "cz_font_name": "宋体",
-        "font_name": "Times New Roman",
-        "font_size": 10.5,
-        "space_before": 6.0,
-        "space_after": 6.0,
-        "line_spacing": 1.0,
-        "first_line_indent": 0.75,  # cm
-    },
-    
-    # 表格样式
-    "table": {
-        "cz_font_name": "宋体",
-        "font_name": "Times New Roman",
-        "font_size": 10.5,
-        "space_before": 4.0,
-        "space_after": 4.0,
-        "line_spacing": 1.0,
-        "width": 6.0,  # 英寸
-    },
-    
-    # 标题样式 (1-3级)
-    1: {
-        'cz_font_name': '黑体',
-        'font_name': 'Arial',
-        'font_size': 14,
-        'bold': False,
-        'space_before': 12,
-        'space_after': 12,
-        'line_spacing': 1.5,
-        'first_line_indent': 0,
-    },
-    2: {
-        'cz_font_name': '黑体',
-        'font_name': 'Arial',
-        'font_size': 12,
-        'bold': False,
-        'space_before': 12,
-        'space_after': 12,
-        'line_spacing': 1.5,
-        'first_line_indent': 0.75,
-    },
-    3: {
-        'cz_font_name': '宋体',
-        'font_name': 'Times New Roman',
-        'font_size': 10.5,
-        'bold': True,
-        'space_before': 8,
-        'space_after': 8,
-        'line_spacing': 1.0,
-        'first_line_indent': 1.5,
-    },
-}
+@st.cache_resource
+def get_result_cache():
+    """所有会话共享的结果缓存，重复上传的文档直接返回已保存的结果"""
+    return ResultCache()
+
+# 静态文件目录（.streamlit/config.toml 中启用 enableStaticServing），处理结果存放在其下，
+# 下载时由 Streamlit 的静态文件服务从磁盘分块发送，不经过页面进程的内存
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+RESULTS_DIR = os.path.join(STATIC_DIR, "results")
+# Streamlit 的静态文件服务不发送超过 200 MB 的文件
+STATIC_MAX_BYTES = 200 * MB
+
+@st.cache_resource
+def get_job_manager():
+    """所有会话共享的任务队列和进程池，处理结果在 ResultStore 中按过期时间淘汰
+
+    每个文档在资源上限内处理，异常文档超时或内存超限时只终止它自己的处理进程。
+    Streamlit 不通知会话结束，没有清空的结果靠过期时间删除。
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    return JobManager(store=ResultStore(directory=RESULTS_DIR), cache=get_result_cache(), limits=DEFAULT_LIMITS)
+
+def download_result(manager, key, file_name, label, mime, primary=False):
+    """结果的下载入口，结果不存在或已过期时返回 False
+
+    启用静态文件服务时显示指向磁盘上结果文件的链接；未启用或文件超过 STATIC_MAX_BYTES 时
+    退回 st.download_button（结果会读入 Streamlit 的内存媒体存储）。
+    """
+    path = manager.result_path(key)
+    try:
+        size = os.path.getsize(path) if path is not None else None
+    except OSError:
+        # 刚好过期删除
+        size = None
+    if size is None:
+        return False
+    if st.get_option("server.enableStaticServing") and size <= STATIC_MAX_BYTES:
+        url = "app/static/" + quote(os.path.relpath(path, STATIC_DIR).replace(os.sep, "/"))
+        text = f"<b>{html.escape(label)}</b>" if primary else html.escape(label)
+        st.markdown(f'<a href="{url}" download="{html.escape(file_name)}">{text}</a>', unsafe_allow_html=True)
+        return True
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return False
+    with f:
+        st.download_button(
+            label=label,
+            data=f,
+            file_name=file_name,
+            mime=mime,
+            key=f"download_{key}",
+            type="primary" if primary else "secondary",
+            use_container_width=True
+        )
+    return True
+
+def batch_zip_key(manager, jobs):
+    """多个文档时开始（或沿用）打包，返回 ZIP 的结果键；只有一个文档时返回None"""
+    if len(jobs) < 2:
+        return None
+    return manager.pack_results(session_id, [job.id for job in jobs])
+
+def needs_polling(manager, jobs):
+    """还有未结束的任务或 ZIP 仍在写入时需要定时刷新"""
+    if any(job.state not in (DONE, ERROR) for job in jobs):
+        return True
+    zip_key = batch_zip_key(manager, jobs)
+    return zip_key is not None and manager.packing(zip_key)
+
+def _open_uploaded(uploaded_file):
+    """上传的文件本身就是可读的文件对象；从头读取，用完不关闭（页面重新运行时还要用）"""
+    uploaded_file.seek(0)
+    return contextlib.nullcontext(uploaded_file)
 
-# 使用中文数字编号方案
-NUMBERING_SCHEME = "方案一：中文数字"
+def _raising(error):
+    """打开时抛出 error 的打开函数：错误在提交时抛出，由调用方显示"""
+    def open_document():
+        raise error
+    return open_document
+
+def iter_uploaded_documents(files):
+    """把上传的文件展开为 (名称, 打开函数)：.docx 原样，.zip 展开为其中的每个 .docx
+
+    打开函数返回可读文件对象的上下文管理器，提交时由 JobManager 分块暂存，
+    不复制出整份字节；ZIP 中的文档在提交时才逐个解压。ZIP 中的文档先按 DEFAULT_LIMITS
+    检查解压后的大小和压缩比（见 governor.check_members），超限时整个 ZIP 不解压。
+    """
+    for uploaded_file in files:
+        if not uploaded_file.name.lower().endswith(".zip"):
+            yield uploaded_file.name, lambda uploaded_file=uploaded_file: _open_uploaded(uploaded_file)
+            continue
+        try:
+            archive = zipfile.ZipFile(uploaded_file)
+        except zipfile.BadZipFile as e:
+            yield uploaded_file.name, _raising(e)
+            continue
+        with archive:
+            members = [info for info in archive.infolist() if is_document_member(info)]
+            try:
+                check_members(members, DEFAULT_LIMITS)
+            except ResourceLimitExceeded as e:
+                yield uploaded_file.name, _raising(e)
+                continue
+            for info in members:
+                yield f"{uploaded_file.name}/{info.filename}", lambda info=info: archive.open(info)
+
+# 每个浏览器会话一个ID，任务按会话区分
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
 
 # 显示已上传文件
 if uploaded_files:
@@ -123,252 +179,128 @@ if uploaded_files:
     # 处理按钮
     st.markdown("---")
     
-    # 处理按钮
-    if st.button("🚀 一键智能排版", type="primary", use_container_width=True):
-        # 创建进度条
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        # 处理结果区域
-        results_container = st.container()
-        
-        # 处理每个文件
-        with results_container:
-            for idx, uploaded_file in enumerate(uploaded_files):
-                # 更新进度
-                progress = (idx + 1) / len(uploaded_files)
-                progress_bar.progress(progress)
-                status_text.text(f"正在处理: **{uploaded_file.name}** ({idx + 1}/{len(uploaded_files)})")
-                
-                try:
-                    # 处理文档
-                    processed_buffer = process_single_document(
-                        uploaded_file.read()
-                    )
-                    
-                    # 显示处理结果
-                    col_result1, col_result2 = st.columns([8, 2])
-                    with col_result1:
-                        st.write(f"✅ **{uploaded_file.name}** - 排版完成")
-                    with col_result2:
-                        st.download_button(
-                            label="📥 下载文件",
-                            data=processed_buffer,
-                            file_name=f"排版_{uploaded_file.name}",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            key=f"download_{idx}",
-                            use_container_width=True
-                        )
-                    
-                except Exception as e:
-                    st.error(f"❌ 处理 {uploaded_file.name} 时出错: `{str(e)}`")
-            
-            # 完成提示
-            progress_bar.empty()
-            status_text.success("✅ 所有文档处理完成！")
-            st.balloons()
-            st.info("💡 所有文档已应用专业排版格式，标题已自动编号！")
-
-else:
-    st.info("📤 请上传需要排版的Word文档")
-
-# ========== 工具函数定义 ==========
-KNOWN_STYLES = {
-    "Normal",
-    "List Paragraph",
-    "Heading 1", "Heading 2", "Heading 3", "Heading 4",
-    "Heading 5", "Heading 6", "Heading 7", "Heading 8", "Heading 9"
-}
-
-def get_outline_level_from_xml(p):
-    """从段落的XML中提取大纲级别，并加1"""
-    xml = p._p.xml
-    m = re.search(r'<w:outlineLvl w:val="(\d)"/>', xml)
-    level = int(m.group(1)) if m else None
-    if level is not None:
-        level += 1
-    return level
-
-def restructure_outline(doc):
-    """重构文档大纲"""
-    for p in doc.paragraphs:
-        zero_indent(p)
-        lvl = get_outline_level_from_xml(p)
-        if lvl and p.style.name == "Normal":
-            heading_style = f"Heading {lvl}"
-            if heading_style in doc.styles:
-                p.style = doc.styles[heading_style]
+    # 样式模式：格式写入样式定义，不逐个 run 设置
+    style_mode = st.checkbox(
+        "样式模式（把格式写入样式定义，处理更快、文件更小）",
+        value=False
+    )
     
-    # 降级空标题
-    for p in doc.paragraphs:
-        if p.style.name.startswith("Heading") and not p.text.strip():
-            p.style = doc.styles["Normal"]
-
-def zero_indent(p):
-    """清除段落缩进"""
-    pf = p.paragraph_format
-    pf.left_indent = Cm(0)
-    pf.first_line_indent = Cm(0)
-    pf.right_indent = Cm(0)
-    pf.tab_stops.clear_all()
-    if p.text:
-        p.text = p.text.lstrip()
-
-def kill_all_numbering(doc):
-    """清除所有编号"""
-    for st_name in ['List Paragraph', 'Heading 1', 'Heading 2', 'Heading 3',
-                    'Heading 4', 'Heading 5', 'Heading 6', 'Heading 7',
-                    'Heading 8', 'Heading 9']:
-        try:
-            style = doc.styles[st_name]
-        except KeyError:
-            continue
-        style_el = style._element
-        for num_id in style_el.xpath('.//w:numId'):
-            num_id.getparent().remove(num_id)
-
-def set_font(run, cz_font_name, font_name):
-    """设置字体"""
-    rPr = run.element.get_or_add_rPr()
-    rFonts = rPr.get_or_add_rFonts()
-    rFonts.set(qn('w:eastAsia'), cz_font_name)
-    rFonts.set(qn('w:ascii'), font_name)
-
-def num_to_cn(num):
-    """数字转中文大写数字"""
-    cn_nums = ["零", "一", "二", "三", "四", "五", "六", "七", "八", "九", "十"]
+    # 合并 run：统一格式后把格式相同的相邻 run 合并，粘贴来的文档可明显减小
+    coalesce = st.checkbox(
+        "合并格式相同的文字片段（run），减小文件",
+        value=False
+    )
     
-    if num <= 10:
-        return cn_nums[num]
-    elif num < 20:
-        return "十" + (cn_nums[num - 10] if num != 10 else "")
-    elif num < 100:
-        tens = num // 10
-        ones = num % 10
-        if ones == 0:
-            return cn_nums[tens] + "十"
-        else:
-            return cn_nums[tens] + "十" + cn_nums[ones]
-    else:
-        return str(num)
-
-def add_heading_numbers_custom(doc):
-    """添加自定义标题序号（使用预设的中文数字方案）"""
-    number_pattern = re.compile(
-        r'^\s*'
-        r'[（(]?'
-        r'[\d一二三四五六七八九十零①②③④⑤⑥⑦⑧⑨⑩]{1,4}'
-        r'[\.、）)\s]'
-        r'(?:[\d一二三四五六七八九十零①②③④⑤⑥⑦⑧⑨⑩]{1,4}'
-        r'[\.、）)\s]'
-        r')*',
-        re.UNICODE
+    # 格式规则：profiles/ 目录下的内置规则
+    profiles = available_profiles()
+    profile = st.selectbox(
+        "格式规则",
+        profiles,
+        index=profiles.index(DEFAULT_PROFILE),
     )
     
-    heading_numbers = [0] * 9
+    # 诊断信息：各阶段耗时和段落、表格等计数，用于排查处理缓慢的文档
+    diagnostics = st.checkbox("显示诊断信息", value=False)
     
-    for paragraph in doc.paragraphs:
-        if paragraph.style.name.startswith('Heading'):
-            if paragraph.text == "Ellipsis" or not paragraph.text.strip():
-                continue
-            
-            # 清除原有编号
-            paragraph.text = number_pattern.sub('', paragraph.text).strip()
-            level = int(paragraph.style.name.split(' ')[1]) - 1
-            
-            # 更新序号
-            heading_numbers[level] += 1
-            for i in range(level + 1, len(heading_numbers)):
-                heading_numbers[i] = 0
-            
-            # 添加序号（只处理1-3级标题）
-            if heading_numbers[level] > 0 and level < 3:
-                if level == 0:
-                    # 一级标题：一、
-                    number_str = num_to_cn(heading_numbers[0]) + "、"
-                elif level == 1:
-                    # 二级标题：（一）
-                    number_str = "（" + num_to_cn(heading_numbers[1]) + "）"
-                elif level == 2:
-                    # 三级标题：1.
-                    number_str = str(heading_numbers[2]) + "."
-                else:
-                    # 4级及以上标题：数字序号
-                    number_str = str(heading_numbers[level]) + "."
-                
-                paragraph.text = number_str + paragraph.text
+    # 处理按钮：只提交任务，文档在后台进程池中处理，页面保持可响应
+    if st.button("🚀 一键智能排版", type="primary", use_container_width=True):
+        manager = get_job_manager()
+        queued = 0
+        for name, open_document in iter_uploaded_documents(uploaded_files):
+            try:
+                with open_document() as f:
+                    manager.submit(session_id, name, f, trace=diagnostics, style_mode=style_mode,
+                                   profile=profile, coalesce=coalesce)
+                queued += 1
+            except QueueFull as e:
+                st.warning(f"⏳ {name} 未能加入队列：{e}")
+            except zipfile.BadZipFile as e:
+                st.error(f"❌ {name} 不是有效的 ZIP 文件：{e}")
+            except ResourceLimitExceeded as e:
+                st.error(f"❌ {name} 超过资源上限，未处理：{e}")
+        if queued:
+            st.toast(f"已提交 {queued} 个文档")
 
-def process_single_document(file_bytes):
-    """处理单个文档"""
-    doc = Document(BytesIO(file_bytes))
-    
-    # 重构大纲
-    restructure_outline(doc)
+else:
+    st.info("📤 请上传需要排版的Word文档")
+
+# ========== 任务列表：定时刷新，结果完成一个显示一个 ==========
+def show_jobs(polling):
+    manager = get_job_manager()
+    jobs = manager.jobs(session_id)
+    if not jobs:
+        return
     
-    # 清除编号
-    kill_all_numbering(doc)
+    st.markdown("### 📄 处理结果")
+    finished = sum(1 for job in jobs if job.state in (DONE, ERROR))
+    st.progress(finished / len(jobs), text=f"已完成 {finished}/{len(jobs)}")
     
-    # 添加标题序号
-    add_heading_numbers_custom(doc)
+    for job in jobs:
+        col_result1, col_result2 = st.columns([8, 2])
+        with col_result1:
+            if job.state == QUEUED:
+                st.write(f"⏳ **{job.name}** - 排队中")
+            elif job.state == RUNNING:
+                st.write(f"⚙️ **{job.name}** - 处理中")
+            elif job.state == ERROR:
+                st.error(f"❌ 处理 {job.name} 时出错: `{job.error}`")
+            else:
+                st.write(f"✅ **{job.name}** - 排版完成" + ("（缓存）" if job.cached else ""))
+        with col_result2:
+            if job.state == DONE and not download_result(
+                    manager, job.id, f"排版_{os.path.basename(job.name)}", "📥 下载文件",
+                    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"):
+                st.caption("结果已过期，请重新处理")
     
-    # 应用预设格式
-    skipped = set()
+    # 诊断面板
+    traced = [job for job in jobs if job.trace]
+    if traced:
+        with st.expander("🔍 诊断信息", expanded=False):
+            for job in traced:
+                st.markdown(f"**{job.name}** — {job.seconds:.2f} 秒")
+                st.dataframe(job.trace["spans"], use_container_width=True)
+                st.json({"counters": job.trace["counters"], "notes": job.trace["notes"]})
     
-    for p in doc.paragraphs:
-        style_name = p.style.name
-        
-        if p.text == "Ellipsis" or not p.text.strip():
-            continue
-        
-        if style_name not in KNOWN_STYLES:
-            skipped.add(style_name)
-            continue
-        
-        if style_name.startswith("Heading"):
-            level = int(style_name.split(' ')[1])
-            if level in PRESET_STYLES:
-                rule = PRESET_STYLES[level]
-                p.style.paragraph_format.space_before = Pt(rule['space_before'])
-                p.style.paragraph_format.space_after = Pt(rule['space_after'])
-                p.style.paragraph_format.line_spacing = rule['line_spacing']
-                p.style.paragraph_format.first_line_indent = Cm(rule['first_line_indent'])
-                for run in p.runs:
-                    set_font(run, rule['cz_font_name'], rule['font_name'])
-                    run.font.size = Pt(rule['font_size'])
-                    run.font.bold = rule['bold']
-        else:
-            # 正文格式
-            body_rule = PRESET_STYLES["body"]
-            p.paragraph_format.space_before = Pt(body_rule['space_before'])
-            p.paragraph_format.space_after = Pt(body_rule['space_after'])
-            p.paragraph_format.line_spacing = body_rule['line_spacing']
-            p.paragraph_format.first_line_indent = Cm(body_rule['first_line_indent'])
-            for run in p.runs:
-                set_font(run, body_rule['cz_font_name'], body_rule['font_name'])
-                run.font.size = Pt(body_rule['font_size'])
+    # 打包下载：提交后立即开始，每完成一个文档就写入 ZIP
+    zip_key = batch_zip_key(manager, jobs)
+    if zip_key is not None:
+        if manager.packing(zip_key):
+            st.caption(f"📦 正在打包：已完成的文档随即写入 ZIP（{finished}/{len(jobs)}）")
+        elif not download_result(manager, zip_key, "排版结果.zip",
+                                 "📦 打包下载全部（ZIP，含处理清单 manifest.json）", "application/zip", primary=True):
+            st.caption("📦 打包结果已过期或打包失败，请重新处理")
     
-    # 表格格式
-    for tbl in doc.tables:
-        tbl.width = Inches(PRESET_STYLES["table"]["width"])
-        for row in tbl.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    if p.style.name != "Normal":
-                        skipped.add(f"表格内：{p.style.name}")
-                        continue
-                    for run in p.runs:
-                        set_font(run, PRESET_STYLES["table"]["cz_font_name"], 
-                                PRESET_STYLES["table"]["font_name"])
-                        run.font.size = Pt(PRESET_STYLES["table"]["font_size"])
-                    p.paragraph_format.space_before = Pt(PRESET_STYLES["table"]["space_before"])
-                    p.paragraph_format.space_after = Pt(PRESET_STYLES["table"]["space_after"])
-                    p.paragraph_format.line_spacing = PRESET_STYLES["table"]["line_spacing"]
+    if finished == len(jobs):
+        st.info("💡 所有文档已应用专业排版格式，标题已自动编号！")
+        cache_stats = get_result_cache().stats()
+        st.caption(
+            f"结果缓存：命中 {cache_stats['memory_hits'] + cache_stats['disk_hits']} 次"
+            f"（内存 {cache_stats['memory_hits']}，磁盘 {cache_stats['disk_hits']}），"
+            f"未命中 {cache_stats['misses']} 次"
+        )
+        # 本批内存：单个文档处理进程的最高常驻内存，以及页面进程当前的常驻内存
+        peaks = [job.peak_rss for job in jobs if job.peak_rss]
+        queue_stats = manager.stats()
+        memory = [f"单个文档处理进程最高 {max(peaks) / MB:.0f} MB"] if peaks else []
+        if queue_stats["rss_bytes"]:
+            memory.append(f"页面进程 {queue_stats['rss_bytes'] / MB:.0f} MB")
+        if memory:
+            st.caption(f"本批峰值内存：{'，'.join(memory)}；结果暂存在磁盘（{queue_stats['stored_bytes'] / MB:.1f} MB）")
+        if st.button("🧹 清空结果列表"):
+            manager.forget(session_id)
+            st.rerun()
+    else:
+        queue_stats = manager.stats()
+        st.caption(f"队列：排队 {queue_stats['queued']}，处理中 {queue_stats['running']}（共 {queue_stats['workers']} 个工作进程）")
     
-    # 保存到buffer
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+    # 全部结束（ZIP 也已写完）后重新运行整个页面，任务列表不再定时刷新
+    if polling and not needs_polling(manager, jobs):
+        st.rerun()
+
+# 只在有未结束的任务时定时刷新任务列表
+manager = get_job_manager()
+polling = needs_polling(manager, manager.jobs(session_id))
+st.fragment(run_every=1.5 if polling else None)(show_jobs)(polling)
 
 # 页脚
 st.markdown("---")
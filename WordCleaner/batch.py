@@ -0,0 +1,155 @@
+"""多进程批量处理
+
+python-docx 的处理是纯 Python 代码，受 GIL 限制只能用满一个核。这里用进程池
+并行处理多个文档，按完成顺序逐个返回结果；单个文件出错只影响它自己。
+Streamlit 页面和 WordCleaner.main() 共用这一执行器。
+给定资源上限（governor.Limits）时，每个文档在工作进程派生的子进程中处理，
+超时或内存超限只终止该文档的子进程，进程池和其余文档不受影响。
+
+命令行每次运行都要导入本模块，这里不在模块加载时导入 python-docx 和进程池：
+默认处理函数按名称引用，全部命中缓存时不会导入；只有一个文件时不创建进程池。
+"""
+import importlib
+import os
+import time
+from collections import namedtuple
+
+from instrumentation import TraceRecorder, get_recorder, use_recorder
+from result_cache import cache_key, rules_fingerprint
+
+# key: 调用方给定的标识（如文件名）；data: 处理后的文档字节，出错时为None；
+# error: 错误信息，成功时为None；seconds: 处理耗时；cached: 是否来自结果缓存；
+# trace: 开启诊断时的计时和计数记录（TraceRecorder.to_dict()），否则为None；
+# error_code: 超过资源上限时的原因（governor.ResourceLimitExceeded.code），否则为None；
+# peak_rss: 在资源上限内处理时处理进程的峰值常驻内存（字节），否则为None
+BatchResult = namedtuple(
+    "BatchResult", ["key", "data", "error", "seconds", "cached", "trace", "error_code", "peak_rss"],
+    defaults=(False, None, None, None)
+)
+
+
+# 默认处理函数（"模块.函数名"），需要处理文档时才导入
+DEFAULT_FUNC = "formatter.process_single_document"
+
+
+def resolve_func(func):
+    """处理函数或 "模块.函数名" 字符串 -> 处理函数"""
+    if isinstance(func, str):
+        module, _, name = func.rpartition(".")
+        return getattr(importlib.import_module(module), name)
+    return func
+
+
+def default_workers(count):
+    """进程数：不超过CPU核数，也不超过文件数"""
+    return max(1, min(os.cpu_count() or 1, count))
+
+
+def run_one(func, key, source, options, trace=False, limits=None):
+    """在工作进程中处理单个文档；source 为文件路径时在工作进程中读取
+
+    trace=True 时在本进程中记录计时和计数，出错时也返回已记录的部分。
+    limits 为 governor.Limits 时在资源上限内处理（见 governor.run_governed）。
+    """
+    recorder = TraceRecorder() if trace else get_recorder()
+    start = time.perf_counter()
+    error_code = peak_rss = None
+    with use_recorder(recorder):
+        try:
+            if isinstance(source, (str, os.PathLike)):
+                with open(source, "rb") as f:
+                    source = f.read()
+            if limits is None:
+                result = func(source, **options)
+                data = result.getvalue() if hasattr(result, "getvalue") else bytes(result)
+            else:
+                from governor import run_governed
+                data, peak_rss = run_governed(func, source, options, limits)
+            error = None
+        except Exception as e:
+            data = None
+            error = f"{type(e).__name__}: {e}"
+            error_code = getattr(e, "code", None) if limits is not None else None
+    return BatchResult(key, data, error, time.perf_counter() - start,
+                       trace=recorder.to_dict() if trace else None, error_code=error_code, peak_rss=peak_rss)
+
+
+def _lookup_cache(items, cache, func, options):
+    """查缓存：命中的直接产出，返回未命中的 items 和 {key: 缓存键}"""
+    fingerprint = rules_fingerprint(func, **options)
+    pending = []
+    cache_keys = {}
+    hits = []
+    for key, source in items:
+        file_bytes = source
+        if isinstance(source, (str, os.PathLike)):
+            try:
+                with open(source, "rb") as f:
+                    file_bytes = f.read()
+            except OSError:
+                # 读取失败交给工作进程报告错误
+                pending.append((key, source))
+                continue
+        cache_keys[key] = cache_key(file_bytes, fingerprint)
+        data = cache.get(cache_keys[key])
+        if data is not None:
+            hits.append(BatchResult(key, data, None, 0.0, True))
+        else:
+            # 未命中的文件仍传路径，由工作进程读取，主进程不同时持有全部文档
+            pending.append((key, source))
+    return hits, pending, cache_keys
+
+
+def process_batch(items, func=DEFAULT_FUNC, max_workers=None, cache=None, trace=False, limits=None, **options):
+    """并行处理一批文档，按完成顺序逐个产出 BatchResult
+
+    :param items: (key, source) 序列，source 为文档字节或文件路径
+    :param func: 处理函数，接收文档字节和 options，返回 BytesIO 或 bytes；
+        必须是模块顶层函数，以便传给工作进程；也可以是 "模块.函数名" 字符串
+    :param max_workers: 进程数，默认按CPU核数
+    :param cache: ResultCache，命中的文件不再处理，处理成功的结果写入缓存
+    :param trace: 为 True 时每个结果附带计时和计数记录（见 instrumentation.py），
+        缓存命中的结果没有记录
+    :param limits: governor.Limits，每个文档在资源上限内处理，超限的文档记为失败
+        （BatchResult.error_code 为原因）；None 表示不限制
+    """
+    items = list(items)
+    if cache is None:
+        yield from _process_items(items, func, max_workers, options, trace, limits)
+        return
+
+    hits, pending, cache_keys = _lookup_cache(items, cache, func, options)
+    yield from hits
+    for result in _process_items(pending, func, max_workers, options, trace, limits):
+        if result.error is None and result.key in cache_keys:
+            cache.put(cache_keys[result.key], result.data)
+        yield result
+
+
+def _process_items(items, func, max_workers, options, trace=False, limits=None):
+    """用进程池处理 items，按完成顺序产出结果"""
+    if not items:
+        return
+    func = resolve_func(func)
+    workers = max_workers or default_workers(len(items))
+
+    # 只有一个进程可用时直接在当前进程处理，省去进程启动开销
+    if workers == 1 or len(items) == 1:
+        for key, source in items:
+            yield run_one(func, key, source, options, trace, limits)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_one, func, key, source, options, trace, limits): key
+            for key, source in items
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool as e:
+                # 工作进程异常退出（如内存耗尽），该文件记为失败
+                yield BatchResult(futures[future], None, f"工作进程异常退出: {e}", 0.0)
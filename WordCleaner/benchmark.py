@@ -0,0 +1,909 @@
+"""性能基准
+
+用法：
+    python benchmark.py suite --paragraphs 5000 --heading-depth 9 --tables 10 --images 5
+    python benchmark.py suite --baseline baseline.json      # 超过基线阈值时退出码为1
+    python benchmark.py suite --write-baseline baseline.json
+    python benchmark.py generate sample.docx --paragraphs 20000
+    python benchmark.py renumber --headings 5000 --runs 4
+    python benchmark.py prefixes --headings 100000
+    python benchmark.py styles --paragraphs 100000
+    python benchmark.py paragraphs --paragraphs 20000
+    python benchmark.py coalesce --paragraphs 5000 --runs 20
+    python benchmark.py uploads --documents 20 --images 10 --image-kb 1024
+    python benchmark.py service --requests 200 --concurrency 8 --paragraphs 300
+    python benchmark.py service --url http://127.0.0.1:8765 --requests 1000
+    python benchmark.py startup --paragraphs 300 --budget 1.0  # 超过冷启动预算时退出码为1
+    python benchmark.py save --images 40 --image-kb 2048
+    python benchmark.py tables --rows 5000 --cols 6
+
+suite 用合成文档分阶段计时 "dom" 流程（载入、段落索引、restructure_outline、kill_all_numbering、
+add_heading_numbers_custom、格式设置、保存），并计时 fast / stream 引擎、
+只读分析（analysis.py）和 WordCleaner.main()，结果以 JSON 输出。
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from io import BytesIO
+from lxml import etree
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Inches, Pt
+from docx.text.paragraph import Paragraph
+
+import WordCleaner
+from analysis import analyze_document
+from formatter import (
+    add_heading_numbers_custom,
+    apply_preset_format,
+    format_heading_number,
+    StyleResolver,
+    kill_all_numbering,
+    process_single_document,
+    restructure_outline,
+)
+from heading_numbers import HEADING_NUMBER_PATTERN, prefix_lengths
+from paragraph_index import ELLIPSIS, EMPTY, HEADING, paragraph_index
+from package_io import cleaner_parts, save_document
+from rules import load_profile
+from run_text import renumber_heading
+from table_format import iter_cell_paragraphs
+
+
+def make_heading_document(n_headings, runs_per_heading=4):
+    """生成含 n_headings 个标题的文档，每个标题带旧序号并拆成多个 run"""
+    doc = Document()
+    for i in range(n_headings):
+        level = i % 3 + 1
+        p = doc.add_paragraph(style=f"Heading {level}")
+        text = f"{i % 20 + 1}.{i % 7 + 1} 第{i}节 标题文字"
+        step = max(1, len(text) // runs_per_heading)
+        for start in range(0, len(text), step):
+            run = p.add_run(text[start:start + step])
+            run.italic = start == 0
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _renumber_by_text(doc):
+    """原有做法：两次给 paragraph.text 赋值，重建全部 run"""
+    heading_numbers = [0] * 9
+    for paragraph in doc.paragraphs:
+        paragraph.text = HEADING_NUMBER_PATTERN.sub('', paragraph.text).strip()
+        level = int(paragraph.style.name.split(' ')[1]) - 1
+        heading_numbers[level] += 1
+        for i in range(level + 1, len(heading_numbers)):
+            heading_numbers[i] = 0
+        number_str = format_heading_number(level, heading_numbers)
+        if number_str is not None:
+            paragraph.text = number_str + paragraph.text
+
+
+def _renumber_in_place(doc):
+    """保留 run 的做法：只修改开头的文字节点"""
+    heading_numbers = [0] * 9
+    for paragraph in doc.paragraphs:
+        level = int(paragraph.style.name.split(' ')[1]) - 1
+        heading_numbers[level] += 1
+        for i in range(level + 1, len(heading_numbers)):
+            heading_numbers[i] = 0
+        number_str = format_heading_number(level, heading_numbers)
+        renumber_heading(paragraph._p, paragraph.text, number_str, HEADING_NUMBER_PATTERN)
+
+
+def bench_renumbering(n_headings=5000, runs_per_heading=4, repeat=3):
+    """比较两种重新编号方式的耗时（取最快一次），返回结果字典"""
+    file_bytes = make_heading_document(n_headings, runs_per_heading)
+    result = {"headings": n_headings, "runs_per_heading": runs_per_heading}
+    for name, func in (("text_assignment", _renumber_by_text), ("in_place", _renumber_in_place)):
+        best = None
+        for _ in range(repeat):
+            doc = Document(BytesIO(file_bytes))
+            start = time.perf_counter()
+            func(doc)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        result[name] = round(best, 4)
+    return result
+
+
+def make_heading_texts(n_headings, seed=0):
+    """生成 n_headings 个带各种原有序号（中文数字、带圈数字、多级序号、全角括号）的标题文本"""
+    rnd = random.Random(seed)
+    prefixes = ["", "一、", "（二）", "1.2.3 ", "①", "⑫ ", "十一、", "(4)", "一百零一、", "２．", "  3. "]
+    return [rnd.choice(prefixes) + f"第{i}节 标题文字" for i in range(n_headings)]
+
+
+def bench_prefixes(n_headings=100000, repeat=3):
+    """比较逐个替换（原有做法）与批量识别原有序号的耗时（取最快一次），返回结果字典"""
+    texts = make_heading_texts(n_headings)
+
+    def one_by_one():
+        lengths = []
+        for text in texts:
+            lengths.append(len(text) - len(HEADING_NUMBER_PATTERN.sub('', text, count=1)))
+        return lengths
+
+    if one_by_one() != prefix_lengths(texts):
+        raise AssertionError("批量识别与逐个匹配的结果不一致")
+    result = {"headings": n_headings}
+    for name, func in (("one_by_one", one_by_one), ("bulk", lambda: prefix_lengths(texts))):
+        result[name] = round(_best_of(repeat, func), 4)
+    return result
+
+
+def bench_style_lookup(n_paragraphs=100000, repeat=3):
+    """段落样式名查找：逐段落 p.style.name 与按样式ID缓存的 StyleResolver 对比
+
+    两种方式遍历同一批 Paragraph 对象，各处理步骤每个段落查找一次；
+    StyleResolver 的计时包括新建解析器（每个文档一次）。
+    """
+    doc = Document(BytesIO(make_synthetic_document(
+        paragraphs=n_paragraphs, tables=0, images=0, outline_every=0)))
+    paragraphs = doc.paragraphs
+
+    def by_proxy():
+        return [p.style.name for p in paragraphs]
+
+    def by_resolver():
+        styles = StyleResolver(doc.styles)
+        return [styles.name_of(p._p) for p in paragraphs]
+
+    assert by_proxy() == by_resolver()
+    proxy = _best_of(repeat, by_proxy)
+    resolver = _best_of(repeat, by_resolver)
+    return {
+        "paragraphs": len(paragraphs),
+        "style_name_seconds": round(proxy, 4),
+        "resolver_seconds": round(resolver, 4),
+        "speedup": round(proxy / resolver, 1) if resolver else None,
+    }
+
+
+def _scan_by_proxy(doc):
+    """原来三个步骤各自对每个段落的读取：doc.paragraphs、p.text 和样式名"""
+    styles = StyleResolver(doc.styles)
+    selected = 0
+    for _ in range(3):
+        for p in doc.paragraphs:
+            name = styles.name_of(p._p)
+            if p.text == "Ellipsis" or not p.text.strip():
+                continue
+            if name.startswith("Heading"):
+                styles.heading_level_of(p._p)
+            selected += 1
+    return selected // 3
+
+
+def _scan_by_index(doc):
+    """建立段落索引后同样的读取"""
+    index = paragraph_index(doc)
+    flags = index.flags
+    selected = 0
+    for _ in range(3):
+        for i in range(len(index)):
+            if flags[i] & (EMPTY | ELLIPSIS):
+                continue
+            index.style_name(i)
+            if flags[i] & HEADING:
+                index.heading_level(i)
+            selected += 1
+    return selected // 3
+
+
+def bench_paragraph_index(n_paragraphs=20000, repeat=3):
+    """段落索引：各步骤逐段读取 p.text 和样式名，与建立一次索引后读取对比耗时和每段内存
+
+    内存为 tracemalloc 峰值除以段落数；index_bytes_per_paragraph 为索引常驻的大小（含缓存的
+    段落文本），array_bytes_per_paragraph 只计各平行数组本身。计时包括新建样式解析器或索引
+    （每个文档一次）。
+    """
+    doc = Document(BytesIO(make_synthetic_document(
+        paragraphs=n_paragraphs, tables=0, images=0)))
+    n = len(doc.paragraphs)
+    assert _scan_by_proxy(doc) == _scan_by_index(doc)
+    result = {"paragraphs": n}
+    for name, func in (("proxy", lambda: _scan_by_proxy(doc)), ("index", lambda: _scan_by_index(doc))):
+        _, peak = _measure(func)
+        result[name] = {
+            "seconds": round(_best_of(repeat, func), 4),
+            "peak_bytes_per_paragraph": round(peak / n, 1),
+        }
+    tracemalloc.start()
+    index = paragraph_index(doc)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    result["index_bytes_per_paragraph"] = round(retained / len(index), 1)
+    arrays = sum(sys.getsizeof(getattr(index, name))
+                 for name in ("elements", "texts", "style_ids", "levels", "flags", "prefix_ends"))
+    result["array_bytes_per_paragraph"] = round(arrays / len(index), 1)
+    proxy, indexed = result["proxy"]["seconds"], result["index"]["seconds"]
+    result["speedup"] = round(proxy / indexed, 1) if indexed else None
+    return result
+
+
+def _document_xml_stats(file_bytes):
+    """document.xml 的大小和其中的 run 数"""
+    with zipfile.ZipFile(BytesIO(file_bytes)) as zf:
+        data = zf.read("word/document.xml")
+    return len(data), sum(1 for _ in etree.fromstring(data).iter(qn("w:r")))
+
+
+def bench_coalesce(scale, repeat=3):
+    """合并 run：处理时合并与不合并对比 run 数、document.xml 和 .docx 大小、处理耗时，
+    以及再次处理输出文档（代表之后逐 run 的处理）的耗时"""
+    file_bytes = make_synthetic_document(pasted=True, **scale)
+    result = {"input_bytes": len(file_bytes)}
+    for coalesce in (False, True):
+        output = process_single_document(file_bytes, coalesce=coalesce).getvalue()
+        xml_bytes, runs = _document_xml_stats(output)
+        result["coalesce" if coalesce else "plain"] = {
+            "runs": runs,
+            "document_xml_bytes": xml_bytes,
+            "output_bytes": len(output),
+            "seconds": round(_best_of(repeat, lambda: process_single_document(file_bytes, coalesce=coalesce)), 4),
+            "reprocess_seconds": round(_best_of(repeat, lambda: process_single_document(output)), 4),
+        }
+    plain, merged = result["plain"], result["coalesce"]
+    result["run_reduction"] = round(1 - merged["runs"] / plain["runs"], 3)
+    result["document_xml_reduction"] = round(1 - merged["document_xml_bytes"] / plain["document_xml_bytes"], 3)
+    result["output_reduction"] = round(1 - merged["output_bytes"] / plain["output_bytes"], 3)
+    return result
+
+
+def make_png(width, height):
+    """生成随机像素的 PNG（几乎不可压缩，用来模拟照片类图片）"""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    raw = b"".join(b"\x00" + os.urandom(width * 3) for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+def make_image_document(n_images, image_kb, paragraphs_per_image=20):
+    """生成含 n_images 张图片（每张约 image_kb KB）的文档"""
+    side = max(8, int((image_kb * 1024 / 3) ** 0.5))
+    doc = Document()
+    for i in range(n_images):
+        doc.add_paragraph(f"{i + 1}. 图片说明", style="Heading 2")
+        doc.add_picture(BytesIO(make_png(side, side)), width=Inches(4))
+        for j in range(paragraphs_per_image):
+            doc.add_paragraph(f"正文段落 {i}-{j}")
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _measure(func):
+    """返回 (耗时秒数, tracemalloc 峰值字节数)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_save(n_images=40, image_kb=2048):
+    """比较 doc.save() 与零拷贝保存的耗时和内存峰值，返回结果字典"""
+    file_bytes = make_image_document(n_images, image_kb)
+    result = {"images": n_images, "input_bytes": len(file_bytes)}
+    doc = Document(BytesIO(file_bytes))
+    for name, func in (
+        ("doc_save", lambda: doc.save(BytesIO())),
+        ("zero_copy", lambda: save_document(doc, file_bytes, cleaner_parts(doc))),
+    ):
+        elapsed, peak = _measure(func)
+        result[name] = {"seconds": round(elapsed, 4), "peak_bytes": peak}
+    return result
+
+
+def _add_table(doc, n_rows, n_cols, merged=True):
+    """在文档末尾添加 n_rows 行的表格；merged=True 时每两行含一处横向合并和一处纵向合并"""
+    n_cols = max(n_cols, 3)
+    table = doc.add_table(rows=2, cols=n_cols)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = f"{r}-{c}"
+    if merged:
+        table.cell(0, 0).merge(table.cell(0, 1))
+        table.cell(0, 2).merge(table.cell(1, 2))
+    tbl = table._tbl
+    template = list(tbl.tr_lst)
+    for _ in range(max(n_rows, 2) // 2 - 1):
+        for tr in template:
+            tbl.append(deepcopy(tr))
+    return table
+
+
+def make_table_document(n_rows, n_cols=6):
+    """生成一张 n_rows 行的表格，每两行含一处横向合并和一处纵向合并"""
+    doc = Document()
+    _add_table(doc, n_rows, n_cols)
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _format_by_row_cells(doc):
+    """原有做法：row.cells 展开合并单元格"""
+    visits = 0
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for paragraph in cell.paragraphs:
+                    paragraph.paragraph_format.space_before = Pt(4)
+                    visits += 1
+    return visits
+
+
+def _format_by_tc(doc):
+    """直接遍历 w:tc，每个单元格只访问一次"""
+    visits = 0
+    for table in doc.tables:
+        for p in iter_cell_paragraphs(table._tbl):
+            Paragraph(p, table).paragraph_format.space_before = Pt(4)
+            visits += 1
+    return visits
+
+
+def bench_tables(n_rows=5000, n_cols=6):
+    """比较 row.cells 与直接遍历 w:tc 设置表格格式的耗时和访问段落数，返回结果字典"""
+    file_bytes = make_table_document(n_rows, n_cols)
+    result = {"rows": n_rows, "cols": n_cols}
+    for name, func in (("row_cells", _format_by_row_cells), ("tc_direct", _format_by_tc)):
+        doc = Document(BytesIO(file_bytes))
+        start = time.perf_counter()
+        visits = func(doc)
+        result[name] = {"seconds": round(time.perf_counter() - start, 4), "paragraph_visits": visits}
+    return result
+
+
+# 合成文档的默认规模
+SCALE_DEFAULTS = {
+    "paragraphs": 2000,
+    "heading_every": 8,
+    "heading_depth": 4,
+    "outline_every": 5,
+    "runs": 3,
+    "tables": 4,
+    "table_rows": 40,
+    "table_cols": 5,
+    "merged": True,
+    "images": 2,
+    "image_kb": 64,
+    "seed": 0,
+}
+
+
+def make_synthetic_document(paragraphs=2000, heading_every=8, heading_depth=4, outline_every=5,
+                            runs=3, tables=4, table_rows=40, table_cols=5, merged=True,
+                            images=2, image_kb=64, seed=0, pasted=False):
+    """生成合成测试文档，返回 docx 字节
+
+    :param paragraphs: 正文区段落总数（含标题）
+    :param heading_every: 每隔多少个段落出现一个标题
+    :param heading_depth: 标题最深级别（1-9）
+    :param outline_every: 每隔多少个标题用"正文样式 + 大纲级别"代替标题样式，0 表示不用
+    :param runs: 每个段落拆成的 run 数
+    :param tables: 表格个数，均匀插在段落之间
+    :param table_rows: 每个表格的行数
+    :param table_cols: 每个表格的列数
+    :param merged: 表格中是否包含横向和纵向合并单元格
+    :param images: 图片张数，均匀插在段落之间
+    :param image_kb: 每张图片的大致大小
+    :param seed: 随机种子，相同参数和种子生成相同内容
+    :param pasted: 模拟从网页粘贴的段落：各 run 不设斜体，而是字号各不相同并带不同的
+        修订标识（w:rsidR），统一格式后这些 run 的格式相同
+    """
+    rng = random.Random(seed)
+    heading_depth = min(max(heading_depth, 1), 9)
+    doc = Document()
+    body = doc.element.body
+    sect_pr = body.sectPr
+    heading_ids = {level: doc.styles[f"Heading {level}"].style_id for level in range(1, heading_depth + 1)}
+    table_at = {paragraphs * (i + 1) // (tables + 1) for i in range(tables)}
+    image_at = {paragraphs * (i + 1) // (images + 1) + 1 for i in range(images)}
+    side = max(8, int((image_kb * 1024 / 3) ** 0.5))
+    heading_count = 0
+
+    for i in range(paragraphs):
+        # 直接在 w:sectPr 前插入元素；doc.add_paragraph 每次都要查找 w:sectPr，段落多时很慢
+        p = OxmlElement("w:p")
+        sect_pr.addprevious(p)
+        if heading_every and i % heading_every == 0:
+            level = rng.randint(1, heading_depth)
+            heading_count += 1
+            old_number = rng.choice(["", f"{heading_count}. ", f"（{heading_count}）", "一、"])
+            text = f"{old_number}第{heading_count}节 标题文字"
+            if outline_every and heading_count % outline_every == 0:
+                outline = OxmlElement("w:outlineLvl")
+                outline.set(qn("w:val"), str(level - 1))
+                p.get_or_add_pPr().append(outline)
+            else:
+                p.style = heading_ids[level]
+        else:
+            text = f"这是第{i}段正文，包含一些 English words 和数字 {rng.randint(0, 99999)}。" * rng.randint(1, 4)
+        paragraph = Paragraph(p, doc._body)
+        step = max(1, -(-len(text) // max(runs, 1)))
+        for k, start in enumerate(range(0, len(text), step)):
+            run = paragraph.add_run(text[start:start + step])
+            if pasted:
+                run.font.size = Pt(rng.choice((9, 10.5, 11, 12)))
+                run._r.set(qn("w:rsidR"), f"{rng.getrandbits(32):08X}")
+            else:
+                run.italic = k % 2 == 1
+        if i in table_at:
+            _add_table(doc, table_rows, table_cols, merged)
+        if i in image_at:
+            doc.add_picture(BytesIO(make_png(side, side)), width=Inches(4))
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _best_of(repeat, func):
+    """重复执行 func，返回最快一次的耗时"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_dom_stages(file_bytes, repeat=3):
+    """分阶段计时 "dom" 流程，每个阶段取最快一次，返回 {阶段名: 秒数}"""
+    stages = {
+        "load": None,
+        "paragraph_index": None,
+        "restructure_outline": restructure_outline,
+        "kill_all_numbering": lambda doc, index: kill_all_numbering(doc),
+        "add_heading_numbers_custom": add_heading_numbers_custom,
+        "apply_preset_format": lambda doc, index: apply_preset_format(doc, load_profile(), index),
+        "save": lambda doc, index: doc.save(BytesIO()),
+    }
+    best = dict.fromkeys(stages)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        doc = Document(BytesIO(file_bytes))
+        timings = {"load": time.perf_counter() - start}
+        start = time.perf_counter()
+        index = paragraph_index(doc)
+        timings["paragraph_index"] = time.perf_counter() - start
+        for name, func in stages.items():
+            if func is None:
+                continue
+            start = time.perf_counter()
+            func(doc, index)
+            timings[name] = time.perf_counter() - start
+        for name, elapsed in timings.items():
+            best[name] = elapsed if best[name] is None else min(best[name], elapsed)
+    best["total"] = sum(best.values())
+    return best
+
+
+class _Discard:
+    """丢弃写入内容的文本流"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def time_wordcleaner_main(file_bytes, repeat=3):
+    """在临时目录中运行 WordCleaner.main()（单个文件，不启动进程池），返回最快一次的耗时"""
+    folder = tempfile.mkdtemp(prefix="wordcleaner-bench-")
+    try:
+        with open(os.path.join(folder, "synthetic.docx"), "wb") as f:
+            f.write(file_bytes)
+
+        def run():
+            with contextlib.redirect_stdout(_Discard()):
+                WordCleaner.main(folder)
+            os.remove(os.path.join(folder, "synthetic_已修改.docx"))
+
+        return _best_of(repeat, run)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_suite(scale, repeat=3):
+    """生成合成文档并计时各阶段和各入口，返回结果字典"""
+    file_bytes = make_synthetic_document(**scale)
+    timings = {f"dom.{name}": seconds for name, seconds in time_dom_stages(file_bytes, repeat).items()}
+    for engine in ("fast", "stream"):
+        timings[engine] = _best_of(repeat, lambda: process_single_document(file_bytes, engine=engine))
+    timings["analyze"] = _best_of(repeat, lambda: analyze_document(file_bytes))
+    timings["wordcleaner.main"] = time_wordcleaner_main(file_bytes, repeat)
+    return {
+        "scale": scale,
+        "input_bytes": len(file_bytes),
+        "repeat": repeat,
+        "python": sys.version.split()[0],
+        "timings": {name: round(seconds, 4) for name, seconds in timings.items()},
+    }
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def time_cli_cold_start(file_bytes):
+    """启动一次命令行处理单个文档（标准输入 -> 标准输出）的耗时，作为不使用服务时的对照"""
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, cli, "-", "--no-cache", "--summary", os.devnull],
+                   input=file_bytes, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+# 命令行冷启动的预算（秒）：定时任务每次只处理一个小文档，整个进程应在1秒内结束
+STARTUP_BUDGET = 1.0
+
+
+def bench_startup(repeat=5, budget=STARTUP_BUDGET, scale=None):
+    """命令行冷启动：每次新起一个进程，取各情形的中位数和最大值
+
+    import：只导入 cli 模块；no_cache：不使用缓存处理单个文档；
+    cache_hit：缓存命中（临时缓存目录，先处理一次写入缓存）。
+    任一情形的最大值超过 budget 时记入 over_budget。
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    cli = os.path.join(here, "cli.py")
+    with tempfile.TemporaryDirectory(prefix="wordcleaner-startup-") as directory:
+        path = os.path.join(directory, "input.docx")
+        with open(path, "wb") as f:
+            f.write(make_synthetic_document(**(scale or {})))
+        run_cli = [sys.executable, cli, path, "-o", os.path.join(directory, "out"), "--summary", os.devnull]
+        cache_dir = os.path.join(directory, "cache")
+        subprocess.run(run_cli + ["--cache-dir", cache_dir], check=True)
+        commands = {
+            "import": [sys.executable, "-c", "import cli"],
+            "no_cache": run_cli + ["--no-cache"],
+            "cache_hit": run_cli + ["--cache-dir", cache_dir],
+        }
+        timings = {}
+        for name, command in commands.items():
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run(command, cwd=here, check=True)
+                seconds.append(time.perf_counter() - start)
+            seconds.sort()
+            timings[name] = {"median": round(_percentile(seconds, 0.5), 4), "max": round(seconds[-1], 4)}
+    return {
+        "repeat": repeat,
+        "budget": budget,
+        "timings": timings,
+        "over_budget": [name for name, timing in timings.items() if timing["max"] > budget],
+    }
+
+
+def bench_service(n_requests=200, concurrency=8, workers=None, url=None, scale=None):
+    """常驻服务的吞吐量和延迟（负载测试），返回结果字典
+
+    未给定 url 时在本进程中启动服务（监听随机端口，不使用结果缓存）；
+    每个并发客户端使用一个保持连接的 HTTP 连接，依次发送同一份合成文档。
+    """
+    import http.client
+    from urllib.parse import urlsplit
+    from service import ProcessingService, make_server
+
+    file_bytes = make_synthetic_document(**(scale or {}))
+    service = server = None
+    if url is None:
+        service = ProcessingService(max_workers=workers, max_pending=max(64, concurrency))
+        warm_start = time.perf_counter()
+        service.start()
+        warm_seconds = time.perf_counter() - warm_start
+        server = make_server(service, port=0, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address[:2]
+    else:
+        warm_seconds = None
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+
+    counter = iter(range(n_requests))
+    lock = threading.Lock()
+
+    def client():
+        latencies, errors = [], 0
+        conn = http.client.HTTPConnection(host, port, timeout=600)
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            start = time.perf_counter()
+            conn.request("POST", "/process", body=file_bytes)
+            response = conn.getresponse()
+            response_body = response.read()
+            latencies.append(time.perf_counter() - start)
+            if response.status != 200 or not response_body:
+                errors += 1
+        conn.close()
+        return latencies, errors
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda _: client(), range(concurrency)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            service.shutdown()
+
+    latencies = sorted(latency for latency_list, _ in results for latency in latency_list)
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "workers": service.max_workers if service is not None else None,
+        "input_bytes": len(file_bytes),
+        "warm_up_seconds": round(warm_seconds, 4) if warm_seconds is not None else None,
+        "seconds": round(elapsed, 4),
+        "throughput_per_second": round(n_requests / elapsed, 2),
+        "errors": sum(errors for _, errors in results),
+        "latency": {
+            "p50": round(_percentile(latencies, 0.5), 4),
+            "p95": round(_percentile(latencies, 0.95), 4),
+            "p99": round(_percentile(latencies, 0.99), 4),
+            "max": round(latencies[-1], 4),
+        },
+        "cli_cold_start_seconds": round(time_cli_cold_start(file_bytes), 4),
+    }
+
+
+def _wait_for_jobs(manager, session, interval=0.05):
+    """等待该会话的任务全部结束，返回状态快照"""
+    from jobs import DONE, ERROR
+
+    while True:
+        statuses = manager.jobs(session)
+        if all(status.state in (DONE, ERROR) for status in statuses):
+            return statuses
+        time.sleep(interval)
+
+
+def bench_uploads(documents=10, scale=None, threshold=None, workers=None):
+    """上传文档和处理结果的内存占用：整份字节与磁盘暂存对比，返回结果字典
+
+    两种做法都提交 documents 份合成文档，再下载每个结果和打包的 ZIP，提交（submit，
+    含等待处理完成）和下载（download）分别计量。in_memory 为原来的做法：读出整份字节
+    提交，下载时结果字节和 ZIP 全部在内存中（相当于 st.download_button 的内存媒体存储）；
+    spooled 以文件对象提交（超过 threshold 字节的暂存到磁盘），ZIP 由 pack_results
+    在完成时逐个写入，下载时按 64 KB 分块从磁盘读出（相当于静态文件服务）。记录本进程
+    Python 分配的峰值（tracemalloc）和单个文档处理进程的峰值常驻内存。
+    """
+    from governor import DEFAULT_LIMITS
+    from jobs import SPOOL_THRESHOLD, JobManager
+    from zip_batch import write_results_zip
+
+    threshold = SPOOL_THRESHOLD if threshold is None else threshold
+    file_bytes = make_synthetic_document(**(scale or {}))
+    result = {"documents": documents, "input_bytes": len(file_bytes), "threshold": threshold}
+    with tempfile.TemporaryDirectory(prefix="wordcleaner-uploads-") as directory:
+        path = os.path.join(directory, "input.docx")
+        with open(path, "wb") as f:
+            f.write(file_bytes)
+        del file_bytes
+        for name in ("in_memory", "spooled"):
+            manager = JobManager(max_workers=workers, limits=DEFAULT_LIMITS, spool_threshold=threshold)
+            statuses = []
+            zip_keys = []
+
+            def submit():
+                for i in range(documents):
+                    with open(path, "rb") as f:
+                        manager.submit("bench", f"{i}.docx", f.read() if name == "in_memory" else f)
+                if name == "spooled":
+                    zip_keys.append(manager.pack_results("bench", [status.id for status in manager.jobs("bench")]))
+                statuses.extend(_wait_for_jobs(manager, "bench"))
+
+            def download():
+                if name == "in_memory":
+                    held = [manager.result(status.id) for status in statuses]
+                    out = BytesIO()
+                    write_results_zip(((status.name, data, {}) for status, data in zip(statuses, held)), out)
+                    held.append(out.getvalue())
+                    return
+                while manager.packing(zip_keys[0]):
+                    time.sleep(0.05)
+                for key in [status.id for status in statuses] + zip_keys:
+                    with open(manager.result_path(key), "rb") as f:
+                        while f.read(64 * 1024):
+                            pass
+
+            try:
+                submit_seconds, submit_peak = _measure(submit)
+                download_seconds, download_peak = _measure(download)
+            finally:
+                manager.shutdown()
+            peaks = [status.peak_rss for status in statuses if status.peak_rss]
+            result[name] = {
+                "submit_seconds": round(submit_seconds, 4),
+                "submit_peak_python_bytes": submit_peak,
+                "download_seconds": round(download_seconds, 4),
+                "download_peak_python_bytes": download_peak,
+                "max_worker_rss_bytes": max(peaks) if peaks else None,
+                "failed": sum(1 for status in statuses if status.error is not None),
+            }
+    for stage in ("submit", "download"):
+        key = f"{stage}_peak_python_bytes"
+        result[f"{stage}_peak_reduction"] = round(1 - result["spooled"][key] / result["in_memory"][key], 3)
+    return result
+
+
+def find_regressions(result, baseline, tolerance=0.2, min_delta=0.02):
+    """与基线比较，返回超过阈值的阶段列表
+
+    某阶段耗时超过基线的 (1 + tolerance) 倍且绝对差值超过 min_delta 秒时视为退化；
+    min_delta 避免很短的阶段因计时抖动误报。
+    """
+    regressions = []
+    for name, base in baseline["timings"].items():
+        current = result["timings"].get(name)
+        if current is None:
+            continue
+        if current > base * (1 + tolerance) and current - base > min_delta:
+            regressions.append({
+                "stage": name,
+                "baseline": base,
+                "current": current,
+                "ratio": round(current / base, 3) if base else None,
+            })
+    return regressions
+
+
+def _add_scale_arguments(parser):
+    """合成文档规模参数（suite 和 generate 共用）"""
+    d = SCALE_DEFAULTS
+    parser.add_argument("--paragraphs", type=int, default=d["paragraphs"], help="段落总数")
+    parser.add_argument("--heading-every", type=int, default=d["heading_every"], help="每隔多少段一个标题")
+    parser.add_argument("--heading-depth", type=int, default=d["heading_depth"], help="标题最深级别（1-9）")
+    parser.add_argument("--outline-every", type=int, default=d["outline_every"],
+                        help="每隔多少个标题用大纲级别代替标题样式，0 表示不用")
+    parser.add_argument("--runs", type=int, default=d["runs"], help="每段拆成的 run 数")
+    parser.add_argument("--tables", type=int, default=d["tables"], help="表格个数")
+    parser.add_argument("--table-rows", type=int, default=d["table_rows"], help="每个表格的行数")
+    parser.add_argument("--table-cols", type=int, default=d["table_cols"], help="每个表格的列数")
+    parser.add_argument("--no-merged", dest="merged", action="store_false", help="表格中不含合并单元格")
+    parser.add_argument("--images", type=int, default=d["images"], help="图片张数")
+    parser.add_argument("--image-kb", type=int, default=d["image_kb"], help="每张图片的大致大小（KB）")
+    parser.add_argument("--seed", type=int, default=d["seed"], help="随机种子")
+
+
+def _scale_from_args(args):
+    return {name: getattr(args, name) for name in SCALE_DEFAULTS}
+
+
+def _run_suite_command(args):
+    """suite 子命令：输出 JSON，按需写入基线或与基线比较，返回退出码"""
+    result = run_suite(_scale_from_args(args), args.repeat)
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != result["scale"]:
+            print("基线的文档规模与本次不同，无法比较。", file=sys.stderr)
+            return 2
+        result["regressions"] = find_regressions(result, baseline, args.tolerance, args.min_delta)
+        status = 1 if result["regressions"] else 0
+    if args.write_baseline:
+        with open(args.write_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WordCleaner 性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+    suite = sub.add_parser("suite", help="合成文档上的分阶段计时，可与基线比较")
+    _add_scale_arguments(suite)
+    suite.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次")
+    suite.add_argument("--baseline", help="基线 JSON，有阶段退化时退出码为1")
+    suite.add_argument("--write-baseline", help="把本次结果写为基线 JSON")
+    suite.add_argument("--tolerance", type=float, default=0.2, help="允许比基线慢的比例")
+    suite.add_argument("--min-delta", type=float, default=0.02, help="忽略小于该秒数的差值")
+    generate = sub.add_parser("generate", help="只生成合成文档")
+    generate.add_argument("output", help="输出 .docx 路径")
+    _add_scale_arguments(generate)
+    renumber = sub.add_parser("renumber", help="标题重新编号：重建 run 与原位修改对比")
+    renumber.add_argument("--headings", type=int, default=5000)
+    renumber.add_argument("--runs", type=int, default=4)
+    renumber.add_argument("--repeat", type=int, default=3)
+    prefixes = sub.add_parser("prefixes", help="原有序号识别：逐个替换与批量识别对比")
+    prefixes.add_argument("--headings", type=int, default=100000)
+    prefixes.add_argument("--repeat", type=int, default=3)
+    styles = sub.add_parser("styles", help="段落样式名查找：p.style.name 与 StyleResolver 对比")
+    styles.add_argument("--paragraphs", type=int, default=100000)
+    styles.add_argument("--repeat", type=int, default=3)
+    paragraphs = sub.add_parser("paragraphs", help="段落索引：逐段读取 p.text 和样式名与建立一次索引对比")
+    paragraphs.add_argument("--paragraphs", type=int, default=20000)
+    paragraphs.add_argument("--repeat", type=int, default=3)
+    coalesce = sub.add_parser("coalesce", help="合并 run：run 数、输出大小和之后处理耗时的对比")
+    _add_scale_arguments(coalesce)
+    coalesce.add_argument("--repeat", type=int, default=3)
+    uploads = sub.add_parser("uploads", help="上传和结果的内存占用：整份字节与磁盘暂存对比")
+    _add_scale_arguments(uploads)
+    uploads.add_argument("--documents", type=int, default=10, help="提交的文档数")
+    uploads.add_argument("--threshold-kb", type=int, default=None, help="留在内存中的上传文档上限（KB），默认同 JobManager")
+    uploads.add_argument("-j", "--jobs", type=int, default=None, help="工作进程数")
+    service = sub.add_parser("service", help="常驻服务的吞吐量和延迟（负载测试）")
+    _add_scale_arguments(service)
+    service.add_argument("--requests", type=int, default=200, help="请求总数")
+    service.add_argument("--concurrency", type=int, default=8, help="并发客户端数")
+    service.add_argument("-j", "--jobs", type=int, default=None, help="服务的工作进程数（本进程中启动服务时）")
+    service.add_argument("--url", help="压测已启动的服务，如 http://127.0.0.1:8765")
+    startup = sub.add_parser("startup", help="命令行冷启动耗时，超过预算时退出码为1")
+    _add_scale_arguments(startup)
+    startup.add_argument("--repeat", type=int, default=5, help="每种情形启动的次数")
+    startup.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="冷启动预算（秒）")
+    save = sub.add_parser("save", help="保存：doc.save() 与零拷贝保存对比")
+    save.add_argument("--images", type=int, default=40)
+    save.add_argument("--image-kb", type=int, default=2048)
+    tables = sub.add_parser("tables", help="表格：row.cells 与直接遍历 w:tc 对比")
+    tables.add_argument("--rows", type=int, default=5000)
+    tables.add_argument("--cols", type=int, default=6)
+    args = parser.parse_args()
+
+    if args.command == "suite":
+        return _run_suite_command(args)
+    if args.command == "generate":
+        with open(args.output, "wb") as f:
+            f.write(make_synthetic_document(**_scale_from_args(args)))
+        return 0
+    if args.command == "renumber":
+        result = bench_renumbering(args.headings, args.runs, args.repeat)
+    elif args.command == "prefixes":
+        result = bench_prefixes(args.headings, args.repeat)
+    elif args.command == "styles":
+        result = bench_style_lookup(args.paragraphs, args.repeat)
+    elif args.command == "paragraphs":
+        result = bench_paragraph_index(args.paragraphs, args.repeat)
+    elif args.command == "coalesce":
+        result = bench_coalesce(_scale_from_args(args), args.repeat)
+    elif args.command == "uploads":
+        threshold = None if args.threshold_kb is None else args.threshold_kb * 1024
+        result = bench_uploads(args.documents, _scale_from_args(args), threshold, args.jobs)
+    elif args.command == "service":
+        result = bench_service(args.requests, args.concurrency, args.jobs, args.url, _scale_from_args(args))
+    elif args.command == "startup":
+        result = bench_startup(args.repeat, args.budget, _scale_from_args(args))
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 1 if result["over_budget"] else 0
+    elif args.command == "save":
+        result = bench_save(args.images, args.image_kb)
+    elif args.command == "tables":
+        result = bench_tables(args.rows, args.cols)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
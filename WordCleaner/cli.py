@@ -0,0 +1,384 @@
+"""命令行入口
+
+用法示例：
+    python cli.py 报告.docx                       # 输出 报告_已修改.docx
+    python cli.py docs/ -r -o out/                 # 递归处理目录，保持目录结构写入 out/
+    python cli.py "docs/**/*.docx" -o out/         # 通配符匹配，保持 docs/ 以下的目录结构写入 out/
+    python cli.py "docs/**/*.docx" --in-place      # 通配符匹配，原地覆盖
+    python cli.py - < in.docx > out.docx           # 标准输入/输出
+    python cli.py 合同.zip -o out/                 # ZIP 中的全部 .docx，输出 out/合同.zip（含 manifest.json）
+
+使用 -o 时多个输入对应同一输出路径（如两个目录中的同名文件）会在处理前报错退出。
+处理完成后输出 JSON 汇总（写到标准输出；使用 "-" 时写到标准错误）。
+--trace 把每个文件各阶段的耗时和计数写入 JSON 文件，用于排查处理缓慢的文档。
+--profile 选择格式规则：内置规则名或 JSON/YAML 规则文件（格式见 rules.py）。
+--dry-run 只分析不写文档：报告每个文档将被如何修改以及整批的汇总（见 analysis.py），
+写到 --report 指定的 JSON 或 CSV 文件，默认以 JSON 写到标准输出：
+    python cli.py archive/ -r --dry-run --report plan.csv
+每个文档在资源上限内处理（见 governor.py）：包中部件解压后过大或压缩比异常、处理超过
+--timeout 秒或占用内存超过 --max-memory-mb 的文档记为失败，汇总中 error_code 为原因，
+其余文档照常处理；--no-limits 取消这些限制。汇总中 peak_rss_bytes 为各文档处理进程的
+峰值常驻内存，顶层为整批的最大值。
+退出码：0 全部成功，1 有文件处理失败，2 参数错误或没有找到输入文件。
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+from batch import process_batch
+from governor import ResourceLimitExceeded, add_limit_arguments, limits_from_args
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+from rules import available_profiles, load_profile
+from zip_batch import process_zip
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+OUTPUT_SUFFIX = "_已修改"
+
+
+def _is_docx(path):
+    """是否为待处理的 .docx 文件（跳过 Word 的 ~$ 临时文件）"""
+    name = os.path.basename(path)
+    return name.lower().endswith(".docx") and not name.startswith("~$")
+
+
+def _glob_root(pattern):
+    """通配符中第一个含通配符的部分之前的目录，通配符匹配到的文件相对它计算输出路径"""
+    root = pattern
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or os.curdir
+
+
+def collect_inputs(patterns, recursive=False):
+    """把路径、目录和通配符展开为 [(输入文件, 相对输出路径)] 列表，去重并保持顺序
+
+    目录输入的相对路径相对该目录，通配符输入相对通配符之前的目录（见 _glob_root），
+    单个文件为文件名。
+    """
+    found = []
+    seen = set()
+
+    def add(path, rel):
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            found.append((path, rel))
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                for root, dirs, files in os.walk(pattern):
+                    dirs.sort()
+                    for name in sorted(files):
+                        path = os.path.join(root, name)
+                        if _is_docx(path):
+                            add(path, os.path.relpath(path, pattern))
+            else:
+                for name in sorted(os.listdir(pattern)):
+                    path = os.path.join(pattern, name)
+                    if os.path.isfile(path) and _is_docx(path):
+                        add(path, name)
+        elif os.path.isfile(pattern):
+            add(pattern, os.path.basename(pattern))
+        else:
+            root = _glob_root(pattern)
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path) and _is_docx(path):
+                    add(path, os.path.relpath(path, root))
+    return found
+
+
+def output_path_for(path, rel, output_dir=None, in_place=False):
+    """计算输出路径：原地覆盖、写入输出目录，或在原文件旁加后缀"""
+    if in_place:
+        return path
+    if output_dir:
+        return os.path.join(output_dir, rel)
+    base, ext = os.path.splitext(path)
+    return f"{base}{OUTPUT_SUFFIX}{ext}"
+
+
+def output_conflicts(outputs):
+    """{输入: 输出路径} 中对应同一输出路径的输入，返回 [(输出路径, [输入, ...])]
+
+    路径按 os.path.normcase 比较（Windows 上不区分大小写）。
+    """
+    by_output = {}
+    for path, output in outputs.items():
+        key = os.path.normcase(os.path.abspath(output))
+        by_output.setdefault(key, (output, []))[1].append(path)
+    return [(output, paths) for output, paths in by_output.values() if len(paths) > 1]
+
+
+def _write_file(path, data):
+    """先写临时文件再替换，避免原地覆盖时中途失败损坏原文件
+
+    data 为字节，或接收文件对象、自行写入的函数（返回值原样返回）。
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            result = data(f) if callable(data) else f.write(data)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    os.replace(tmp_path, path)
+    return result
+
+
+def _is_zip(path):
+    return path.lower().endswith(".zip")
+
+
+def _run_zip(path, output, args, cache, options):
+    """处理一个 ZIP 输入，结果边处理边写入输出 ZIP，返回各文件的汇总条目"""
+    try:
+        manifest = _write_file(output, lambda f: process_zip(
+            path, f, max_workers=args.jobs, cache=cache, limits=limits_from_args(args), **options))
+    except (OSError, zipfile.BadZipFile, ResourceLimitExceeded) as e:
+        return [{
+            "input": path,
+            "output": None,
+            "status": "error",
+            "error": f"{type(e).__name__}: {e}",
+            "error_code": getattr(e, "code", None),
+            "seconds": 0.0,
+            "cached": False,
+            "input_bytes": 0,
+            "output_bytes": 0,
+            "peak_rss_bytes": None,
+        }]
+    return [{
+        "input": f"{path}!{entry['input']}",
+        "output": f"{output}!{entry['output']}" if entry["output"] else None,
+        "status": entry["status"],
+        "error": entry["error"],
+        "error_code": entry["error_code"],
+        "seconds": entry["seconds"],
+        "cached": entry["cached"],
+        "input_bytes": entry["input_bytes"],
+        "output_bytes": entry["output_bytes"],
+        "peak_rss_bytes": entry["peak_rss_bytes"],
+    } for entry in manifest["files"]]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="wordcleaner",
+        description="Word 文档一键排版（命令行版）",
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="输入文件、目录、通配符或 .zip；\"-\" 表示从标准输入读取并写到标准输出")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归处理目录")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("-o", "--output-dir", help="输出目录（目录和通配符输入会保持相对结构）")
+    target.add_argument("--in-place", action="store_true", help="原地覆盖输入文件")
+    parser.add_argument("--engine", choices=("fast", "dom", "stream"), default="fast",
+                        help="处理引擎；stream 为流式引擎，适合超大文档")
+    parser.add_argument("--style-mode", action="store_true", help="把格式写入样式定义而不是逐个 run 设置")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量处理：只处理相对上次输出有变化的段落，并在输出中保存清单")
+    parser.add_argument("--coalesce-runs", action="store_true",
+                        help="合并格式相同的相邻 run 并删除空 run，减小输出文件")
+    parser.add_argument("--profile", default=None,
+                        help=f"格式规则：内置规则名（{'、'.join(available_profiles())}）或 JSON/YAML 规则文件路径")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数，默认按CPU核数")
+    parser.add_argument("--summary", help="JSON 汇总的写入路径，默认写到标准输出")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="结果缓存目录")
+    parser.add_argument("--no-cache", action="store_true", help="不使用结果缓存")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只分析将做的修改，不写文档；报告写到 --report 或标准输出")
+    parser.add_argument("--report", help="--dry-run 报告的写入路径，以 .csv 结尾时写 CSV，否则写 JSON")
+    parser.add_argument("--trace", help="把各文件的阶段耗时和计数写入该 JSON 文件（缓存命中的文件没有记录）")
+    add_limit_arguments(parser)
+    return parser
+
+
+def _emit_summary(summary, path, to_stderr):
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    elif to_stderr:
+        print(text, file=sys.stderr)
+    else:
+        print(text)
+
+
+def _run_stdin(cache, options, traces, limits):
+    """标准输入 -> 标准输出"""
+    data = sys.stdin.buffer.read()
+    result = next(process_batch([("-", data)], cache=cache, trace=traces is not None, limits=limits, **options))
+    if result.error is None:
+        sys.stdout.buffer.write(result.data)
+        sys.stdout.buffer.flush()
+    _collect_trace(traces, result)
+    return [{
+        "input": "-",
+        "output": "-" if result.error is None else None,
+        "status": "ok" if result.error is None else "error",
+        "error": result.error,
+        "error_code": result.error_code,
+        "seconds": round(result.seconds, 4),
+        "cached": result.cached,
+        "input_bytes": len(data),
+        "output_bytes": len(result.data) if result.error is None else 0,
+        "peak_rss_bytes": result.peak_rss,
+    }]
+
+
+def _collect_trace(traces, result):
+    """开启 --trace 时收集单个文件的记录"""
+    if traces is not None:
+        traces.append({"input": result.key, "error": result.error, "cached": result.cached, "trace": result.trace})
+
+
+def _write_trace(path, traces, options):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"options": options, "files": traces}, f, ensure_ascii=False, indent=2)
+
+
+def _run_dry_run(args):
+    """--dry-run：分析全部输入（.zip 中的 .docx 先解压到临时目录），写出报告，返回退出码"""
+    from analysis import analyze_batch, write_report
+    from zip_batch import extract_documents
+
+    with tempfile.TemporaryDirectory(prefix="wordcleaner-dry-run-") as directory:
+        if args.inputs == ["-"]:
+            items = [("-", sys.stdin.buffer.read())]
+        else:
+            items = []
+            for path, _ in collect_inputs(args.inputs, args.recursive):
+                if not _is_zip(path):
+                    items.append((path, path))
+                    continue
+                member_dir = os.path.join(directory, str(len(items)))
+                os.mkdir(member_dir)
+                try:
+                    with zipfile.ZipFile(path) as zf:
+                        documents, _ = extract_documents(zf, member_dir, limits_from_args(args))
+                except (OSError, zipfile.BadZipFile, ResourceLimitExceeded) as e:
+                    print(f"无法读取 {path}: {type(e).__name__}: {e}", file=sys.stderr)
+                    return EXIT_FAILED
+                items.extend((f"{path}!{name}", member_path) for name, member_path in documents)
+        if not items:
+            print("没有找到任何 .docx 文件。", file=sys.stderr)
+            return EXIT_USAGE
+        report = analyze_batch(items, args.jobs, args.profile, limits_from_args(args))
+    write_report(report, args.report, sys.stdout)
+    return EXIT_FAILED if report["aggregate"]["failed"] else EXIT_OK
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    options = {"engine": args.engine, "style_mode": args.style_mode, "incremental": args.incremental}
+    if args.profile:
+        try:
+            load_profile(args.profile)
+        except ValueError as e:
+            parser.error(str(e))
+        options["profile"] = args.profile
+    if args.coalesce_runs:
+        options["coalesce"] = True
+    if args.report and not args.dry_run:
+        parser.error("--report 只能与 --dry-run 同时使用")
+    if args.dry_run:
+        if "-" in args.inputs and args.inputs != ["-"]:
+            parser.error("\"-\" 不能与其他输入同时使用")
+        return _run_dry_run(args)
+    start = time.perf_counter()
+
+    streaming = args.inputs == ["-"]
+    if "-" in args.inputs and not streaming:
+        parser.error("\"-\" 不能与其他输入同时使用")
+    if streaming and (args.output_dir or args.in_place):
+        parser.error("\"-\" 只能输出到标准输出")
+
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    traces = [] if args.trace else None
+    limits = limits_from_args(args)
+
+    if streaming:
+        entries = _run_stdin(cache, options, traces, limits)
+    else:
+        inputs = collect_inputs(args.inputs, args.recursive)
+        if not inputs:
+            print("没有找到任何 .docx 文件。", file=sys.stderr)
+            _emit_summary({"total": 0, "succeeded": 0, "failed": 0, "seconds": 0.0, "files": []},
+                          args.summary, False)
+            return EXIT_USAGE
+
+        outputs = {path: output_path_for(path, rel, args.output_dir, args.in_place) for path, rel in inputs}
+        conflicts = output_conflicts(outputs)
+        if conflicts:
+            for output, paths in conflicts:
+                print(f"多个输入会写到同一输出 {output}: {', '.join(paths)}", file=sys.stderr)
+            print("请分别处理这些输入，或改为处理它们共同的上级目录（-r）。", file=sys.stderr)
+            return EXIT_USAGE
+        entries = []
+        for path, _ in inputs:
+            if _is_zip(path):
+                entries.extend(_run_zip(path, outputs[path], args, cache, options))
+        items = [(path, path) for path, _ in inputs if not _is_zip(path)]
+        for result in process_batch(items, max_workers=args.jobs, cache=cache, trace=bool(args.trace),
+                                    limits=limits, **options):
+            _collect_trace(traces, result)
+            entry = {
+                "input": result.key,
+                "output": outputs[result.key],
+                "status": "ok",
+                "error": result.error,
+                "error_code": result.error_code,
+                "seconds": round(result.seconds, 4),
+                "cached": result.cached,
+                "input_bytes": os.path.getsize(result.key),
+                "output_bytes": 0,
+                "peak_rss_bytes": result.peak_rss,
+            }
+            if result.error is None:
+                try:
+                    _write_file(outputs[result.key], result.data)
+                    entry["output_bytes"] = len(result.data)
+                except OSError as e:
+                    entry["error"] = f"{type(e).__name__}: {e}"
+            if entry["error"] is not None:
+                entry["status"] = "error"
+                entry["output"] = None
+            entries.append(entry)
+
+    failed = sum(1 for entry in entries if entry["status"] != "ok")
+    summary = {
+        "total": len(entries),
+        "succeeded": len(entries) - failed,
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 4),
+        "input_bytes": sum(entry["input_bytes"] for entry in entries),
+        "output_bytes": sum(entry["output_bytes"] for entry in entries),
+        "peak_rss_bytes": max((entry["peak_rss_bytes"] or 0 for entry in entries), default=0) or None,
+        "files": entries,
+    }
+    if cache is not None:
+        summary["cache"] = cache.stats()
+    if traces is not None:
+        _write_trace(args.trace, traces, options)
+    _emit_summary(summary, args.summary, streaming)
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
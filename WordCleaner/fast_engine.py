@@ -0,0 +1,393 @@
+"""单次遍历的 lxml 排版引擎
+
+formatter.process_single_document 的 "dom" 流程会多次访问 doc.paragraphs，
+每次都重新构造一整批 Paragraph 代理对象。这里直接遍历 w:body 的子元素一次，
+在同一遍中完成大纲提升、空标题降级、标题重新编号和段落/表格格式设置，
+输出与 "dom" 流程等价：各部件内容相同，XML 部件按规范化（C14N）形式比较，
+不比较 ZIP 成员的时间戳（可用 compare_with_dom 校验，见 tests/test_engines.py）。
+"""
+import zipfile
+from collections import Counter
+from io import BytesIO
+from lxml import etree
+from docx import Document
+from docx.oxml.ns import qn
+from docx.shared import Cm
+from docx.text.parfmt import ParagraphFormat
+
+from formatter import (
+    KNOWN_STYLES,
+    format_heading_number,
+    StyleResolver,
+    kill_all_numbering,
+    outline_resolver,
+    style_resolver,
+)
+from heading_numbers import HEADING_NUMBER_PATTERN
+from package_io import cleaner_parts, save_document
+from incremental import element_digest, load_manifest, save_manifest
+from instrumentation import get_recorder
+from result_cache import rules_fingerprint
+from rules import apply_paragraph_format, apply_run_format, load_profile
+from run_merge import coalesce_element
+from run_text import lstrip_paragraph, renumber_heading
+from table_format import iter_cell_paragraphs
+from style_mode import (
+    write_style_format,
+    strip_run_format,
+    strip_paragraph_format,
+    has_first_line_indent,
+)
+
+W_P = qn('w:p')
+W_TBL = qn('w:tbl')
+
+
+class _DocumentContext:
+    """单个文档在一次遍历中需要的缓存和计数状态
+
+    :param styles: 文档的 Styles 代理对象
+    :param outline: 该文档的 OutlineLevelResolver
+    :param profile: 编译后的格式规则（rules.RuleProfile），默认为 default 规则
+    :param resolver: 该文档的 StyleResolver，默认新建一个
+    :param coalesce: 为 True 时处理完每个正文元素后合并格式相同的 run（见 run_merge.py）
+    """
+
+    def __init__(self, styles, outline, style_mode=False, profile=None, resolver=None, coalesce=False):
+        self.style_mode = style_mode
+        self.coalesce = coalesce
+        self.styles = styles
+        self.resolver = resolver if resolver is not None else StyleResolver(styles)
+        # 样式解析按样式ID缓存，见 formatter.StyleResolver
+        self.style_of = self.resolver.style_of
+        self.style_name_of = self.resolver.name_of
+        self.heading_level_of = self.resolver.heading_level_of
+        self.profile = profile if profile is not None else load_profile()
+        self.heading_rules = self.profile.headings
+        self.body_rule = self.profile.body
+        self.table_rule = self.profile.table
+        self.heading_numbers = [0] * 9
+        self.skipped = set()
+        self.counts = Counter()
+        self.outline = outline
+        self._formatted_styles = set()
+
+    def heading_style_id(self, level):
+        """返回 "Heading N" 对应的样式ID，文档中没有该样式时返回 False"""
+        try:
+            return self.resolver.style_id(f"Heading {level}")
+        except KeyError:
+            return False
+
+    def normal_style_id(self):
+        """返回 "Normal" 对应的样式ID（默认样式为None）"""
+        return self.resolver.style_id("Normal")
+
+    def format_heading_style(self, p, rule):
+        """标题的段前段后、行距和缩进写在样式上，每个样式只写一次"""
+        style_id = p.style
+        if style_id in self._formatted_styles:
+            return
+        self._formatted_styles.add(style_id)
+        pf = self.style_of(p).paragraph_format
+        pf.space_before = rule.space_before
+        pf.space_after = rule.space_after
+        if rule.line_spacing is not None:
+            pf.line_spacing = rule.line_spacing
+        if rule.first_line_indent is not None:
+            pf.first_line_indent = rule.first_line_indent
+
+    def write_style_once(self, p, rule):
+        """样式模式：把规则写入段落所用样式的定义，每个样式只写一次"""
+        style_id = p.style
+        if style_id in self._formatted_styles:
+            return
+        self._formatted_styles.add(style_id)
+        write_style_format(self.style_of(p), rule)
+
+
+def _next_heading_number(level, ctx):
+    """更新各级标题计数（level 从0开始），返回该标题的新序号"""
+    heading_numbers = ctx.heading_numbers
+    heading_numbers[level] += 1
+    for i in range(level + 1, len(heading_numbers)):
+        heading_numbers[i] = 0
+    return format_heading_number(level, heading_numbers)
+
+
+def _process_paragraph(p, ctx):
+    """对正文中的一个 w:p 依次执行大纲重构、编号和格式设置，返回写入的序号"""
+    ctx.counts["paragraphs"] += 1
+    # 清除段落缩进（对应 zero_indent）
+    pf = ParagraphFormat(p)
+    pf.left_indent = Cm(0)
+    pf.first_line_indent = Cm(0)
+    pf.right_indent = Cm(0)
+    pf.tab_stops.clear_all()
+    text = p.text
+    if text:
+        text = lstrip_paragraph(p, text)
+
+    # 根据大纲级别提升为标题
+    style_name = ctx.style_name_of(p)
+    lvl = ctx.outline.level_of(p)
+    if lvl and style_name == "Normal":
+        style_id = ctx.heading_style_id(lvl)
+        if style_id is not False:
+            p.style = style_id
+            style_name = ctx.style_name_of(p)
+
+    is_heading = style_name.startswith("Heading")
+    empty = not text.strip()
+
+    # 降级空标题
+    if is_heading and empty:
+        p.style = ctx.normal_style_id()
+        style_name = ctx.style_name_of(p)
+        is_heading = style_name.startswith("Heading")
+
+    if text == "Ellipsis" or empty:
+        return None
+
+    # 清除原有编号并重新编号
+    number_str = None
+    if is_heading:
+        number_str = _next_heading_number(ctx.heading_level_of(p) - 1, ctx)
+        ctx.counts["headings_renumbered"] += 1
+        text = renumber_heading(p, text, number_str, HEADING_NUMBER_PATTERN)
+        if text == "Ellipsis" or not text.strip():
+            return number_str
+
+    _format_paragraph(p, style_name, is_heading, ctx)
+    return number_str
+
+
+def _format_paragraph(p, style_name, is_heading, ctx):
+    """按段落样式应用格式规则"""
+    if ctx.profile.skip_unknown_styles and style_name not in KNOWN_STYLES:
+        ctx.skipped.add(style_name)
+        return
+
+    runs = p.r_lst
+    if is_heading:
+        rule = ctx.heading_rules.get(ctx.heading_level_of(p))
+        if rule is None:
+            return
+        ctx.counts["runs"] += len(runs)
+        if ctx.style_mode:
+            ctx.write_style_once(p, rule)
+            strip_paragraph_format(p)
+            for r in runs:
+                strip_run_format(r, strip_bold=True)
+        else:
+            ctx.format_heading_style(p, rule)
+            for r in runs:
+                apply_run_format(r, rule)
+        return
+
+    ctx.counts["runs"] += len(runs)
+    if ctx.style_mode:
+        ctx.write_style_once(p, ctx.body_rule)
+        strip_paragraph_format(p)
+        for r in runs:
+            strip_run_format(r)
+    else:
+        rule = ctx.body_rule
+        apply_paragraph_format(p, rule)
+        for r in runs:
+            apply_run_format(r, rule)
+
+
+def _process_table(tbl, ctx):
+    """设置表格中每个单元格段落的格式（包括嵌套表格，见 table_format.py）"""
+    rule = ctx.table_rule
+    normal_only = ctx.profile.table_normal_only
+    counts = ctx.counts
+    for p in iter_cell_paragraphs(tbl, counts):
+        if normal_only:
+            style_name = ctx.style_name_of(p)
+            if style_name != "Normal":
+                ctx.skipped.add(f"表格内：{style_name}")
+                continue
+        runs = p.r_lst
+        counts["table_paragraphs"] += 1
+        counts["table_runs"] += len(runs)
+        for r in runs:
+            apply_run_format(r, rule)
+        apply_paragraph_format(p, rule)
+        # 样式模式下 Normal 样式带有正文的首行缩进，表格段落不继承
+        if ctx.style_mode and not has_first_line_indent(p):
+            ParagraphFormat(p).first_line_indent = Cm(0)
+
+
+def finish_element(el, ctx):
+    """一个正文元素（w:p 或 w:tbl）处理完之后的收尾：按需合并格式相同的 run"""
+    if ctx.coalesce:
+        coalesce_element(el, ctx.counts)
+
+
+def process_document_fast(file_bytes, style_mode=False, profile=None, coalesce=False):
+    """单次遍历处理单个文档，返回保存后的 BytesIO
+
+    style_mode=True 时字体、字号和间距写入样式定义（见 style_mode.py），
+    不再逐个 run 写入直接格式。profile 为格式规则名或规则文件路径（见 rules.py）。
+    coalesce=True 时合并格式相同的相邻 run（见 run_merge.py）。
+    """
+    recorder = get_recorder()
+    with recorder.span("load"):
+        doc = Document(BytesIO(file_bytes))
+    ctx = _DocumentContext(doc.styles, outline_resolver(doc.part), style_mode, load_profile(profile),
+                           style_resolver(doc.part), coalesce)
+
+    # 清除编号（只修改样式定义，与段落遍历顺序无关）
+    with recorder.span("kill_all_numbering"):
+        kill_all_numbering(doc)
+
+    with recorder.span("body"):
+        for child in doc.element.body.iterchildren():
+            if child.tag == W_P:
+                _process_paragraph(child, ctx)
+                finish_element(child, ctx)
+            elif child.tag == W_TBL:
+                _process_table(child, ctx)
+                finish_element(child, ctx)
+    report_counts(ctx, recorder)
+
+    # 只重新序列化正文和样式，图片等其余成员原样复制
+    with recorder.span("save"):
+        return save_document(doc, file_bytes, cleaner_parts(doc))
+
+
+def format_document(doc, profile=None, style_mode=False):
+    """只按格式规则设置正文段落和表格的格式（不做大纲重构和重新编号），返回跳过的样式名集合"""
+    ctx = _DocumentContext(doc.styles, outline_resolver(doc.part), style_mode, load_profile(profile),
+                           style_resolver(doc.part))
+    for child in doc.element.body.iterchildren():
+        if child.tag == W_P:
+            style_name = ctx.style_name_of(child)
+            _format_paragraph(child, style_name, style_name.startswith("Heading"), ctx)
+        elif child.tag == W_TBL:
+            _process_table(child, ctx)
+    return ctx.skipped
+
+
+def report_counts(ctx, recorder):
+    """把一次处理的计数和跳过的样式写入记录器"""
+    for name, n in ctx.counts.items():
+        recorder.count(name, n)
+    recorder.note("skipped_styles", sorted(ctx.skipped))
+
+
+def _refresh_paragraph(p, ctx, old_number):
+    """增量模式下处理与清单一致（已排好版）的段落
+
+    只更新标题计数；序号与上次写入的不同（前面插入或删除了标题）时重新编号并设置格式。
+    """
+    style_name = ctx.style_name_of(p)
+    if not style_name.startswith("Heading"):
+        return None
+    text = p.text
+    if text == "Ellipsis" or not text.strip():
+        return None
+    number_str = _next_heading_number(ctx.heading_level_of(p) - 1, ctx)
+    if number_str != old_number:
+        ctx.renumbered += 1
+        ctx.counts["headings_renumbered"] += 1
+        text = renumber_heading(p, text, number_str, HEADING_NUMBER_PATTERN)
+        if text != "Ellipsis" and text.strip():
+            _format_paragraph(p, style_name, True, ctx)
+    return number_str
+
+
+def process_document_incremental(file_bytes, style_mode=False, profile=None, coalesce=False):
+    """增量处理单个文档，返回保存后的 BytesIO
+
+    与清单（见 incremental.py）中摘要一致的段落和表格不再重新处理，只有内容或样式
+    变化的段落、以及序号因插入/删除而改变的标题会被处理。文档中没有清单或
+    处理规则已变化时退化为完整处理。输出文档中写入新的清单。
+    """
+    recorder = get_recorder()
+    with recorder.span("load"):
+        doc = Document(BytesIO(file_bytes))
+    ctx = _DocumentContext(doc.styles, outline_resolver(doc.part), style_mode, load_profile(profile),
+                           style_resolver(doc.part), coalesce)
+    ctx.reused = ctx.renumbered = ctx.processed = 0
+
+    # 不合并 run 时不计入该选项，与之前写入的清单保持一致
+    fingerprint = (rules_fingerprint(style_mode=style_mode, profile=profile, coalesce=True) if coalesce
+                   else rules_fingerprint(style_mode=style_mode, profile=profile))
+    previous = load_manifest(doc)
+    if previous is None or previous.get("fingerprint") != fingerprint:
+        previous = {"paragraphs": [], "tables": []}
+    known_paragraphs = Counter(digest for digest, _ in previous["paragraphs"])
+    old_numbers = dict(previous["paragraphs"])
+    known_tables = Counter(previous["tables"])
+
+    kill_all_numbering(doc)
+
+    paragraphs = []
+    tables = []
+    with recorder.span("body"):
+        for child in doc.element.body.iterchildren():
+            if child.tag == W_P:
+                digest = element_digest(child)
+                if known_paragraphs[digest] > 0:
+                    known_paragraphs[digest] -= 1
+                    ctx.reused += 1
+                    number_str = _refresh_paragraph(child, ctx, old_numbers[digest])
+                    if number_str != old_numbers[digest]:
+                        finish_element(child, ctx)
+                        digest = element_digest(child)
+                else:
+                    ctx.processed += 1
+                    number_str = _process_paragraph(child, ctx)
+                    finish_element(child, ctx)
+                    digest = element_digest(child)
+                paragraphs.append([digest, number_str])
+            elif child.tag == W_TBL:
+                digest = element_digest(child)
+                if known_tables[digest] > 0:
+                    known_tables[digest] -= 1
+                else:
+                    _process_table(child, ctx)
+                    finish_element(child, ctx)
+                    digest = element_digest(child)
+                tables.append(digest)
+
+    stats = {"reused": ctx.reused, "renumbered": ctx.renumbered, "processed": ctx.processed}
+    manifest_part = save_manifest(doc, {
+        "fingerprint": fingerprint,
+        "paragraphs": paragraphs,
+        "tables": tables,
+        "stats": stats,
+    })
+    report_counts(ctx, recorder)
+    recorder.note("incremental", stats)
+
+    # 只重新序列化正文、样式和清单，图片等其余成员原样复制
+    with recorder.span("save"):
+        return save_document(doc, file_bytes, cleaner_parts(doc) + [manifest_part])
+
+
+def _read_parts(buffer):
+    """读取 docx 包中的全部部件
+
+    ZIP 成员的时间戳每次保存都不同，只比较内容；未修改的 XML 部件是原样复制的，
+    与 doc.save() 重新序列化的结果写法不同，因此 XML 按规范化（C14N）形式比较。
+    """
+    parts = {}
+    with zipfile.ZipFile(buffer) as zf:
+        for name in zf.namelist():
+            data = zf.read(name)
+            if name.endswith((".xml", ".rels")):
+                data = etree.tostring(etree.fromstring(data), method="c14n")
+            parts[name] = data
+    return parts
+
+
+def compare_with_dom(file_bytes, profile=None, coalesce=False):
+    """分别用单次遍历引擎和原有多遍流程处理同一文档，返回内容不一致的部件名列表"""
+    from formatter import process_single_document
+    fast = _read_parts(process_document_fast(file_bytes, profile=profile, coalesce=coalesce))
+    dom = _read_parts(process_single_document(file_bytes, engine="dom", profile=profile, coalesce=coalesce))
+    return sorted(name for name in fast.keys() | dom.keys() if fast.get(name) != dom.get(name))
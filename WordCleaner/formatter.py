@@ -0,0 +1,455 @@
+import weakref
+from collections import Counter
+from io import BytesIO
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml.ns import qn
+from docx.shared import Cm
+from docx.text.paragraph import Paragraph
+
+from instrumentation import get_recorder
+from paragraph_index import ELLIPSIS, EMPTY, HEADING, paragraph_index
+from rules import load_profile
+from heading_numbers import num_to_cn, number_headings
+from run_merge import W_P, coalesce_element
+from run_text import lstrip_paragraph, replace_heading_prefix
+from table_format import iter_cell_paragraphs
+
+W_TBL = qn('w:tbl')
+W_OUTLINE_LVL = qn('w:outlineLvl')
+W_VAL = qn('w:val')
+
+# ========== 预设格式参数 ==========
+# 字体、字号和间距等格式规则见 profiles/default.json（由 rules.py 加载）
+
+# ========== 工具函数定义 ==========
+KNOWN_STYLES = {
+    "Normal",
+    "List Paragraph",
+    "Heading 1", "Heading 2", "Heading 3", "Heading 4",
+    "Heading 5", "Heading 6", "Heading 7", "Heading 8", "Heading 9"
+}
+
+# 清除编号的样式：列表段落和各级标题
+NUMBERED_STYLES = ('List Paragraph', 'Heading 1', 'Heading 2', 'Heading 3',
+                   'Heading 4', 'Heading 5', 'Heading 6', 'Heading 7',
+                   'Heading 8', 'Heading 9')
+
+class OutlineLevelResolver:
+    """大纲级别解析器（每个文档一个）
+
+    直接读取段落的 w:pPr/w:outlineLvl；段落未设置时沿 w:pStyle 及其 w:basedOn
+    样式链查找继承的大纲级别。样式链的结果按样式ID缓存，同一样式只解析一次。
+    """
+
+    def __init__(self, styles_element):
+        self._styles = styles_element
+        self._cache = {}
+
+    def level_of(self, p):
+        """返回段落元素 p 的大纲级别（从1开始），正文级别返回None"""
+        pPr = p.pPr
+        style_id = None
+        if pPr is not None:
+            outline_lvl = pPr.find(W_OUTLINE_LVL)
+            if outline_lvl is not None:
+                return _outline_value(outline_lvl)
+            style_id = pPr.style
+        return self.style_level(style_id)
+
+    def style_level(self, style_id):
+        """返回段落样式（含继承）的大纲级别，style_id为None时取默认段落样式"""
+        try:
+            return self._cache[style_id]
+        except KeyError:
+            pass
+        if style_id is None:
+            style = self._styles.default_for(WD_STYLE_TYPE.PARAGRAPH)
+        else:
+            style = self._styles.get_by_id(style_id)
+            if style is None:
+                style = self._styles.default_for(WD_STYLE_TYPE.PARAGRAPH)
+        level = None
+        seen = set()
+        while style is not None and style.styleId not in seen:
+            seen.add(style.styleId)
+            pPr = style.pPr
+            outline_lvl = pPr.find(W_OUTLINE_LVL) if pPr is not None else None
+            if outline_lvl is not None:
+                level = _outline_value(outline_lvl)
+                break
+            based_on = style.basedOn_val
+            style = self._styles.get_by_id(based_on) if based_on else None
+        self._cache[style_id] = level
+        return level
+
+
+def _outline_value(outline_lvl):
+    """把 w:outlineLvl 的取值（0-8，9表示正文）换算为从1开始的级别"""
+    try:
+        level = int(outline_lvl.get(W_VAL))
+    except (TypeError, ValueError):
+        return None
+    if 0 <= level <= 8:
+        return level + 1
+    return None
+
+
+_outline_resolvers = weakref.WeakKeyDictionary()
+
+def outline_resolver(part):
+    """返回文档部件对应的大纲级别解析器，同一文档复用同一份缓存"""
+    resolver = _outline_resolvers.get(part)
+    if resolver is None:
+        resolver = OutlineLevelResolver(part.styles.element)
+        _outline_resolvers[part] = resolver
+    return resolver
+
+class StyleResolver:
+    """段落样式解析器（每个文档一个）
+
+    p.style.name 每次都要按样式ID在 styles.xml 中查找、构造新的样式代理对象。这里按样式ID
+    缓存样式对象、名称和标题级别，按样式名缓存样式ID。缓存以段落当前的样式ID为键，
+    段落改用其他样式（p.style = ...）后自然按新ID查找，不需要失效；只有新增或改名样式时
+    才需要调用 invalidate。
+    """
+
+    def __init__(self, styles):
+        self._styles = styles
+        self._by_id = {}
+        self._names = {}
+        self._levels = {}
+        self._ids = {}
+
+    def style_of(self, p):
+        """返回段落元素 p 的样式对象（与 Paragraph.style 相同）"""
+        return self.style_by_id(p.style)
+
+    def style_by_id(self, style_id):
+        """按段落的样式ID（p.style）返回样式对象"""
+        try:
+            return self._by_id[style_id]
+        except KeyError:
+            style = self._styles.get_by_id(style_id, WD_STYLE_TYPE.PARAGRAPH)
+            self._by_id[style_id] = style
+            self._names[style_id] = style.name
+            return style
+
+    def name_of(self, p):
+        """返回段落元素 p 的样式名（与 Paragraph.style.name 相同）"""
+        return self.name_by_id(p.style)
+
+    def name_by_id(self, style_id):
+        """按段落的样式ID（p.style）返回样式名"""
+        try:
+            return self._names[style_id]
+        except KeyError:
+            return self.style_by_id(style_id).name
+
+    def heading_level_of(self, p):
+        """返回标题段落的级别（"Heading N" 中的 N），调用方先确认样式名以 Heading 开头"""
+        return self.heading_level_of_id(p.style)
+
+    def heading_level_of_id(self, style_id):
+        """按段落的样式ID（p.style）返回标题级别"""
+        try:
+            return self._levels[style_id]
+        except KeyError:
+            level = int(self.name_by_id(style_id).split(' ')[1])
+            self._levels[style_id] = level
+            return level
+
+    def style_id(self, name):
+        """样式名 -> 赋给 p.style 的样式ID（默认段落样式为None），文档中没有该样式时抛出 KeyError"""
+        try:
+            style_id = self._ids[name]
+        except KeyError:
+            if name in self._styles:
+                style_id = self._styles.get_style_id(self._styles[name], WD_STYLE_TYPE.PARAGRAPH)
+            else:
+                style_id = False
+            self._ids[name] = style_id
+        if style_id is False:
+            raise KeyError(f"no style with name '{name}'")
+        return style_id
+
+    def has_style(self, name):
+        """文档中是否有该名称的样式"""
+        try:
+            self.style_id(name)
+        except KeyError:
+            return False
+        return True
+
+    def invalidate(self):
+        """新增或修改样式定义后清空缓存"""
+        self._by_id.clear()
+        self._names.clear()
+        self._levels.clear()
+        self._ids.clear()
+
+
+_style_resolvers = weakref.WeakKeyDictionary()
+
+def style_resolver(part):
+    """返回文档部件对应的样式解析器，同一文档的各处理步骤共用"""
+    resolver = _style_resolvers.get(part)
+    if resolver is None:
+        resolver = StyleResolver(part.styles)
+        _style_resolvers[part] = resolver
+    return resolver
+
+def get_outline_level_from_xml(p):
+    """获取段落的大纲级别（从1开始），包括从样式链继承的级别"""
+    return outline_resolver(p.part).level_of(p._p)
+
+def restructure_outline(doc, index=None):
+    """重构文档大纲
+
+    index 为该文档的段落索引（paragraph_index.ParagraphIndex），修改时同步更新；
+    不给定时新建。
+    """
+    if index is None:
+        index = paragraph_index(doc)
+    styles = style_resolver(doc.part)
+    outline = outline_resolver(doc.part)
+    for i, p in enumerate(index.paragraphs()):
+        index.set_text(i, zero_indent(p, index.texts[i]))
+        lvl = outline.level_of(p._p)
+        if lvl and index.style_name(i) == "Normal":
+            heading_style = f"Heading {lvl}"
+            if styles.has_style(heading_style):
+                index.set_style(i, heading_style)
+    
+    # 降级空标题
+    flags = index.flags
+    for i in index.heading_indices():
+        if flags[i] & EMPTY:
+            index.set_style(i, "Normal")
+
+def zero_indent(p, text=None):
+    """清除段落缩进，返回删除开头空白后的段落文本（text 为段落当前文本，不给定时读取）"""
+    pf = p.paragraph_format
+    pf.left_indent = Cm(0)
+    pf.first_line_indent = Cm(0)
+    pf.right_indent = Cm(0)
+    pf.tab_stops.clear_all()
+    if text is None:
+        text = p.text
+    if text:
+        return lstrip_paragraph(p._p, text)
+    return text
+
+def kill_all_numbering(doc):
+    """清除所有编号"""
+    kill_style_numbering(doc.styles)
+
+def kill_style_numbering(styles):
+    """清除列表段落和各级标题样式上的编号（styles 为 Styles 代理对象）"""
+    for st_name in NUMBERED_STYLES:
+        try:
+            style = styles[st_name]
+        except KeyError:
+            continue
+        style_el = style._element
+        for num_id in style_el.xpath('.//w:numId'):
+            num_id.getparent().remove(num_id)
+
+def set_font(run, cz_font_name, font_name):
+    """设置字体"""
+    rPr = run.element.get_or_add_rPr()
+    rFonts = rPr.get_or_add_rFonts()
+    rFonts.set(qn('w:eastAsia'), cz_font_name)
+    rFonts.set(qn('w:ascii'), font_name)
+
+def format_heading_number(level, heading_numbers):
+    """根据标题级别（从0开始）和当前计数生成序号，4级及以下标题不编号返回None"""
+    if heading_numbers[level] > 0 and level < 3:
+        if level == 0:
+            # 一级标题：一、
+            return num_to_cn(heading_numbers[0]) + "、"
+        elif level == 1:
+            # 二级标题：（一）
+            return "（" + num_to_cn(heading_numbers[1]) + "）"
+        elif level == 2:
+            # 三级标题：1.
+            return str(heading_numbers[2]) + "."
+        else:
+            # 4级及以上标题：数字序号
+            return str(heading_numbers[level]) + "."
+    return None
+
+def add_heading_numbers_custom(doc, index=None):
+    """添加自定义标题序号（使用预设的中文数字方案），返回处理的标题数
+
+    从段落索引中取全部标题和已识别的原有序号长度，批量计算新序号（见 heading_numbers.py），
+    再逐个写回，不重建 run。index 同 restructure_outline。
+    """
+    if index is None:
+        index = paragraph_index(doc)
+    flags = index.flags
+    headings = [i for i in index.heading_indices() if not flags[i] & (EMPTY | ELLIPSIS)]
+    levels = [index.heading_level(i) - 1 for i in headings]
+    
+    # 清除原有编号并添加序号（只处理1-3级标题）
+    numbers = number_headings(levels, format_heading_number)
+    for i, number_str in zip(headings, numbers):
+        text = replace_heading_prefix(index.elements[i], index.texts[i], index.prefix_ends[i], number_str)
+        index.set_text(i, text)
+    return len(headings)
+
+def process_single_document(file_bytes, engine="fast", style_mode=False, incremental=False, profile=None,
+                            coalesce=False):
+    """处理单个文档
+
+    engine="fast" 使用单次遍历的 lxml 引擎（见 fast_engine.py），
+    engine="dom" 使用下面的多遍 python-docx 流程，两者输出逐字节一致。
+    engine="stream" 使用流式引擎（见 streaming_engine.py），内存占用与文档大小基本无关，
+    适合超大文档，不支持的结构自动退回 "fast" 引擎。
+    style_mode=True 时把格式写入样式定义而不是逐个 run 设置，"dom" 引擎不支持。
+    incremental=True 时只处理相对上次输出有变化的段落（见 incremental.py），"dom" 引擎不支持；
+    "stream" 引擎的增量模式由 "fast" 引擎完成。
+    profile 为格式规则名或规则文件路径（见 rules.py），默认为 profiles/default.json。
+    coalesce=True 时最后合并格式相同的相邻 run、删除空 run（见 run_merge.py），
+    合并前后的 run 数记为 runs_before_coalesce / runs_after_coalesce。
+    各阶段耗时和段落、run、表格等计数写入当前记录器（见 instrumentation.py）。
+    """
+    recorder = get_recorder()
+    recorder.count("bytes_in", len(file_bytes))
+    with recorder.span(f"process.{engine}"):
+        buffer = _run_engine(file_bytes, engine, style_mode, incremental, profile, coalesce)
+    recorder.count("bytes_out", buffer.getbuffer().nbytes)
+    return buffer
+
+def _run_engine(file_bytes, engine, style_mode, incremental, profile, coalesce=False):
+    """按引擎名称分派处理"""
+    if engine in ("fast", "stream") and incremental:
+        from fast_engine import process_document_incremental
+        return process_document_incremental(file_bytes, style_mode=style_mode, profile=profile, coalesce=coalesce)
+    if engine == "fast":
+        from fast_engine import process_document_fast
+        return process_document_fast(file_bytes, style_mode=style_mode, profile=profile, coalesce=coalesce)
+    if engine == "stream":
+        from streaming_engine import process_document_streaming
+        return process_document_streaming(file_bytes, style_mode=style_mode, profile=profile, coalesce=coalesce)
+    if engine != "dom":
+        raise ValueError(f"未知的处理引擎: {engine}")
+    if style_mode or incremental:
+        raise ValueError("dom 引擎不支持样式模式和增量模式")
+
+    recorder = get_recorder()
+    with recorder.span("load"):
+        doc = Document(BytesIO(file_bytes))
+    # 各步骤共用的段落索引
+    with recorder.span("paragraph_index"):
+        index = paragraph_index(doc)
+    if recorder.enabled:
+        recorder.count("paragraphs", len(index))
+        recorder.count("tables", len(doc.tables))
+    
+    # 重构大纲
+    with recorder.span("restructure_outline"):
+        restructure_outline(doc, index)
+    
+    # 清除编号
+    with recorder.span("kill_all_numbering"):
+        kill_all_numbering(doc)
+    
+    # 添加标题序号
+    with recorder.span("add_heading_numbers_custom"):
+        recorder.count("headings_renumbered", add_heading_numbers_custom(doc, index))
+    
+    # 应用预设格式
+    with recorder.span("apply_preset_format"):
+        skipped = apply_preset_format(doc, load_profile(profile), index)
+    recorder.note("skipped_styles", sorted(skipped))
+    
+    # 合并格式相同的 run
+    if coalesce:
+        with recorder.span("coalesce_runs"):
+            coalesce_document(doc, recorder)
+    
+    # 保存到buffer
+    with recorder.span("save"):
+        buffer = BytesIO()
+        doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def coalesce_document(doc, recorder):
+    """合并正文段落和表格中格式相同的相邻 run，合并前后的 run 数写入记录器"""
+    counts = Counter()
+    for child in doc.element.body.iterchildren(W_P, W_TBL):
+        coalesce_element(child, counts)
+    for name, n in counts.items():
+        recorder.count(name, n)
+
+def apply_preset_format(doc, profile, index=None):
+    """按格式规则（rules.RuleProfile）设置正文、标题和表格格式，返回跳过的样式名集合
+
+    index 同 restructure_outline。
+    """
+    if index is None:
+        index = paragraph_index(doc)
+    skipped = set()
+    styles = style_resolver(doc.part)
+    flags = index.flags
+    
+    for i, p in enumerate(index.paragraphs()):
+        if flags[i] & (EMPTY | ELLIPSIS):
+            continue
+        
+        style_name = index.style_name(i)
+        if profile.skip_unknown_styles and style_name not in KNOWN_STYLES:
+            skipped.add(style_name)
+            continue
+        
+        if flags[i] & HEADING:
+            level = index.heading_level(i)
+            if level in profile.headings:
+                rule = profile.headings[level]
+                style_format = styles.style_of(p._p).paragraph_format
+                style_format.space_before = rule.space_before
+                style_format.space_after = rule.space_after
+                if rule.line_spacing is not None:
+                    style_format.line_spacing = rule.line_spacing
+                if rule.first_line_indent is not None:
+                    style_format.first_line_indent = rule.first_line_indent
+                for run in p.runs:
+                    set_font(run, rule.cz_font_name, rule.font_name)
+                    run.font.size = rule.font_size
+                    if rule.bold is not None:
+                        run.font.bold = rule.bold
+        else:
+            # 正文格式
+            body_rule = profile.body
+            p.paragraph_format.space_before = body_rule.space_before
+            p.paragraph_format.space_after = body_rule.space_after
+            if body_rule.line_spacing is not None:
+                p.paragraph_format.line_spacing = body_rule.line_spacing
+            if body_rule.first_line_indent is not None:
+                p.paragraph_format.first_line_indent = body_rule.first_line_indent
+            for run in p.runs:
+                set_font(run, body_rule.cz_font_name, body_rule.font_name)
+                run.font.size = body_rule.font_size
+    
+    # 表格格式
+    table_rule = profile.table
+    for tbl in doc.tables:
+        # 直接遍历单元格元素，每个单元格只处理一次，包括嵌套表格
+        for p_el in iter_cell_paragraphs(tbl._tbl):
+            if profile.table_normal_only:
+                style_name = styles.name_of(p_el)
+                if style_name != "Normal":
+                    skipped.add(f"表格内：{style_name}")
+                    continue
+            p = Paragraph(p_el, tbl)
+            for run in p.runs:
+                set_font(run, table_rule.cz_font_name, table_rule.font_name)
+                run.font.size = table_rule.font_size
+            p.paragraph_format.space_before = table_rule.space_before
+            p.paragraph_format.space_after = table_rule.space_after
+            if table_rule.line_spacing is not None:
+                p.paragraph_format.line_spacing = table_rule.line_spacing
+    
+    return skipped
@@ -0,0 +1,227 @@
+"""单个文档的资源限制（超时、内存上限、压缩炸弹检测）
+
+一份异常的文档（超大表格、极深的嵌套、高度压缩的 document.xml）可能让处理持续
+几分钟甚至耗尽内存。run_governed 在处理前检查包中各部件解压后的大小和压缩比，
+然后在单独的子进程中处理：父进程每隔 POLL_INTERVAL 秒检查耗时和子进程的常驻内存
+（RSS），超过上限时终止子进程并抛出 ResourceLimitExceeded。批量处理时受影响的只是
+这一个文档，进程池和其余文档照常进行。
+
+子进程优先用 fork 创建，继承父进程已导入的模块、已编译的规则和预热的状态，
+启动开销很小。RSS 从 /proc 读取，没有 /proc 的系统上只限制耗时。
+检查的是 ZIP 目录中记录的大小；zipfile 解压时不会输出超过记录大小的数据，
+记录被篡改的成员会在读取时因 CRC 校验失败而报错。
+"""
+import os
+import time
+import zipfile
+from collections import namedtuple
+from io import BytesIO
+
+from instrumentation import TraceRecorder, get_recorder, use_recorder
+
+MB = 1024 * 1024
+
+# 资源上限，None 表示不限制：
+#   max_parts        包中的成员数
+#   max_part_bytes   单个成员解压后的字节数
+#   max_total_bytes  全部成员解压后的总字节数
+#   max_ratio        单个成员的压缩比（解压后 / 压缩后），只检查解压后不小于 RATIO_MIN_BYTES 的成员
+#   timeout          处理耗时（秒）
+#   max_rss_bytes    处理进程的常驻内存
+# timeout 和 max_rss_bytes 都为None 时不创建子进程，只做包检查
+Limits = namedtuple("Limits", [
+    "max_parts", "max_part_bytes", "max_total_bytes", "max_ratio", "timeout", "max_rss_bytes",
+], defaults=(10000, 512 * MB, 2048 * MB, 200, 300, 2048 * MB))
+
+DEFAULT_LIMITS = Limits()
+UNLIMITED = Limits(None, None, None, None, None, None)
+
+# 小成员的压缩比没有参考意义（如几 KB 的重复样式），不检查
+RATIO_MIN_BYTES = 1 * MB
+
+# 父进程检查耗时和内存的间隔（秒）
+POLL_INTERVAL = 0.05
+
+
+class ResourceLimitExceeded(Exception):
+    """文档超过资源上限
+
+    code 为机器可读的原因：too_many_parts、part_too_large、package_too_large、
+    compression_ratio、timeout、memory、worker_died；limit 和 actual 为上限和实际值。
+    """
+
+    def __init__(self, code, message, limit=None, actual=None):
+        super().__init__(message)
+        self.code = code
+        self.limit = limit
+        self.actual = actual
+
+    def __reduce__(self):
+        return type(self), (self.code, str(self), self.limit, self.actual)
+
+
+def check_package(file_bytes, limits=DEFAULT_LIMITS):
+    """按 ZIP 目录检查各成员解压后的大小和压缩比，超限时抛出 ResourceLimitExceeded
+
+    返回全部成员解压后的总字节数；不是有效 ZIP 时返回None，留给处理流程报告错误。
+    """
+    try:
+        with zipfile.ZipFile(BytesIO(file_bytes)) as zf:
+            infos = zf.infolist()
+    except zipfile.BadZipFile:
+        return None
+    return check_members(infos, limits)
+
+
+def check_members(infos, limits=DEFAULT_LIMITS):
+    """检查 ZIP 成员（zipfile.ZipInfo 列表）的个数、解压后的大小和压缩比，超限时抛出
+    ResourceLimitExceeded，返回解压后的总字节数
+
+    也用于解压外层 ZIP 中的文档之前（见 zip_batch.extract_documents）。
+    """
+    if limits.max_parts is not None and len(infos) > limits.max_parts:
+        raise ResourceLimitExceeded(
+            "too_many_parts", f"包中有 {len(infos)} 个成员，超过 {limits.max_parts} 个的上限",
+            limits.max_parts, len(infos))
+    total = 0
+    for info in infos:
+        size = info.file_size
+        total += size
+        if limits.max_part_bytes is not None and size > limits.max_part_bytes:
+            raise ResourceLimitExceeded(
+                "part_too_large", f"{info.filename} 解压后 {size // MB} MB，超过 {limits.max_part_bytes // MB} MB 的上限",
+                limits.max_part_bytes, size)
+        if (limits.max_ratio is not None and size >= RATIO_MIN_BYTES
+                and size > limits.max_ratio * max(info.compress_size, 1)):
+            ratio = round(size / max(info.compress_size, 1), 1)
+            raise ResourceLimitExceeded(
+                "compression_ratio", f"{info.filename} 的压缩比为 {ratio}，超过 {limits.max_ratio} 的上限（疑似压缩炸弹）",
+                limits.max_ratio, ratio)
+    if limits.max_total_bytes is not None and total > limits.max_total_bytes:
+        raise ResourceLimitExceeded(
+            "package_too_large", f"包解压后共 {total // MB} MB，超过 {limits.max_total_bytes // MB} MB 的上限",
+            limits.max_total_bytes, total)
+    return total
+
+
+def rss_bytes(pid=None):
+    """进程（默认为当前进程）当前的常驻内存（字节），无法读取时返回None"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _child(conn, func, file_bytes, options, trace):
+    """子进程：处理文档，把 (结果字节, 异常, 记录) 发回父进程"""
+    recorder = TraceRecorder() if trace else get_recorder()
+    data = error = None
+    with use_recorder(recorder):
+        try:
+            result = func(file_bytes, **options)
+            data = result.getvalue() if hasattr(result, "getvalue") else bytes(result)
+        except Exception as e:
+            error = e
+    record = recorder.to_dict() if trace else None
+    try:
+        conn.send((data, error, record))
+    except Exception:
+        # 异常对象无法序列化时只传回类型和信息
+        conn.send((None, RuntimeError(f"{type(error).__name__}: {error}"), record))
+    conn.close()
+
+
+def _context():
+    """优先用 fork 创建子进程（继承已导入的模块和预热状态）"""
+    # 命令行启动时只需要本模块的参数定义，multiprocessing 在处理时才导入
+    import multiprocessing
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def run_governed(func, file_bytes, options=None, limits=DEFAULT_LIMITS):
+    """在资源上限内处理一个文档，返回 (处理后的字节, 处理进程的峰值常驻内存)；
+    超限时抛出 ResourceLimitExceeded
+
+    func 与 batch.process_batch 的处理函数相同。处理函数本身抛出的异常原样抛出。
+    不创建子进程或无法读取 RSS 时峰值为None。子进程的计时和计数合并到当前记录器，
+    另记 uncompressed_bytes 和 peak_rss_bytes。
+    """
+    options = options or {}
+    recorder = get_recorder()
+    total = check_package(file_bytes, limits)
+    if total is not None:
+        recorder.count("uncompressed_bytes", total)
+    if limits.timeout is None and limits.max_rss_bytes is None:
+        result = func(file_bytes, **options)
+        return (result.getvalue() if hasattr(result, "getvalue") else bytes(result)), None
+
+    ctx = _context()
+    receiver, sender = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_child, args=(sender, func, file_bytes, options, recorder.enabled), daemon=True)
+    start = time.perf_counter()
+    process.start()
+    sender.close()
+    peak = 0
+    try:
+        while not receiver.poll(POLL_INTERVAL):
+            elapsed = time.perf_counter() - start
+            if limits.timeout is not None and elapsed > limits.timeout:
+                raise ResourceLimitExceeded(
+                    "timeout", f"处理超过 {limits.timeout} 秒的上限，已终止", limits.timeout, round(elapsed, 2))
+            rss = rss_bytes(process.pid)
+            if rss is not None:
+                peak = max(peak, rss)
+                if limits.max_rss_bytes is not None and rss > limits.max_rss_bytes:
+                    raise ResourceLimitExceeded(
+                        "memory", f"处理占用内存 {rss // MB} MB，超过 {limits.max_rss_bytes // MB} MB 的上限，已终止",
+                        limits.max_rss_bytes, rss)
+            # 子进程可能在 poll 之后刚发出结果并退出
+            if not process.is_alive() and not receiver.poll():
+                raise ResourceLimitExceeded(
+                    "worker_died", f"处理进程异常退出（退出码 {process.exitcode}）", None, process.exitcode)
+        try:
+            data, error, record = receiver.recv()
+        except EOFError:
+            process.join()
+            raise ResourceLimitExceeded(
+                "worker_died", f"处理进程异常退出（退出码 {process.exitcode}）", None, process.exitcode) from None
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        process.close()
+        receiver.close()
+    if record is not None:
+        recorder.merge(record, offset=start)
+    if peak:
+        recorder.count("peak_rss_bytes", peak)
+    if error is not None:
+        raise error
+    return data, peak or None
+
+
+def add_limit_arguments(parser):
+    """命令行和服务共用的资源上限参数"""
+    group = parser.add_argument_group("资源上限")
+    group.add_argument("--timeout", type=float, default=DEFAULT_LIMITS.timeout,
+                       help=f"单个文档的处理时间上限（秒），默认 {DEFAULT_LIMITS.timeout}")
+    group.add_argument("--max-memory-mb", type=int, default=DEFAULT_LIMITS.max_rss_bytes // MB,
+                       help=f"处理单个文档的内存上限（MB），默认 {DEFAULT_LIMITS.max_rss_bytes // MB}")
+    group.add_argument("--max-part-mb", type=int, default=DEFAULT_LIMITS.max_part_bytes // MB,
+                       help=f"包中单个部件解压后的大小上限（MB），默认 {DEFAULT_LIMITS.max_part_bytes // MB}")
+    group.add_argument("--no-limits", action="store_true", help="不检查包大小，也不限制处理时间和内存")
+
+
+def limits_from_args(args):
+    """add_limit_arguments 的参数 -> Limits"""
+    if args.no_limits:
+        return UNLIMITED
+    return DEFAULT_LIMITS._replace(
+        timeout=args.timeout,
+        max_rss_bytes=args.max_memory_mb * MB,
+        max_part_bytes=args.max_part_mb * MB,
+    )
@@ -0,0 +1,104 @@
+"""标题序号：原有序号的识别、新序号的生成
+
+原有做法在遍历段落时对每个标题单独做一次正则替换，并与修改文档交错进行。
+这里分成两个可以单独测试和计时的批量步骤：
+prefix_lengths 一次识别全部标题文本开头的原有序号；
+number_headings 根据标题级别序列一次算出全部新序号。之后再统一修改文档。
+"""
+import re
+
+# 使用中文数字编号方案（计入处理规则指纹，见 result_cache.py）
+NUMBERING_SCHEME = "方案一：中文数字"
+
+CN_DIGITS = "零一二三四五六七八九"
+_CN_UNITS = ("", "十", "百", "千")
+_CN_SECTIONS = ("", "万", "亿", "万亿")
+
+# 一个序号片段：
+#   多级阿拉伯数字（1.2.3），后面是分隔符或不接文字，"2.5D建模"、"1.5倍行距"不是序号；
+#   至多3位的数字加分隔符（12. 3、），"20240101 会议纪要"不是序号；
+#   以上两种的分隔符为"."时后面不能紧接数字（"1.2.3标题"不会只识别出"1.2."）；
+#   中文数字加分隔符（一、 二））；
+#   带圈/带括号/带点的数字（①-⑳、⑴-⒇、⒈-⒛，本身就是分隔的，后面的分隔符可省略）
+_NUMBER_TOKEN = (
+    r'(?:\d{1,3}(?:[\.．]\d{1,3})+(?:[、）)\s]|[\.．](?!\d)|(?![\w\.．]))'
+    r'|\d{1,3}(?:[、）)\s]|[\.．](?!\d))'
+    r'|[一二三四五六七八九十百千万零〇]{1,8}[\.．、）)\s]'
+    r'|[①-⒛][\.．、\s]?)'
+)
+
+# 匹配标题开头的原有序号，如"一、"、"（二）"、"1.2.3"、"①"、"一百零一、"
+HEADING_NUMBER_PATTERN = re.compile(
+    r'^\s*'
+    r'[（(]?' + _NUMBER_TOKEN +
+    r'(?:[（(]?' + _NUMBER_TOKEN + r')*',
+    re.UNICODE
+)
+
+
+def prefix_lengths(texts, pattern=HEADING_NUMBER_PATTERN):
+    """识别全部标题文本开头的原有序号，返回各自的长度（没有序号为0）
+
+    pattern 从文本开头匹配（pattern.match）。用 map 在 C 层逐个匹配：把全部文本用分隔符连接后做一次
+    finditer 扫描实测更慢（引擎要在每个分隔符处重新开始匹配，并额外构造偏移表）。
+    """
+    return [match.end() if match else 0 for match in map(pattern.match, texts)]
+
+
+def num_to_cn(num):
+    """非负整数转中文数字，如 10 -> 十、105 -> 一百零五、10010 -> 一万零一十"""
+    if num < 0:
+        raise ValueError(f"不能转换负数: {num}")
+    if num < 10:
+        return CN_DIGITS[num]
+    sections = []
+    while num:
+        sections.append(num % 10000)
+        num //= 10000
+    result = ""
+    pending_zero = False
+    for index in range(len(sections) - 1, -1, -1):
+        section = sections[index]
+        if section == 0:
+            pending_zero = bool(result)
+            continue
+        if result and (pending_zero or section < 1000):
+            result += "零"
+        result += _section_to_cn(section) + _CN_SECTIONS[index]
+        pending_zero = False
+    # 十至十九以及十万等读作"十……"而不是"一十……"
+    if result.startswith("一十"):
+        result = result[1:]
+    return result
+
+
+def _section_to_cn(section):
+    """1-9999 转中文数字，中间的零读一次，如 1005 -> 一千零五"""
+    result = ""
+    zero = False
+    for power in (3, 2, 1, 0):
+        digit = section // 10 ** power % 10
+        if digit == 0:
+            zero = bool(result)
+            continue
+        if zero:
+            result += "零"
+            zero = False
+        result += CN_DIGITS[digit] + _CN_UNITS[power]
+    return result
+
+
+def number_headings(levels, format_number):
+    """根据标题级别序列（从0开始）一次算出全部新序号
+
+    format_number(level, heading_numbers) 返回该标题的序号字符串或None，
+    heading_numbers 为更新后的各级计数。
+    """
+    heading_numbers = [0] * 9
+    numbers = []
+    for level in levels:
+        heading_numbers[level] += 1
+        for i in range(level + 1, len(heading_numbers)):
+            heading_numbers[i] = 0
+        numbers.append(format_number(level, heading_numbers))
+    return numbers
@@ -0,0 +1,84 @@
+"""增量处理的清单（manifest）
+
+增量模式在输出文档中保存一份清单：每个正文段落处理后的内容摘要和写入的序号，
+以及每个表格的内容摘要。文档稍作修改后再次处理时，摘要与清单一致的段落
+已经是排好版的状态，只需重新计算标题序号；序号没有变化时完全跳过。
+
+清单以 JSON 保存在文档的 customXml 部件中，随文档一起流转。摘要对属性排序并
+忽略 rsid、拼写检查标记等 Word 保存时会变化的内容，尽量在 Word 中编辑保存后保持稳定。
+"""
+import hashlib
+import json
+import re
+from lxml import etree
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import Part
+
+MANIFEST_VERSION = 1
+MANIFEST_NS = "urn:wordcleaner:manifest"
+MANIFEST_TAG = f"{{{MANIFEST_NS}}}manifest"
+
+# Word 每次保存都可能变化的内容，不参与摘要：rsid 属性、拼写检查标记、上次渲染的分页位置
+_VOLATILE = re.compile(
+    rb' w:rsid\w*="[^"]*"'
+    rb'|<w:proofErr\b[^>]*>(?:</w:proofErr>)?'
+    rb'|<w:lastRenderedPageBreak\b[^>]*>(?:</w:lastRenderedPageBreak>)?'
+)
+
+
+def element_digest(el):
+    """段落或表格元素的内容摘要
+
+    基于排他式 C14N 序列化（属性按名称排序，只保留用到的命名空间声明），
+    去掉易变内容后求哈希。
+    """
+    data = etree.tostring(el, method="c14n", exclusive=True)
+    return hashlib.blake2b(_VOLATILE.sub(b"", data), digest_size=12).hexdigest()
+
+
+def _find_manifest_rel(doc):
+    """找到保存清单的 customXml 关系，没有时返回None"""
+    for rel in doc.part.rels.values():
+        if rel.reltype != RT.CUSTOM_XML or rel.is_external:
+            continue
+        try:
+            root = etree.fromstring(rel.target_part.blob)
+        except etree.XMLSyntaxError:
+            continue
+        if root.tag == MANIFEST_TAG:
+            return rel, root
+    return None
+
+
+def load_manifest(doc):
+    """读取文档中保存的清单，没有或版本不符时返回None"""
+    found = _find_manifest_rel(doc)
+    if found is None:
+        return None
+    try:
+        manifest = json.loads(found[1].text or "")
+    except ValueError:
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(doc, manifest):
+    """把清单写入文档（替换已有的清单部件），返回新的清单部件
+
+    新部件可能沿用旧清单的部件名，用 package_io.save_document 保存时必须把它列入
+    modified_parts，否则会按部件名从源包复制旧清单。
+    """
+    found = _find_manifest_rel(doc)
+    if found is not None:
+        doc.part.drop_rel(found[0].rId)
+    root = etree.Element(MANIFEST_TAG, nsmap={None: MANIFEST_NS})
+    root.text = json.dumps(dict(manifest, version=MANIFEST_VERSION), ensure_ascii=False, separators=(",", ":"))
+    blob = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+    package = doc.part.package
+    partname = package.next_partname("/customXml/item%d.xml")
+    part = Part(PackURI(partname), "application/xml", blob, package)
+    doc.part.relate_to(part, RT.CUSTOM_XML)
+    return part
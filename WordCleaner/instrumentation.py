@@ -0,0 +1,111 @@
+"""处理过程的计时与计数（可插拔）
+
+处理流程通过 get_recorder() 取得当前记录器，用 span() 记录各阶段耗时，用 count()
+累加段落数、run 数等计数，用 note() 记录跳过的样式等附加信息。默认记录器
+什么也不做，开销可以忽略；需要诊断时用 use_recorder(TraceRecorder()) 包住一次
+处理，之后用 to_dict() 取得 JSON 可序列化的记录。
+
+记录器保存在 contextvars 中，Streamlit 的多个会话线程互不影响；
+多进程批量处理时由 batch.py 在工作进程中创建记录器并随结果返回。
+"""
+import contextlib
+import contextvars
+import time
+
+
+class NullRecorder:
+    """默认记录器：不记录任何内容"""
+
+    enabled = False
+
+    def span(self, name):
+        """返回计时上下文；默认记录器不计时"""
+        return contextlib.nullcontext()
+
+    def count(self, name, n=1):
+        """累加计数"""
+
+    def note(self, name, value):
+        """记录附加信息"""
+
+    def merge(self, record, offset=None):
+        """并入另一个记录器的 to_dict() 结果（如子进程中的记录）"""
+
+
+class TraceRecorder(NullRecorder):
+    """把计时区间、计数和附加信息记录在内存中"""
+
+    enabled = True
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._depth = 0
+        self.spans = []
+        self.counters = {}
+        self.notes = {}
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """记录一个阶段的开始时间和耗时；阶段可以嵌套，出错时同样记录"""
+        start = time.perf_counter()
+        self._depth += 1
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self._depth -= 1
+            span = {
+                "name": name,
+                "start": round(start - self._origin, 6),
+                "seconds": round(time.perf_counter() - start, 6),
+                "depth": self._depth,
+            }
+            if error is not None:
+                span["error"] = error
+            self.spans.append(span)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def note(self, name, value):
+        self.notes[name] = value
+
+    def merge(self, record, offset=None):
+        """offset 为对方记录器开始记录时的 perf_counter() 值，用于换算阶段的开始时间"""
+        shift = 0.0 if offset is None else offset - self._origin
+        depth = self._depth
+        for span in record["spans"]:
+            self.spans.append(dict(span, start=round(span["start"] + shift, 6), depth=span["depth"] + depth))
+        for name, n in record["counters"].items():
+            self.count(name, n)
+        self.notes.update(record["notes"])
+
+    def to_dict(self):
+        """按开始时间排序的计时区间、计数和附加信息"""
+        return {
+            "spans": sorted(self.spans, key=lambda span: (span["start"], span["depth"])),
+            "counters": dict(self.counters),
+            "notes": dict(self.notes),
+        }
+
+
+_NULL_RECORDER = NullRecorder()
+_current = contextvars.ContextVar("wordcleaner_recorder", default=_NULL_RECORDER)
+
+
+def get_recorder():
+    """当前上下文的记录器，未设置时为不记录的默认记录器"""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def use_recorder(recorder):
+    """在 with 块内把 recorder 设为当前记录器"""
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
@@ -0,0 +1,498 @@
+"""后台任务队列（供 Streamlit 页面使用）
+
+页面脚本线程只负责提交任务和轮询状态，文档在所有会话共享的进程池中处理，
+处理期间页面保持可响应。排队的任务总数和每个会话的未完成任务数都有上限，
+超过时 submit 抛出 QueueFull，由页面提示用户稍后再试。
+
+上传的文档和处理结果都不整份留在内存中：submit 接收文件对象时分块复制，
+不超过 spool_threshold 字节的留在内存，更大的写入暂存目录，工作进程按路径读取，
+任务结束后删除。处理结果写入 ResultStore 的磁盘目录，下载时按文件读取或由
+静态文件服务直接提供（result_path），过期（ttl）或会话清空结果列表（forget）时删除；
+Streamlit 没有会话结束的通知，没有清空的结果靠 ttl 过期删除。pack_results 在后台线程中把一批
+结果按完成顺序逐个写入同一目录下的 ZIP，同样按 ttl 过期。
+"""
+import hashlib
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from batch import default_workers, run_one
+from formatter import process_single_document
+from governor import rss_bytes
+from result_cache import cache_key, rules_fingerprint
+from zip_batch import write_results_zip
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+# 任务状态快照：id、会话、文件名、状态、出错信息、处理耗时、是否来自结果缓存、
+# 提交时间（time.time()）、诊断记录、超过资源上限时的原因（见 governor.py）、
+# 输入和结果的字节数、处理进程的峰值常驻内存（未限制资源时为None）
+JobStatus = namedtuple(
+    "JobStatus", ["id", "session", "name", "state", "error", "seconds", "cached", "submitted", "trace",
+                  "error_code", "input_bytes", "output_bytes", "peak_rss"]
+)
+
+# 上传文档留在内存中的上限（字节），更大的写入暂存目录
+SPOOL_THRESHOLD = 8 * 1024 * 1024
+_COPY_CHUNK = 1024 * 1024
+
+
+def _remove(path):
+    """删除暂存的上传文件（None 表示没有暂存）"""
+    if path is not None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class QueueFull(Exception):
+    """任务队列已满或该会话的未完成任务过多"""
+
+
+def spool_source(fileobj, directory, threshold=SPOOL_THRESHOLD):
+    """分块复制文件对象的内容，返回 (内容, SHA-256)
+
+    不超过 threshold 字节时内容为 bytes；更大时写入 directory 下的临时文件，内容为文件路径。
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    out = None
+    try:
+        while True:
+            chunk = fileobj.read(_COPY_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            if out is None and len(buffer) + len(chunk) <= threshold:
+                buffer += chunk
+                continue
+            if out is None:
+                out = tempfile.NamedTemporaryFile(dir=directory, suffix=".docx", delete=False)
+                out.write(buffer)
+                buffer = None
+            out.write(chunk)
+    except BaseException:
+        if out is not None:
+            out.close()
+            os.remove(out.name)
+        raise
+    if out is None:
+        return bytes(buffer), digest.hexdigest()
+    out.close()
+    return out.name, digest.hexdigest()
+
+
+class ResultStore:
+    """按过期时间和总字节数淘汰的结果存储（线程安全）
+
+    结果写入 directory 下新建的临时目录，内存中只保存文件路径和大小；
+    存储对象被回收或进程退出时删除该目录。文件名是随机的，不能由其他结果的名称推出，
+    目录可以作为静态文件目录对外提供（见 path）。
+
+    :param ttl: 结果保存的秒数，过期后 get / open 返回None
+    :param max_bytes: 所有结果最多占用的磁盘字节数，超过时先淘汰最早写入的结果
+    :param directory: 临时目录的上级目录，默认为系统临时目录
+    """
+
+    def __init__(self, ttl=3600, max_bytes=4 * 1024 * 1024 * 1024, directory=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = tempfile.mkdtemp(prefix="wordcleaner-results-", dir=directory)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def new_path(self, suffix=".docx"):
+        """存储目录中一个新文件的路径，写完后用 add_file 加入存储"""
+        return os.path.join(self.directory, f"{uuid.uuid4().hex}{suffix}")
+
+    def put(self, key, data):
+        # 在锁外写文件，写入大结果时不阻塞其他会话读取
+        path = self.new_path()
+        with open(path, "wb") as f:
+            f.write(data)
+        self.add_file(key, path)
+
+    def add_file(self, key, path):
+        """把已写入存储目录（new_path）的文件作为 key 的结果加入存储"""
+        size = os.path.getsize(path)
+        with self._lock:
+            self._discard(key)
+            self._items[key] = (path, size, time.monotonic() + self.ttl)
+            self._size += size
+            self._evict()
+
+    def open(self, key):
+        """以二进制只读方式打开结果文件，不存在或已过期时返回None
+
+        打开的文件在之后被淘汰时仍可读完（POSIX 上删除不影响已打开的文件）。
+        """
+        with self._lock:
+            self._evict()
+            item = self._items.get(key)
+            if item is None:
+                return None
+            return open(item[0], "rb")
+
+    def path(self, key):
+        """结果文件的路径，不存在或已过期时返回None；文件在过期后删除，调用方不要长期持有"""
+        with self._lock:
+            self._evict()
+            item = self._items.get(key)
+            return item[0] if item is not None else None
+
+    def get(self, key):
+        """返回结果字节，不存在或已过期时返回None"""
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def size(self, key):
+        """结果的字节数，不存在或已过期时返回None"""
+        with self._lock:
+            self._evict()
+            item = self._items.get(key)
+            return item[1] if item is not None else None
+
+    def discard(self, key):
+        """删除一个结果"""
+        with self._lock:
+            self._discard(key)
+
+    def expire(self):
+        """删除已过期的结果（其他方法访问存储时也会删除）"""
+        with self._lock:
+            self._evict()
+
+    def stored_bytes(self):
+        with self._lock:
+            return self._size
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def close(self):
+        """删除全部结果和临时目录"""
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+        self._finalizer()
+
+    def _discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._size -= item[1]
+            try:
+                os.remove(item[0])
+            except OSError:
+                pass
+
+    def _evict(self):
+        """删除过期的结果，并在超过容量时删除最早写入的结果（调用方持有锁）"""
+        now = time.monotonic()
+        while self._items:
+            key, (path, size, expires) = next(iter(self._items.items()))
+            if expires > now and self._size <= self.max_bytes:
+                break
+            self._discard(key)
+
+
+class _Job:
+    __slots__ = ("id", "session", "name", "state", "error", "seconds", "cached", "submitted",
+                 "finished", "future", "cache_key", "trace", "error_code", "spooled", "input_bytes",
+                 "output_bytes", "peak_rss")
+
+    def __init__(self, job_id, session, name):
+        self.id = job_id
+        self.session = session
+        self.name = name
+        self.state = QUEUED
+        self.error = None
+        self.seconds = 0.0
+        self.cached = False
+        self.submitted = time.time()
+        self.finished = None
+        self.future = None
+        self.cache_key = None
+        self.trace = None
+        self.error_code = None
+        self.spooled = None
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.peak_rss = None
+
+    def status(self):
+        state = self.state
+        if state == QUEUED and self.future is not None and self.future.running():
+            state = RUNNING
+        return JobStatus(self.id, self.session, self.name, state, self.error, self.seconds,
+                         self.cached, self.submitted, self.trace, self.error_code, self.input_bytes,
+                         self.output_bytes, self.peak_rss)
+
+
+class JobManager:
+    """所有会话共享的任务管理器
+
+    :param max_workers: 进程数，默认按CPU核数
+    :param max_pending: 所有会话合计最多未完成的任务数
+    :param max_per_session: 每个会话最多未完成的任务数
+    :param store: 保存处理结果的 ResultStore，任务状态与结果同样在过期后清除
+    :param cache: 可选的 ResultCache，命中的文档不再排队
+    :param func: 处理函数，接收文档字节和选项，必须是模块顶层函数
+    :param limits: 单个文档的资源上限（governor.Limits），超时或内存超限的文档记为出错，
+        不影响进程池中的其他任务；None 表示不限制
+    :param spool_threshold: 以文件对象提交的文档留在内存中的上限（字节），更大的写入暂存目录
+    """
+
+    def __init__(self, max_workers=None, max_pending=100, max_per_session=20, store=None, cache=None,
+                 func=process_single_document, limits=None, spool_threshold=SPOOL_THRESHOLD):
+        self.max_workers = max_workers or default_workers(max_pending)
+        self.max_pending = max_pending
+        self.max_per_session = max_per_session
+        self.store = store if store is not None else ResultStore()
+        self.cache = cache
+        self.func = func
+        self.limits = limits
+        self.spool_threshold = spool_threshold
+        self._spool_dir = tempfile.mkdtemp(prefix="wordcleaner-uploads-")
+        self._spool_finalizer = weakref.finalize(self, shutil.rmtree, self._spool_dir, True)
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # 任务结束或被清除时通知等待的打包线程
+        self._changed = threading.Condition(self._lock)
+        self._packs = {}
+        self._executor = None
+
+    def _get_executor(self):
+        """返回进程池；工作进程异常退出导致进程池损坏后重新创建（调用方持有锁）"""
+        if self._executor is None or getattr(self._executor, "_broken", False):
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, session, name, data, trace=False, **options):
+        """提交一个文档，返回任务ID；队列已满时抛出 QueueFull
+
+        data 为文档字节或可读的文件对象（如上传的文件、ZIP 成员），文件对象按 spool_threshold
+        暂存（见 spool_source），调用方之后可以关闭它。结果缓存命中时任务直接完成，不占用队列名额。
+        """
+        digest = None
+        if hasattr(data, "read"):
+            data, digest = spool_source(data, self._spool_dir, self.spool_threshold)
+        spooled = data if isinstance(data, str) else None
+        input_bytes = os.path.getsize(spooled) if spooled else len(data)
+        try:
+            key = None
+            if self.cache is not None:
+                key = cache_key(data, rules_fingerprint(self.func, **options), digest)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    with self._lock:
+                        job = self._new_job(session, name)
+                        job.state, job.cached, job.finished = DONE, True, time.time()
+                        job.input_bytes, job.output_bytes = input_bytes, len(cached)
+                    self.store.put(job.id, cached)
+                    _remove(spooled)
+                    return job.id
+
+            with self._lock:
+                self._expire()
+                pending = [job for job in self._jobs.values() if job.state == QUEUED]
+                if len(pending) >= self.max_pending:
+                    raise QueueFull(f"任务队列已满（{self.max_pending} 个），请稍后再试")
+                if sum(1 for job in pending if job.session == session) >= self.max_per_session:
+                    raise QueueFull(f"每个会话最多同时处理 {self.max_per_session} 个文档，请等待当前文档完成")
+                job = self._new_job(session, name)
+                job.cache_key = key
+                job.spooled = spooled
+                job.input_bytes = input_bytes
+                job.future = self._get_executor().submit(run_one, self.func, job.id, data, options, trace,
+                                                         self.limits)
+        except BaseException:
+            _remove(spooled)
+            raise
+        job.future.add_done_callback(lambda future, job=job: self._finish(job, future))
+        return job.id
+
+    def _new_job(self, session, name):
+        job = _Job(next(self._ids), session, name)
+        self._jobs[job.id] = job
+        return job
+
+    def _finish(self, job, future):
+        """任务完成回调：结果写入存储和结果缓存，更新状态"""
+        _remove(job.spooled)
+        error_code = peak_rss = None
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            error, data, seconds, trace = f"工作进程异常退出: {e}", None, 0.0, None
+        except Exception as e:
+            error, data, seconds, trace = f"{type(e).__name__}: {e}", None, 0.0, None
+        else:
+            error, data, seconds, trace = result.error, result.data, result.seconds, result.trace
+            error_code, peak_rss = result.error_code, result.peak_rss
+        if data is not None:
+            self.store.put(job.id, data)
+            if self.cache is not None and job.cache_key is not None:
+                self.cache.put(job.cache_key, data)
+        with self._lock:
+            job.error = error
+            job.error_code = error_code
+            job.peak_rss = peak_rss
+            job.output_bytes = len(data) if data is not None else 0
+            job.spooled = None
+            job.seconds = seconds
+            job.trace = trace
+            job.finished = time.time()
+            job.state = ERROR if error is not None else DONE
+            job.future = None
+            self._changed.notify_all()
+
+    def _expire(self):
+        """清除结果已过期的已完成任务和打包结果，删除过期的结果文件（调用方持有锁）"""
+        self.store.expire()
+        deadline = time.time() - self.store.ttl
+        for job_id in [job.id for job in self._jobs.values() if job.finished is not None and job.finished < deadline]:
+            del self._jobs[job_id]
+        for key in [key for key, thread in self._packs.items() if thread is None and self.store.size(key) is None]:
+            del self._packs[key]
+
+    def jobs(self, session):
+        """返回该会话所有任务的状态快照，按提交顺序排列"""
+        with self._lock:
+            self._expire()
+            return [job.status() for job in self._jobs.values() if job.session == session]
+
+    def result(self, job_id):
+        """返回已完成任务的结果字节，未完成、出错或已过期时返回None"""
+        return self.store.get(job_id)
+
+    def open_result(self, job_id):
+        """以只读文件打开已完成任务的结果（不整份读入内存），未完成、出错或已过期时返回None"""
+        return self.store.open(job_id)
+
+    def result_path(self, job_id):
+        """已完成任务（或 pack_results 的 ZIP）的结果文件路径，未完成、出错或已过期时返回None"""
+        return self.store.path(job_id)
+
+    def forget(self, session):
+        """删除该会话已结束的任务及其结果文件（清空结果列表时调用；没有清空的按 ttl 过期删除）"""
+        with self._lock:
+            job_ids = [job.id for job in self._jobs.values()
+                       if job.session == session and job.state in (DONE, ERROR)]
+            for job_id in job_ids:
+                del self._jobs[job_id]
+            packs = [key for key in self._packs if key[1] == session]
+            for key in packs:
+                del self._packs[key]
+            self._changed.notify_all()
+        for key in job_ids + packs:
+            self.store.discard(key)
+
+    def as_finished(self, job_ids):
+        """按完成顺序逐个产出这些任务的状态快照，等待未结束的任务；已清除的任务跳过"""
+        remaining = list(job_ids)
+        while remaining:
+            with self._changed:
+                while True:
+                    finished = [job_id for job_id in remaining
+                                if job_id not in self._jobs or self._jobs[job_id].finished is not None]
+                    if finished:
+                        break
+                    self._changed.wait()
+                statuses = [self._jobs[job_id].status() for job_id in finished if job_id in self._jobs]
+            remaining = [job_id for job_id in remaining if job_id not in finished]
+            yield from statuses
+
+    def pack_results(self, session, job_ids):
+        """在后台线程中把这些任务的结果按完成顺序逐个写入 ZIP（最后写入 manifest.json），
+        返回该 ZIP 的结果键
+
+        ZIP 写在 ResultStore 的目录中，全部写完后才能用 open_result 取得，之后与其他结果
+        一样按 ttl 过期。同一批任务重复调用时不重新打包。
+        """
+        key = ("zip", session, tuple(job_ids))
+        with self._lock:
+            self._expire()
+            if key in self._packs:
+                return key
+            thread = threading.Thread(target=self._write_pack, args=(key, job_ids), daemon=True,
+                                      name="wordcleaner-pack")
+            self._packs[key] = thread
+        thread.start()
+        return key
+
+    def packing(self, key):
+        """pack_results 返回的 ZIP 是否仍在写入"""
+        with self._lock:
+            return self._packs.get(key) is not None
+
+    def _write_pack(self, key, job_ids):
+        def results():
+            for job in self.as_finished(job_ids):
+                data = self.open_result(job.id) if job.state == DONE else None
+                error = job.error if job.state == ERROR else (None if data is not None else "结果已过期")
+                yield job.name, data, {
+                    "status": "ok" if data is not None else "error",
+                    "error": error,
+                    "error_code": job.error_code,
+                    "seconds": round(job.seconds, 4),
+                    "cached": job.cached,
+                    "input_bytes": job.input_bytes,
+                    "peak_rss_bytes": job.peak_rss,
+                }
+
+        path = self.store.new_path(".zip")
+        try:
+            with open(path, "wb") as f:
+                write_results_zip(results(), f)
+            with self._lock:
+                # 打包期间会话已清空结果列表时不再加入存储
+                if key in self._packs:
+                    self.store.add_file(key, path)
+                    path = None
+        finally:
+            with self._lock:
+                if key in self._packs:
+                    self._packs[key] = None
+            _remove(path)
+
+    def stats(self):
+        """队列状态：排队中、处理中、已完成的任务数，结果占用的磁盘字节数和本进程的常驻内存"""
+        with self._lock:
+            statuses = [job.status().state for job in self._jobs.values()]
+        return {
+            "queued": statuses.count(QUEUED),
+            "running": statuses.count(RUNNING),
+            "done": statuses.count(DONE),
+            "error": statuses.count(ERROR),
+            "stored_results": len(self.store),
+            "stored_bytes": self.store.stored_bytes(),
+            "rss_bytes": rss_bytes(),
+            "max_pending": self.max_pending,
+            "workers": self.max_workers,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        self._spool_finalizer()
@@ -0,0 +1,149 @@
+"""零拷贝保存 docx 包
+
+doc.save() 会把包中的每个部件重新序列化、重新压缩，图片和嵌入对象多的报告
+大部分时间都花在重新压缩媒体文件上。save_document 只重新序列化修改过的
+XML 部件，其余 ZIP 成员（图片、字体、嵌入对象以及未修改的 XML）按压缩后的
+原始字节从源文件直接复制，既不解压也不重新压缩。
+"""
+import copy
+import struct
+import zipfile
+from io import BytesIO
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.part import XmlPart
+from docx.opc.pkgwriter import _ContentTypesItem
+
+_COPY_CHUNK = 1024 * 1024
+_DATA_DESCRIPTOR_FLAG = 0x08
+
+
+def _copy_member(src, info, dst):
+    """把 src 中的一个成员按压缩后的原始字节写入 dst
+
+    直接操作 zipfile 的 fp/filelist/NameToInfo/start_dir，这些属性在各个
+    Python 版本中保持不变；zipfile 没有公开的原样复制接口。
+    """
+    fp = src.fp
+    fp.seek(info.header_offset)
+    header = fp.read(zipfile.sizeFileHeader)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    fp.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+
+    new = copy.copy(info)
+    # CRC 和大小已知，直接写在本地文件头中，不再使用数据描述符
+    new.flag_bits &= ~_DATA_DESCRIPTOR_FLAG
+    new.extra = b""
+    new.header_offset = dst.fp.tell()
+    dst.fp.write(new.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        chunk = fp.read(min(_COPY_CHUNK, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"成员 {info.filename} 数据不完整")
+        dst.fp.write(chunk)
+        remaining -= len(chunk)
+    dst.filelist.append(new)
+    dst.NameToInfo[new.filename] = new
+    dst.start_dir = dst.fp.tell()
+    dst._didModify = True
+
+
+def cleaner_parts(doc):
+    """排版流程会修改的部件：正文部件（含其关系）和样式部件"""
+    return [doc.part, doc.part.part_related_by(RT.STYLES)]
+
+
+def save_document(doc, source, modified_parts=None, out=None):
+    """把文档保存为 docx，未修改的成员从源包原样复制
+
+    :param doc: 由 source 打开的 Document
+    :param source: 源 docx 的字节或可 seek 的文件对象
+    :param modified_parts: 内容或关系修改过的部件，None 表示所有 XML 部件都重新序列化；
+        源包中没有的新部件总是写入
+    :param out: 输出文件对象，默认新建 BytesIO
+    :return: 输出文件对象（已 seek 到开头）
+    """
+    package = doc.part.package
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    if out is None:
+        out = BytesIO()
+
+    parts = list(package.iter_parts())
+    for part in parts:
+        part.before_marshal()
+    if modified_parts is None:
+        dirty = {id(part) for part in parts if isinstance(part, XmlPart)}
+    else:
+        dirty = {id(part) for part in modified_parts}
+
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        existing = {info.filename: info for info in src.infolist()}
+        partnames = {part.partname.membername for part in parts}
+        source_partnames = {
+            name for name in existing
+            if name != CONTENT_TYPES_URI.membername and "_rels/" not in name
+        }
+
+        # 部件集合不变时内容类型也不变
+        if partnames == source_partnames and CONTENT_TYPES_URI.membername in existing:
+            _copy_member(src, existing[CONTENT_TYPES_URI.membername], dst)
+        else:
+            dst.writestr(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(parts).blob)
+
+        pkg_rels_name = PACKAGE_URI.rels_uri.membername
+        if pkg_rels_name in existing:
+            _copy_member(src, existing[pkg_rels_name], dst)
+        else:
+            dst.writestr(pkg_rels_name, package.rels.xml)
+
+        for part in parts:
+            name = part.partname.membername
+            changed = id(part) in dirty or name not in existing
+            if changed:
+                dst.writestr(name, part.blob)
+            else:
+                _copy_member(src, existing[name], dst)
+            if len(part.rels):
+                rels_name = part.partname.rels_uri.membername
+                if changed or rels_name not in existing:
+                    dst.writestr(rels_name, part.rels.xml)
+                else:
+                    _copy_member(src, existing[rels_name], dst)
+
+    out.seek(0)
+    return out
+
+
+def rewrite_package(source, writers, out=None):
+    """逐个写出源包的成员：writers 中的成员由对应函数流式写入，其余成员原样复制
+
+    适合部件本身很大、不能整体载入内存的情况，不经过 python-docx。
+
+    :param source: 源 docx 的字节或可 seek 的文件对象
+    :param writers: [(成员名, 函数)] 列表，函数签名为 func(src, fp)，src 为源
+        ZipFile，fp 为该成员的可写文件对象；这些成员按列表顺序写在其中第一个
+        成员原来的位置
+    :param out: 输出文件对象，默认新建 BytesIO
+    :return: 输出文件对象（已 seek 到开头）
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    if out is None:
+        out = BytesIO()
+    names = {name for name, _ in writers}
+
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        written = False
+        for info in src.infolist():
+            if info.filename not in names:
+                _copy_member(src, info, dst)
+            elif not written:
+                written = True
+                for name, func in writers:
+                    with dst.open(name, "w") as fp:
+                        func(src, fp)
+
+    out.seek(0)
+    return out
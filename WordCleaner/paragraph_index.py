@@ -0,0 +1,147 @@
+"""正文段落的紧凑索引
+
+"dom" 流程的 restructure_outline、add_heading_numbers_custom 和 apply_preset_format
+原来各自遍历 doc.paragraphs，每一步都重新构造 Paragraph 代理对象，并反复读取
+p.text（每次都用 XPath 拼接全部 run）和样式名来判断标题级别、是否为空、是否为
+"Ellipsis" 占位段落。ParagraphIndex 每个文档只建一次，用平行数组保存这些事实：
+
+    elements     段落元素（CT_P），与 doc.paragraphs 的顺序相同
+    texts        段落文本（与 Paragraph.text 相同）
+    style_ids    样式ID（默认段落样式为None）
+    levels       bytearray：标题级别（"Heading N" 中的 N），不是标题为0
+    flags        bytearray：HEADING / EMPTY / ELLIPSIS 标志位
+    prefix_ends  array('I')：标题文本开头原有序号的长度（见 heading_numbers），非标题为0
+
+各步骤修改段落时通过 set_style / set_text 同步更新索引，后面的步骤直接读取，
+不再访问 python-docx 代理对象。也可以单独用于分析和测试：records() 逐段返回
+ParagraphRecord。
+"""
+from array import array
+from collections import namedtuple
+
+from docx.text.paragraph import Paragraph
+
+from heading_numbers import HEADING_NUMBER_PATTERN, prefix_lengths
+
+# flags 中的标志位
+HEADING = 1   # 样式名以 "Heading" 开头
+EMPTY = 2     # 去掉空白后没有文字
+ELLIPSIS = 4  # 文本恰为 "Ellipsis"（不处理的占位段落）
+
+# 一个段落的索引记录（records() 返回），字段含义见模块说明
+ParagraphRecord = namedtuple("ParagraphRecord", [
+    "index", "style_id", "style_name", "heading_level", "empty", "ellipsis", "prefix_end", "text",
+])
+
+
+def _text_flags(text):
+    if not text.strip():
+        return EMPTY
+    if text == "Ellipsis":
+        return ELLIPSIS
+    return 0
+
+
+class ParagraphIndex:
+    """正文段落的紧凑索引（每个文档一个）
+
+    :param elements: 段落元素序列（通常为 w:body 直属的 w:p）
+    :param styles: 该文档的 formatter.StyleResolver
+    :param parent: 构造 Paragraph 代理对象时使用的父对象（如 doc._body）
+    """
+
+    __slots__ = ("elements", "texts", "style_ids", "levels", "flags", "prefix_ends", "_styles", "_parent")
+
+    def __init__(self, elements, styles, parent=None):
+        self._styles = styles
+        self._parent = parent
+        self.elements = list(elements)
+        self.texts = [p.text for p in self.elements]
+        self.style_ids = [p.style for p in self.elements]
+        n = len(self.elements)
+        self.levels = bytearray(n)
+        self.flags = bytearray(_text_flags(text) for text in self.texts)
+        self.prefix_ends = array('I', [0]) * n
+        headings = [i for i in range(n) if self._update_style(i)]
+        for i, end in zip(headings, prefix_lengths([self.texts[i] for i in headings])):
+            self.prefix_ends[i] = end
+
+    def __len__(self):
+        return len(self.elements)
+
+    def _update_style(self, i):
+        """按 style_ids[i] 更新 HEADING 标志和标题级别，返回是否为标题"""
+        name = self._styles.name_by_id(self.style_ids[i])
+        if not name.startswith("Heading"):
+            self.flags[i] &= ~HEADING
+            self.levels[i] = 0
+            return False
+        self.flags[i] |= HEADING
+        try:
+            self.levels[i] = self._styles.heading_level_of_id(self.style_ids[i])
+        except (ValueError, IndexError):
+            # 名称不是 "Heading N" 的样式：heading_level 时再抛出，与直接读取样式名时一致
+            self.levels[i] = 0
+        return True
+
+    def _update_prefix(self, i):
+        if self.flags[i] & HEADING:
+            match = HEADING_NUMBER_PATTERN.match(self.texts[i])
+            self.prefix_ends[i] = match.end() if match else 0
+        else:
+            self.prefix_ends[i] = 0
+
+    def paragraph(self, i):
+        """第 i 段的 Paragraph 代理对象（每次新建，不保存）"""
+        return Paragraph(self.elements[i], self._parent)
+
+    def paragraphs(self):
+        """按顺序逐个产出 Paragraph 代理对象"""
+        parent = self._parent
+        for p in self.elements:
+            yield Paragraph(p, parent)
+
+    def style_name(self, i):
+        return self._styles.name_by_id(self.style_ids[i])
+
+    def heading_level(self, i):
+        """第 i 段的标题级别，调用方先确认是标题（flags 含 HEADING）"""
+        return self.levels[i] or self._styles.heading_level_of_id(self.style_ids[i])
+
+    def heading_indices(self):
+        """标题段落的下标列表"""
+        flags = self.flags
+        return [i for i in range(len(flags)) if flags[i] & HEADING]
+
+    def set_style(self, i, name):
+        """把第 i 段改用样式 name（文档中必须有该样式），同步更新索引"""
+        style_id = self._styles.style_id(name)
+        self.elements[i].style = style_id
+        self.style_ids[i] = style_id
+        self._update_style(i)
+        self._update_prefix(i)
+
+    def set_text(self, i, text):
+        """第 i 段的文本已改为 text（由调用方修改文档），同步更新索引"""
+        if text == self.texts[i]:
+            return
+        self.texts[i] = text
+        self.flags[i] = (self.flags[i] & HEADING) | _text_flags(text)
+        self._update_prefix(i)
+
+    def records(self):
+        """逐段产出 ParagraphRecord"""
+        for i in range(len(self.elements)):
+            flags = self.flags[i]
+            yield ParagraphRecord(
+                i, self.style_ids[i], self.style_name(i), self.levels[i] if flags & HEADING else 0,
+                bool(flags & EMPTY), bool(flags & ELLIPSIS), self.prefix_ends[i], self.texts[i],
+            )
+
+
+def paragraph_index(doc):
+    """为文档正文（与 doc.paragraphs 相同的段落）建立索引"""
+    from formatter import style_resolver
+
+    body = doc._body
+    return ParagraphIndex(body._element.p_lst, style_resolver(doc.part), body)
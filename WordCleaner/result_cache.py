@@ -0,0 +1,168 @@
+"""按内容寻址的处理结果缓存
+
+缓存键 = 输入字节的 SHA-256 + 处理规则指纹（格式规则内容、NUMBERING_SCHEME、
+处理函数和选项）。两级存储：进程内的 LRU 内存层和带容量上限的磁盘层，
+磁盘层按最近使用时间淘汰。同一份模板反复上传时直接返回已保存的结果。
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from heading_numbers import NUMBERING_SCHEME
+from rules import profile_source
+
+# 处理逻辑变化导致同样输入的输出不同时，修改此版本号使旧缓存失效
+CACHE_VERSION = 3
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "WORDCLEANER_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "wordcleaner"),
+)
+
+
+def rules_fingerprint(func=None, **options):
+    """处理规则指纹：格式规则、编号方案、处理函数和选项任一变化都会得到不同的指纹
+
+    选项中的 profile（规则名或规则文件路径）按规则内容计入，规则文件修改后指纹随之变化。
+    func 也可以是 "模块.函数名" 字符串（见 batch.DEFAULT_FUNC），与传入该函数得到的指纹相同。
+    """
+    if func is not None and not isinstance(func, str):
+        func = f"{func.__module__}.{func.__qualname__}"
+    payload = {
+        "version": CACHE_VERSION,
+        "styles": profile_source(options.get("profile")),
+        "numbering": NUMBERING_SCHEME,
+        "func": func,
+        "options": options,
+    }
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cache_key(file_bytes, fingerprint, digest=None):
+    """输入内容哈希与规则指纹组合成的缓存键
+
+    digest 为已经算好的输入 SHA-256（十六进制，如暂存上传文件时边复制边计算），给定时不读取 file_bytes。
+    """
+    if digest is None:
+        digest = hashlib.sha256(file_bytes).hexdigest()
+    return hashlib.sha256(f"{digest}:{fingerprint}".encode("ascii")).hexdigest()
+
+
+class ResultCache:
+    """两级结果缓存（线程安全）
+
+    :param directory: 磁盘层目录，None 表示只用内存层
+    :param memory_items: 内存层最多保存的结果个数
+    :param memory_bytes: 内存层最多占用的字节数
+    :param disk_bytes: 磁盘层最多占用的字节数
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, memory_items=64,
+                 memory_bytes=256 * 1024 * 1024, disk_bytes=2 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.docx")
+
+    def get(self, key):
+        """返回缓存的结果字节，未命中返回None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+        if self.directory:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                # 更新修改时间，磁盘层据此按最近使用淘汰
+                os.utime(path)
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        """保存处理结果到内存层和磁盘层"""
+        with self._lock:
+            self._remember(key, data)
+        if self.directory and len(data) <= self.disk_bytes:
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return
+            self._evict_disk()
+
+    def _remember(self, key, data):
+        """写入内存层并按个数和字节数淘汰最久未用的结果（调用方持有锁）"""
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while len(self._memory) > self.memory_items or self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        """磁盘层超过容量上限时删除最久未用的文件"""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".docx")]
+            stats = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in entries]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in sorted(stats):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        """命中/未命中计数"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_size,
+            }
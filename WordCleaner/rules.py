@@ -0,0 +1,285 @@
+"""格式规则文件（JSON / YAML）的加载与编译
+
+一份规则文件描述一套排版格式：各级标题、正文和表格的中英文字体、字号、粗体、
+段前段后、行距和首行缩进。内置规则放在 profiles/ 目录下（default.json 为网页版
+和命令行使用的预设格式，wordcleaner.json 为 WordCleaner.py 脚本的格式），
+也可以传入任意规则文件的路径。YAML 文件需要安装 PyYAML。
+
+字号的单位为磅；段前段后和首行缩进写成带单位的字符串（"12pt"、"0.75cm"、
+"0.5in"、"5mm"），写数字时按磅计；行距为倍数。
+
+规则文件只加载一次，编译成不可变的 FormatRule：长度值预先换算成 Length 对象，
+run 属性（w:rPr）和段落属性（w:pPr）预先生成 XML 片段。设置格式时把片段
+复制合并到 run 和段落上（apply_run_format / apply_paragraph_format），
+结果与逐个调用 python-docx 的属性设置相同。
+"""
+import json
+import os
+from collections import namedtuple
+from copy import deepcopy
+from types import MappingProxyType
+
+# python-docx 只在编译规则时导入：命令行计算缓存指纹（profile_source）和列出规则时不需要它，
+# 全部命中缓存的运行不必付出导入 python-docx 的启动开销
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+DEFAULT_PROFILE = "default"
+
+# 规则中的字段：必填字段、可选字段
+_REQUIRED_FIELDS = ("cz_font_name", "font_name", "font_size", "space_before", "space_after")
+_OPTIONAL_FIELDS = ("bold", "line_spacing", "first_line_indent")
+
+# 合并片段时保留目标元素上其他属性的元素（其余元素整体替换），以及合并前需要先删除的属性
+# （与 python-docx 设置首行缩进时同时清除悬挂缩进一致）；均为 w: 命名空间下的本地名
+_MERGED_TAGS = {
+    "rFonts": (),
+    "spacing": (),
+    "ind": ("firstLine", "hanging"),
+}
+
+# 一条编译后的格式规则；字号、间距和缩进为 Length 对象，未设置的可选字段为None，
+# rpr / ppr 为预先生成的 run / 段落属性片段
+FormatRule = namedtuple("FormatRule", [
+    "cz_font_name", "font_name", "font_size", "bold",
+    "space_before", "space_after", "line_spacing", "first_line_indent",
+    "rpr", "ppr",
+])
+
+# 编译后的规则文件：headings 为 {级别: FormatRule}；skip_unknown_styles 为 True 时只设置
+# 正文、列表段落和标题样式的格式；table_normal_only 为 True 时表格中只设置 Normal 段落；
+# source 为规范化的规则文本，用于计算处理规则指纹
+RuleProfile = namedtuple("RuleProfile", [
+    "name", "headings", "body", "table", "skip_unknown_styles", "table_normal_only", "source",
+])
+
+# 片段中的一个子元素：标签、元素、按 schema 顺序插入的方法、合并前删除的属性（None 表示整体替换）
+_Fragment = namedtuple("_Fragment", ["tag", "element", "insert", "clear"])
+
+
+def _length(value, field):
+    """把 "12pt"、"0.75cm" 或数字（磅）换算成 Length"""
+    from docx.shared import Cm, Inches, Mm, Pt
+
+    if isinstance(value, bool):
+        raise ValueError(f"{field} 应为长度，例如 \"12pt\" 或 \"0.75cm\"")
+    if isinstance(value, (int, float)):
+        return Pt(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        for unit, factory in (("pt", Pt), ("cm", Cm), ("mm", Mm), ("in", Inches)):
+            if text.endswith(unit):
+                try:
+                    return factory(float(text[:-len(unit)]))
+                except ValueError:
+                    break
+    raise ValueError(f"{field} 应为长度，例如 \"12pt\" 或 \"0.75cm\"，实际为 {value!r}")
+
+
+def _number(value, field):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{field} 应为数字，实际为 {value!r}")
+    return value
+
+
+def _fragments(parent):
+    """把预先生成的 w:rPr / w:pPr 拆成可合并的子元素片段"""
+    from docx.oxml.ns import qn
+
+    fragments = []
+    for child in parent:
+        local_name = child.tag.split('}')[1]
+        clear = _MERGED_TAGS.get(local_name)
+        if clear is not None:
+            clear = tuple(qn(f"w:{attr}") for attr in clear)
+        fragments.append(_Fragment(
+            child.tag, child, getattr(type(parent), "_insert_" + local_name), clear,
+        ))
+    return tuple(fragments)
+
+
+def compile_rule(spec, field):
+    """把规则文件中的一条规则编译成 FormatRule，字段缺失或取值不合法时抛出 ValueError"""
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    from docx.shared import Pt
+    from docx.text.font import Font
+    from docx.text.parfmt import ParagraphFormat
+
+    if not isinstance(spec, dict):
+        raise ValueError(f"{field} 应为对象")
+    unknown = set(spec) - set(_REQUIRED_FIELDS) - set(_OPTIONAL_FIELDS)
+    if unknown:
+        raise ValueError(f"{field} 含有未知字段: {', '.join(sorted(unknown))}")
+    missing = [name for name in _REQUIRED_FIELDS if name not in spec]
+    if missing:
+        raise ValueError(f"{field} 缺少字段: {', '.join(missing)}")
+
+    bold = spec.get("bold")
+    if bold is not None and not isinstance(bold, bool):
+        raise ValueError(f"{field}.bold 应为 true 或 false")
+    line_spacing = spec.get("line_spacing")
+    first_line_indent = spec.get("first_line_indent")
+    values = {
+        "cz_font_name": str(spec["cz_font_name"]),
+        "font_name": str(spec["font_name"]),
+        "font_size": Pt(_number(spec["font_size"], f"{field}.font_size")),
+        "bold": bold,
+        "space_before": _length(spec["space_before"], f"{field}.space_before"),
+        "space_after": _length(spec["space_after"], f"{field}.space_after"),
+        "line_spacing": None if line_spacing is None else _number(line_spacing, f"{field}.line_spacing"),
+        "first_line_indent": (None if first_line_indent is None
+                              else _length(first_line_indent, f"{field}.first_line_indent")),
+    }
+
+    # 用 python-docx 在空白元素上设置一次，得到与逐个设置完全相同的属性片段
+    r = OxmlElement('w:r')
+    rFonts = r.get_or_add_rPr().get_or_add_rFonts()
+    rFonts.set(qn('w:eastAsia'), values["cz_font_name"])
+    rFonts.set(qn('w:ascii'), values["font_name"])
+    font = Font(r)
+    font.size = values["font_size"]
+    if bold is not None:
+        font.bold = bold
+
+    p = OxmlElement('w:p')
+    pf = ParagraphFormat(p)
+    pf.space_before = values["space_before"]
+    pf.space_after = values["space_after"]
+    if values["line_spacing"] is not None:
+        pf.line_spacing = values["line_spacing"]
+    if values["first_line_indent"] is not None:
+        pf.first_line_indent = values["first_line_indent"]
+
+    return FormatRule(rpr=_fragments(r.rPr), ppr=_fragments(p.pPr), **values)
+
+
+def _canonical(data):
+    """规范化的规则文本，用于计算处理规则指纹"""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True)
+
+
+def compile_profile(data, name):
+    """把规则文件的内容（字典）编译成 RuleProfile"""
+    if not isinstance(data, dict):
+        raise ValueError(f"规则 {name} 应为对象")
+    headings_spec = data.get("headings", {})
+    if not isinstance(headings_spec, dict):
+        raise ValueError(f"规则 {name} 的 headings 应为对象")
+    headings = {}
+    for level, spec in headings_spec.items():
+        try:
+            number = int(level)
+        except (TypeError, ValueError):
+            number = 0
+        if not 1 <= number <= 9:
+            raise ValueError(f"规则 {name} 的标题级别应为1-9，实际为 {level!r}")
+        headings[number] = compile_rule(spec, f"headings.{level}")
+    for key in ("body", "table"):
+        if key not in data:
+            raise ValueError(f"规则 {name} 缺少 {key}")
+    return RuleProfile(
+        name=data.get("name", name),
+        headings=MappingProxyType(headings),
+        body=compile_rule(data["body"], "body"),
+        table=compile_rule(data["table"], "table"),
+        skip_unknown_styles=bool(data.get("skip_unknown_styles", True)),
+        table_normal_only=bool(data.get("table_normal_only", True)),
+        source=_canonical(data),
+    )
+
+
+def _profile_path(name):
+    """内置规则名或规则文件路径 -> 文件路径"""
+    if os.path.splitext(name)[1].lower() in (".json", ".yaml", ".yml"):
+        return os.path.abspath(name)
+    path = os.path.join(PROFILE_DIR, f"{name}.json")
+    if not os.path.exists(path):
+        raise ValueError(f"未知的格式规则: {name}（可用: {', '.join(available_profiles())}）")
+    return path
+
+
+def _read_profile(path):
+    """读取规则文件的内容，文件不存在或格式错误时抛出 ValueError"""
+    # JSON 格式错误属于 ValueError；PyYAML 是可选依赖，只有读取 YAML 规则文件时才导入
+    errors = (OSError, ValueError)
+    is_yaml = path.lower().endswith((".yaml", ".yml"))
+    if is_yaml:
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("读取 YAML 规则文件需要安装 PyYAML（pip install pyyaml）") from None
+        errors += (yaml.YAMLError,)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return yaml.safe_load(f) if is_yaml else json.load(f)
+    except errors as e:
+        raise ValueError(f"无法读取格式规则 {path}: {e}") from e
+
+
+def _profile_key(name):
+    """规则的缓存键：文件路径、修改时间和大小"""
+    path = _profile_path(name or DEFAULT_PROFILE)
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise ValueError(f"无法读取格式规则 {path}: {e}") from e
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+_sources = {}
+_profiles = {}
+
+
+def profile_source(name=None):
+    """规则的规范化文本（与 RuleProfile.source 相同），只读取不编译，不需要导入 python-docx"""
+    key = _profile_key(name)
+    source = _sources.get(key)
+    if source is None:
+        source = _sources[key] = _canonical(_read_profile(key[0]))
+    return source
+
+
+def load_profile(name=None):
+    """加载并编译规则（内置规则名或规则文件路径，None 为默认规则），返回 RuleProfile
+
+    编译结果按文件路径和修改时间缓存，同一进程中每份规则只编译一次。
+    """
+    key = _profile_key(name)
+    profile = _profiles.get(key)
+    if profile is None:
+        data = _read_profile(key[0])
+        profile = compile_profile(data, os.path.splitext(os.path.basename(key[0]))[0])
+        _profiles[key] = profile
+        _sources.setdefault(key, profile.source)
+    return profile
+
+
+def available_profiles():
+    """内置规则名列表"""
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+
+
+def _merge(parent, fragments):
+    """把片段复制合并到 parent（w:rPr 或 w:pPr）上"""
+    for tag, element, insert, clear in fragments:
+        existing = parent.find(tag)
+        if existing is None:
+            insert(parent, deepcopy(element))
+        elif clear is None:
+            parent.replace(existing, deepcopy(element))
+        else:
+            attrib = existing.attrib
+            for attr in clear:
+                attrib.pop(attr, None)
+            for attr, value in element.items():
+                attrib[attr] = value
+
+
+def apply_run_format(r, rule):
+    """设置单个 w:r 的中英文字体、字号和粗体"""
+    _merge(r.get_or_add_rPr(), rule.rpr)
+
+
+def apply_paragraph_format(p, rule):
+    """设置单个 w:p 的段前段后、行距和首行缩进"""
+    _merge(p.get_or_add_pPr(), rule.ppr)
@@ -0,0 +1,93 @@
+"""合并格式相同的相邻 run
+
+从网页或其他编辑器粘贴来的段落常被拆成几十个 run（修订标识、语言标记不同等）。
+统一字体和字号之后，这些 run 的格式已经完全相同，却仍各自带一份 w:rPr：
+document.xml 因此膨胀，之后每个逐 run 的循环和下游程序也更慢。
+
+作为可选的最后一步，这里删除空的 w:rPr、没有内容的 run 和空的 w:t，把 w:rPr 相同的
+相邻 run 合并为一个，并把相接的 w:t 合并为一个文字节点。只合并内容全是文字类子元素
+（w:t、w:tab、w:br 等）的 run，含图片、域代码、脚注引用等的 run 保持不变；run 之间有
+书签、批注范围等其他元素时不算相邻。合并的 run 上的修订标识（w:rsidR 等）以第一个 run 为准。
+"""
+from lxml import etree
+from docx.oxml.ns import qn
+
+from run_text import set_t_text
+
+W_P = qn('w:p')
+W_R = qn('w:r')
+W_T = qn('w:t')
+W_RPR = qn('w:rPr')
+W_HYPERLINK = qn('w:hyperlink')
+
+# 可以随 run 合并而移动的内容
+MERGEABLE_TAGS = {
+    W_T, qn('w:tab'), qn('w:br'), qn('w:cr'),
+    qn('w:noBreakHyphen'), qn('w:softHyphen'), qn('w:lastRenderedPageBreak'),
+}
+
+
+def _format_key(rPr):
+    """w:rPr 的规范化形式（C14N 按名称排列属性），相同即格式相同"""
+    return b"" if rPr is None else etree.tostring(rPr, method="c14n")
+
+
+def _append_content(target, content):
+    """把 content 移到 target 末尾，与 target 最后一个 w:t 相接的 w:t 合并"""
+    for child in content:
+        last = target[-1]
+        if child.tag == W_T and last.tag == W_T:
+            set_t_text(last, last.text + child.text)
+        else:
+            target.append(child)
+
+
+def _coalesce_container(container, counts):
+    """合并 container（w:p 或 w:hyperlink）中直属的相邻 run"""
+    previous = previous_key = None
+    for child in list(container):
+        if child.tag != W_R:
+            previous = None
+            continue
+        counts["runs_before_coalesce"] += 1
+        rPr = child.find(W_RPR)
+        if rPr is not None and len(rPr) == 0 and not rPr.attrib:
+            child.remove(rPr)
+            rPr = None
+        content = []
+        for el in list(child):
+            if el.tag == W_T and not el.text:
+                child.remove(el)
+            elif el.tag != W_RPR:
+                content.append(el)
+        if not content:
+            # 空 run 删除后，前后的 run 仍然相邻
+            container.remove(child)
+            continue
+        if not all(el.tag in MERGEABLE_TAGS for el in content):
+            counts["runs_after_coalesce"] += 1
+            previous = None
+            continue
+        key = _format_key(rPr)
+        if previous is not None and key == previous_key:
+            _append_content(previous, content)
+            container.remove(child)
+        else:
+            counts["runs_after_coalesce"] += 1
+            previous, previous_key = child, key
+
+
+def coalesce_runs(p, counts):
+    """合并段落 p（w:p 元素）及其超链接中格式相同的相邻 run
+
+    counts（如 Counter）中累加合并前后的 run 数 runs_before_coalesce / runs_after_coalesce。
+    """
+    _coalesce_container(p, counts)
+    for hyperlink in p.findall(W_HYPERLINK):
+        _coalesce_container(hyperlink, counts)
+
+
+def coalesce_element(el, counts):
+    """合并正文元素（w:p 或 w:tbl）中全部段落的 run，包括表格单元格和文本框中的段落"""
+    for p in list(el.iter(W_P)):
+        coalesce_runs(p, counts)
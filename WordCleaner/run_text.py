@@ -0,0 +1,119 @@
+"""保留 run 结构的段落文字修改
+
+给 Paragraph.text 赋值会删除段落中的全部 run 再重建一个，既有开销，
+也会丢掉行内格式、超链接和书签。这里只修改开头/结尾的文字节点：
+删除的字符可以跨越多个 run，新序号写入第一个文字节点所在的 run。
+"""
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+W_R = qn('w:r')
+W_T = qn('w:t')
+W_RPR = qn('w:rPr')
+XML_SPACE = qn('xml:space')
+
+# 与 CT_R.text 一致，这些子元素会转换为文字
+TEXT_TAGS = {W_T, qn('w:tab'), qn('w:ptab'), qn('w:br'), qn('w:cr'), qn('w:noBreakHyphen')}
+
+
+def text_segments(p):
+    """按文档顺序返回段落 p 中的文字节点列表 [(元素, 对应文本)]
+
+    与 CT_P.text 一致，只包含段落直属 run 和超链接中的 run。
+    """
+    segments = []
+    for r in p.xpath('./w:r | ./w:hyperlink/w:r'):
+        for child in r:
+            if child.tag in TEXT_TAGS:
+                segments.append((child, str(child)))
+    return segments
+
+
+def set_t_text(t, text):
+    """设置 w:t 的文字，首尾有空白时加上 xml:space="preserve\""""
+    t.text = text
+    if text and (text[0].isspace() or text[-1].isspace()):
+        t.set(XML_SPACE, 'preserve')
+
+
+def _remove_segment(el):
+    """删除文字节点，run 因此只剩 rPr 时一并删除"""
+    r = el.getparent()
+    r.remove(el)
+    if r.tag == W_R and all(child.tag == W_RPR for child in r):
+        r.getparent().remove(r)
+
+
+def _strip_segments(segments, count, from_end):
+    """从开头（或结尾）删除 count 个字符"""
+    if from_end:
+        segments = reversed(segments)
+    for el, text in segments:
+        if count <= 0:
+            break
+        if not text:
+            continue
+        if len(text) <= count:
+            count -= len(text)
+            _remove_segment(el)
+        else:
+            # 只有 w:t 可能长于一个字符
+            set_t_text(el, text[:-count] if from_end else text[count:])
+            count = 0
+
+
+def strip_paragraph_text(p, lead, trail=0):
+    """从段落开头删除 lead 个字符、从结尾删除 trail 个字符，保留其余 run 不变"""
+    if lead:
+        _strip_segments(text_segments(p), lead, from_end=False)
+    if trail:
+        _strip_segments(text_segments(p), trail, from_end=True)
+
+
+def prepend_paragraph_text(p, prefix):
+    """在段落第一个文字节点前插入 prefix，沿用该节点所在 run 的格式"""
+    for el, text in text_segments(p):
+        if el.tag == W_T:
+            set_t_text(el, prefix + (el.text or ''))
+            return
+        if text:
+            t = OxmlElement('w:t')
+            el.addprevious(t)
+            set_t_text(t, prefix)
+            return
+    # 段落中没有文字节点：写入第一个 run，没有 run 时新建
+    runs = p.xpath('./w:r | ./w:hyperlink/w:r')
+    r = runs[0] if runs else p.add_r()
+    r.add_t(prefix)
+
+
+def lstrip_paragraph(p, text):
+    """删除段落开头的空白字符（text 为段落当前文本），返回删除后的文本"""
+    stripped = text.lstrip()
+    strip_paragraph_text(p, len(text) - len(stripped))
+    return stripped
+
+
+def renumber_heading(p, text, number_str, pattern):
+    """清除标题开头与 pattern 匹配的原有序号和首尾空白，再写入新序号
+
+    text 为段落当前文本，number_str 为 None 时只清除不写入。返回修改后的文本。
+    """
+    match = pattern.match(text)
+    return replace_heading_prefix(p, text, match.end() if match else 0, number_str)
+
+
+def replace_heading_prefix(p, text, prefix_length, number_str):
+    """删除标题开头 prefix_length 个字符的原有序号和首尾空白，再写入新序号
+
+    原有序号的长度由 heading_numbers.prefix_lengths 批量识别。返回修改后的文本。
+    """
+    body = text[prefix_length:]
+    stripped = body.strip()
+    lead = len(text) - len(body.lstrip())
+    trail = len(body.lstrip()) - len(stripped)
+    strip_paragraph_text(p, lead, trail)
+    if number_str:
+        prepend_paragraph_text(p, number_str)
+        return number_str + stripped
+    return stripped
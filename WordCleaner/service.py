@@ -0,0 +1,312 @@
+"""本地常驻处理服务（HTTP / Unix 套接字）
+
+命令行每次启动都要重新导入 python-docx、lxml 并载入默认模板，处理单个小文档时
+这部分开销比处理本身还大。服务进程启动时预先创建进程池，每个工作进程在
+初始化时导入全部模块、编译格式规则并处理一份空白文档预热，之后的请求直接处理。
+
+用法：
+    python service.py --port 8765                    # 监听 127.0.0.1:8765
+    python service.py --socket /run/wordcleaner.sock # 监听 Unix 套接字
+
+接口：
+    POST /process?engine=fast&style_mode=1&coalesce=1&profile=default
+        请求体为 .docx 字节，成功时返回处理后的 .docx（200）；profile 只接受内置规则名
+        （规则文件路径只能在命令行中使用）。参数错误 400，
+        文档处理失败 422（超过资源上限时 code 为原因，见 governor.py），请求体过大 413，
+        排队已满 503（带 Retry-After）。
+        响应头 X-WordCleaner-Seconds 为处理耗时，X-WordCleaner-Cached 表示结果来自缓存。
+    GET /health
+        返回进程数、排队数和请求计数等状态（JSON）。
+
+示例：
+    curl --data-binary @报告.docx -o 报告_已修改.docx "http://127.0.0.1:8765/process"
+    curl --unix-socket /run/wordcleaner.sock --data-binary @报告.docx -o out.docx http://localhost/process
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from batch import BatchResult, default_workers, run_one
+from formatter import process_single_document
+from governor import DEFAULT_LIMITS, add_limit_arguments, limits_from_args
+from jobs import QueueFull
+from result_cache import DEFAULT_CACHE_DIR, ResultCache, cache_key, rules_fingerprint
+from rules import available_profiles, load_profile
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+ENGINES = ("fast", "dom", "stream")
+_TRUE = ("1", "true", "yes", "on")
+
+
+def _warm_worker():
+    """工作进程初始化：导入各引擎、编译默认规则，并处理一份空白文档（载入默认模板）"""
+    from docx import Document
+    import fast_engine
+    import streaming_engine
+
+    load_profile()
+    buffer = BytesIO()
+    Document().save(buffer)
+    process_single_document(buffer.getvalue())
+
+
+def _ping(barrier):
+    """在屏障处等待其余工作进程，保证每个进程都已创建并完成初始化"""
+    barrier.wait(timeout=300)
+    return os.getpid()
+
+
+class ProcessingService:
+    """常驻进程池：接收文档字节，在预热好的工作进程中处理
+
+    :param max_workers: 进程数，默认按CPU核数
+    :param max_pending: 最多同时排队和处理的请求数，超过时 process 抛出 QueueFull
+    :param cache: 可选的 ResultCache
+    :param limits: 单个文档的资源上限（governor.Limits），超限时只终止该文档的处理子进程
+    """
+
+    def __init__(self, max_workers=None, max_pending=64, cache=None, limits=DEFAULT_LIMITS):
+        self.max_workers = max_workers or default_workers(max_pending)
+        self.max_pending = max_pending
+        self.cache = cache
+        self.limits = limits
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self.counters = {"requests": 0, "succeeded": 0, "failed": 0, "rejected": 0, "cached": 0}
+        self.started = time.time()
+
+    def _get_executor(self):
+        """返回进程池，损坏后重新创建（调用方持有锁）"""
+        if self._executor is None or getattr(self._executor, "_broken", False):
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_warm_worker)
+        return self._executor
+
+    def start(self):
+        """预先创建并预热全部工作进程，返回各进程的 PID"""
+        with self._lock:
+            executor = self._get_executor()
+        with multiprocessing.Manager() as manager:
+            barrier = manager.Barrier(self.max_workers)
+            futures = [executor.submit(_ping, barrier) for _ in range(self.max_workers)]
+            return sorted(future.result() for future in futures)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def process(self, data, options):
+        """处理一个文档，返回 BatchResult；排队已满时抛出 QueueFull"""
+        self._count("requests")
+        key = None
+        if self.cache is not None:
+            key = cache_key(data, rules_fingerprint(process_single_document, **options))
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cached")
+                self._count("succeeded")
+                return BatchResult("request", cached, None, 0.0, cached=True)
+
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise QueueFull(f"排队的请求已达上限（{self.max_pending} 个），请稍后再试")
+        try:
+            with self._lock:
+                self._pending += 1
+                future = self._get_executor().submit(
+                    run_one, process_single_document, "request", data, options, False, self.limits)
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                result = BatchResult("request", None, f"工作进程异常退出: {e}", 0.0)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+        if result.error is None:
+            self._count("succeeded")
+            if key is not None:
+                self.cache.put(key, result.data)
+        else:
+            self._count("failed")
+        return result
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, pending=self._pending, max_pending=self.max_pending,
+                        workers=self.max_workers, uptime=round(time.time() - self.started, 1))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+def parse_options(query):
+    """把查询参数转换为 process_single_document 的选项，取值不合法时抛出 ValueError"""
+    params = {name: values[-1] for name, values in parse_qs(query).items()}
+    unknown = set(params) - {"engine", "style_mode", "incremental", "coalesce", "profile"}
+    if unknown:
+        raise ValueError(f"未知参数: {', '.join(sorted(unknown))}")
+    options = {
+        "engine": params.get("engine", "fast"),
+        "style_mode": params.get("style_mode", "").lower() in _TRUE,
+        "incremental": params.get("incremental", "").lower() in _TRUE,
+    }
+    if params.get("coalesce", "").lower() in _TRUE:
+        options["coalesce"] = True
+    if options["engine"] not in ENGINES:
+        raise ValueError(f"未知的处理引擎: {options['engine']}")
+    if params.get("profile"):
+        # 只接受内置规则名：请求方不能让服务读取本机上的任意文件
+        if params["profile"] not in available_profiles():
+            raise ValueError(f"未知的格式规则: {params['profile']}（可用: {', '.join(available_profiles())}）")
+        options["profile"] = params["profile"]
+    return options
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP 请求处理；service 和 max_bytes 由 make_server 设置"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "WordCleaner"
+    service = None
+    max_bytes = 0
+    quiet = False
+
+    def address_string(self):
+        # Unix 套接字没有客户端地址
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), headers=headers)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            self._send_json(404, {"error": "未知路径"})
+            return
+        self._send_json(200, self.service.stats())
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/process":
+            self.close_connection = True
+            self._send_json(404, {"error": "未知路径"})
+            return
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            self._send_json(411, {"error": "需要 Content-Length"})
+            return
+        length = int(length)
+        if length > self.max_bytes:
+            # 不读取请求体，直接关闭连接
+            self.close_connection = True
+            self._send_json(413, {"error": f"文档超过 {self.max_bytes} 字节的上限"})
+            return
+        data = self.rfile.read(length)
+        try:
+            options = parse_options(url.query)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            result = self.service.process(data, options)
+        except QueueFull as e:
+            self._send_json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+        if result.error is not None:
+            self._send_json(422, {"error": result.error, "code": result.error_code,
+                                  "seconds": round(result.seconds, 4)})
+            return
+        self._send(200, result.data, DOCX_CONTENT_TYPE, headers={
+            "X-WordCleaner-Seconds": f"{result.seconds:.4f}",
+            "X-WordCleaner-Cached": "1" if result.cached else "0",
+        })
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host="127.0.0.1", port=8765, socket_path=None, max_bytes=200 * 1024 * 1024,
+                quiet=False):
+    """创建（未启动的）HTTP 服务器；给定 socket_path 时监听 Unix 套接字，否则监听 host:port"""
+    handler = type("Handler", (ServiceHandler,), {"service": service, "max_bytes": max_bytes, "quiet": quiet})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="wordcleaner-service", description="Word 文档排版常驻服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址，默认只接受本机连接")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--socket", help="改为监听该 Unix 套接字路径")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="工作进程数，默认按CPU核数")
+    parser.add_argument("--max-pending", type=int, default=64, help="最多同时排队和处理的请求数")
+    parser.add_argument("--max-mb", type=int, default=200, help="单个文档的大小上限（MB）")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="结果缓存目录")
+    parser.add_argument("--no-cache", action="store_true", help="不使用结果缓存")
+    parser.add_argument("--quiet", action="store_true", help="不输出访问日志")
+    add_limit_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    service = ProcessingService(args.jobs, args.max_pending, cache, limits_from_args(args))
+    start = time.perf_counter()
+    pids = service.start()
+    server = make_server(service, args.host, args.port, args.socket, args.max_mb * 1024 * 1024, args.quiet)
+    address = args.socket or f"http://{server.server_address[0]}:{server.server_address[1]}"
+    print(f"WordCleaner 服务已启动：{address}（{len(pids)} 个工作进程，预热 {time.perf_counter() - start:.2f} 秒）",
+          file=sys.stderr)
+
+    # SIGTERM 和 Ctrl+C 都正常退出；shutdown 会等待 serve_forever 返回，必须在其他线程中调用
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.shutdown()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
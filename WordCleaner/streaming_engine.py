@@ -0,0 +1,226 @@
+"""流式排版引擎（用于超大文档）
+
+python-docx 打开文档时会为整个 document.xml 构建 lxml 树，几百 MB 的报告在
+工作进程中要占用数 GB 内存。这里不经过 python-docx：用增量解析器逐块读取
+document.xml，每当 w:body 下的一个 w:p 或 w:tbl 解析完成，就用与 fast 引擎相同
+的规则（_process_paragraph / _process_table）处理它、写入输出并从树中删除，
+内存占用只与最大的单个段落或表格有关，与文档总大小基本无关。
+
+styles.xml 体积很小，仍整体解析；其余 ZIP 成员原样复制（见 package_io.rewrite_package）。
+遇到不支持的结构时退回 fast 引擎，见 process_document_streaming。
+"""
+import re
+from copy import deepcopy
+from io import BytesIO
+from zipfile import ZipFile
+from lxml import etree
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.opc.packuri import PACKAGE_URI, PackURI
+from docx.oxml.ns import qn
+from docx.oxml.parser import element_class_lookup, parse_xml
+from docx.styles.styles import Styles
+
+from fast_engine import (
+    W_P,
+    W_TBL,
+    _DocumentContext,
+    _process_paragraph,
+    _process_table,
+    finish_element,
+    process_document_fast,
+    report_counts,
+)
+from formatter import OutlineLevelResolver, kill_style_numbering
+from instrumentation import get_recorder
+from package_io import rewrite_package
+from rules import load_profile
+
+W_BODY = qn('w:body')
+W_DOCUMENT = qn('w:document')
+
+_PR_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+# 每次从 ZIP 成员读取的字节数
+_READ_CHUNK = 256 * 1024
+
+# 写出 w:document/w:body 外壳时用来切分首尾的占位注释
+_BODY_MARKER = "wordcleaner-body"
+
+# 序列化单个子元素时，lxml 会在其开始标签上重复声明从祖先继承的命名空间
+_XMLNS = re.compile(rb' xmlns(?::[\w.-]+)?="[^"]*"')
+
+
+class _Unsupported(Exception):
+    """流式引擎无法处理该文档，需要退回 fast 引擎"""
+
+
+def _relationships(src, rels_name, base_uri):
+    """读取关系部件，返回 {关系类型: 目标成员名}（每种类型取第一个内部关系）"""
+    try:
+        root = etree.fromstring(src.read(rels_name))
+    except KeyError:
+        return {}
+    targets = {}
+    for rel in root.iterfind(f"{{{_PR_NS}}}Relationship"):
+        if rel.get("TargetMode") == "External":
+            continue
+        partname = PackURI.from_rel_ref(base_uri, rel.get("Target"))
+        targets.setdefault(rel.get("Type"), partname)
+    return targets
+
+
+def _main_parts(src):
+    """找到正文部件和样式部件的成员名，包结构不符合预期时抛出 _Unsupported"""
+    main = _relationships(src, PACKAGE_URI.rels_uri.membername, PACKAGE_URI.baseURI).get(RT.OFFICE_DOCUMENT)
+    if main is None:
+        raise _Unsupported("没有找到正文部件")
+
+    # 只处理普通 .docx；模板、启用宏的文档等交给 python-docx 判断
+    types = etree.fromstring(src.read("[Content_Types].xml"))
+    content_type = None
+    for override in types.iterfind(f"{{{_CT_NS}}}Override"):
+        if override.get("PartName", "").lower() == main.lower():
+            content_type = override.get("ContentType")
+    if content_type != CT.WML_DOCUMENT_MAIN:
+        raise _Unsupported(f"正文部件类型为 {content_type}")
+
+    styles = _relationships(src, main.rels_uri.membername, main.baseURI).get(RT.STYLES)
+    if styles is None:
+        # python-docx 会补一个默认样式部件，流式引擎不新增部件
+        raise _Unsupported("文档没有样式部件")
+    return main.membername, styles.membername
+
+
+class _BodyWriter:
+    """把处理完的 w:body 子元素依次写到输出流，并补上 w:document/w:body 的首尾"""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.body = None
+        self._declared = ()
+        self._tail = b""
+
+    def start(self, body):
+        """写出 XML 声明、w:document 开始标签、w:body 之前的元素和 w:body 开始标签"""
+        root = body.getparent()
+        if root is None or root.tag != W_DOCUMENT:
+            raise _Unsupported("正文部件的根元素不是 w:document")
+        shell = etree.Element(root.tag, dict(root.attrib), nsmap=root.nsmap)
+        for sibling in reversed(list(body.itersiblings(preceding=True))):
+            shell.append(deepcopy(sibling))
+        shell_body = etree.SubElement(shell, body.tag, dict(body.attrib))
+        shell_body.append(etree.Comment(_BODY_MARKER))
+        head, self._tail = serialize_part_xml(shell).split(f"<!--{_BODY_MARKER}-->".encode())
+        self.fp.write(head)
+        self._declared = {
+            (f' xmlns="{uri}"' if prefix is None else f' xmlns:{prefix}="{uri}"').encode()
+            for prefix, uri in root.nsmap.items()
+        }
+        self.body = body
+
+    def write(self, el):
+        """写出一个子元素并从树中删除，去掉开始标签上与根元素重复的命名空间声明"""
+        data = etree.tostring(el, encoding="UTF-8", with_tail=False)
+        end = data.index(b">")
+        start_tag = _XMLNS.sub(lambda m: b"" if m.group(0) in self._declared else m.group(0), data[:end])
+        self.fp.write(start_tag)
+        self.fp.write(data[end:])
+        self.body.remove(el)
+
+    def flush_before(self, el):
+        """写出 el 之前尚未写出的 w:body 子元素（书签、内容控件等，原样保留）"""
+        for sibling in reversed(list(el.itersiblings(preceding=True))):
+            self.write(sibling)
+
+    def finish(self):
+        """写出 w:body 剩余的子元素（如 w:sectPr）和结束标签"""
+        for el in list(self.body):
+            self.write(el)
+        if self.body.getnext() is not None:
+            raise _Unsupported("w:body 之后还有其他元素")
+        self.fp.write(self._tail)
+
+
+def _stream_body(src, name, fp, ctx):
+    """增量解析正文部件，逐个处理 w:body 下的段落和表格并写出"""
+    parser = etree.XMLPullParser(
+        events=("end",), tag=(W_P, W_TBL),
+        remove_blank_text=True, resolve_entities=False, huge_tree=True,
+    )
+    parser.set_element_class_lookup(element_class_lookup)
+    writer = _BodyWriter(fp)
+
+    def handle(events):
+        for _, el in events:
+            parent = el.getparent()
+            if parent is None or parent.tag != W_BODY:
+                # 表格中的段落随所在表格一起处理
+                continue
+            if writer.body is None:
+                writer.start(parent)
+            writer.flush_before(el)
+            if el.tag == W_P:
+                _process_paragraph(el, ctx)
+            else:
+                _process_table(el, ctx)
+            finish_element(el, ctx)
+            writer.write(el)
+
+    with src.open(name) as f:
+        while True:
+            chunk = f.read(_READ_CHUNK)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            handle(parser.read_events())
+    root = parser.close()
+    handle(parser.read_events())
+
+    if writer.body is None:
+        # 正文中没有段落和表格
+        body = root.find(W_BODY)
+        if body is None:
+            raise _Unsupported("正文部件中没有 w:body")
+        writer.start(body)
+    writer.finish()
+
+
+def process_document_streaming(file_bytes, style_mode=False, profile=None, coalesce=False):
+    """流式处理单个文档，返回保存后的 BytesIO
+
+    处理规则与 fast 引擎相同，正文部件逐个元素处理而不整体载入内存。以下情况
+    退回 fast 引擎：包中找不到正文或样式部件、正文部件不是普通 .docx 的类型、
+    根元素不是 w:document 或 w:body 之后还有其他元素。
+    """
+    recorder = get_recorder()
+    try:
+        with recorder.span("load_styles"), ZipFile(BytesIO(file_bytes)) as src:
+            document_name, styles_name = _main_parts(src)
+            styles_element = parse_xml(src.read(styles_name))
+    except _Unsupported as e:
+        recorder.note("fallback", str(e))
+        return process_document_fast(file_bytes, style_mode=style_mode, profile=profile, coalesce=coalesce)
+
+    styles = Styles(styles_element)
+    ctx = _DocumentContext(styles, OutlineLevelResolver(styles_element), style_mode, load_profile(profile),
+                           coalesce=coalesce)
+    kill_style_numbering(styles)
+
+    def write_document(src, fp):
+        _stream_body(src, document_name, fp, ctx)
+
+    def write_styles(src, fp):
+        # 样式在正文处理过程中被修改，必须在正文之后写出
+        fp.write(serialize_part_xml(styles_element))
+
+    try:
+        with recorder.span("stream"):
+            out = rewrite_package(file_bytes, [(document_name, write_document), (styles_name, write_styles)])
+    except _Unsupported as e:
+        recorder.note("fallback", str(e))
+        return process_document_fast(file_bytes, style_mode=style_mode, profile=profile, coalesce=coalesce)
+    report_counts(ctx, recorder)
+    return out
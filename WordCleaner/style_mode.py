@@ -0,0 +1,184 @@
+"""样式模式：把字体、字号和段落间距写入样式定义
+
+默认流程在每个段落、每个 run 上写入直接格式。样式模式下每个样式只写一次
+（styles.xml 中的 Normal / Heading N 等），段落和 run 上由样式统一提供的
+直接格式被清除，其余直接格式（斜体、颜色、下划线等）保持不变。
+
+写入样式的属性会被以它为基础（w:basedOn）的样式继承：正文规则写入 Normal 后，
+Quote、没有规则的 Heading 4-9、页眉页脚、题注等样式也会带上正文的字号和缩进，
+而逐个 run 设置时它们保持不变。write_style_format 写入前先把这些属性原来的有效值
+固定到各派生样式上（见 pin_inherited_format），派生样式之后自己写入规则时再覆盖。
+"""
+from docx.oxml.ns import qn
+
+W_EAST_ASIA = qn('w:eastAsia')
+W_ASCII = qn('w:ascii')
+W_VAL = qn('w:val')
+W_STYLE = qn('w:style')
+W_STYLE_ID = qn('w:styleId')
+W_TYPE = qn('w:type')
+W_BASED_ON = qn('w:basedOn')
+W_DOC_DEFAULTS = qn('w:docDefaults')
+
+# 由样式统一提供、需要从 run 上清除的字体属性（主题字体优先级高于显式字体，一并清除）
+RUN_FONT_ATTRS = (W_EAST_ASIA, W_ASCII, qn('w:eastAsiaTheme'), qn('w:asciiTheme'))
+
+# 由样式统一提供、需要从段落上清除的间距属性
+SPACING_ATTRS = (
+    qn('w:before'), qn('w:after'), qn('w:line'), qn('w:lineRule'),
+    qn('w:beforeLines'), qn('w:afterLines'),
+    qn('w:beforeAutospacing'), qn('w:afterAutospacing'),
+)
+
+# 由样式统一提供、需要从段落上清除的首行缩进属性
+FIRST_LINE_ATTRS = (qn('w:firstLine'), qn('w:hanging'), qn('w:firstLineChars'), qn('w:hangingChars'))
+
+
+# write_style_format 可能修改的属性：(容器, 子元素, 属性, 是否为开关元素, 都未设置时的值)。
+# 同一子元素上的几组属性分别继承（如段前和段后），开关元素（w:b）存在即生效；
+# 最后一项是样式和 docDefaults 都未设置时 Word 使用的值，None 表示不固定。
+_FONT_EAST_ASIA = ("rPr", "rFonts", (W_EAST_ASIA, qn('w:eastAsiaTheme')), False, None)
+_FONT_ASCII = ("rPr", "rFonts", (W_ASCII, qn('w:asciiTheme')), False, None)
+_SIZE = ("rPr", "sz", (W_VAL,), False, {W_VAL: "20"})
+_BOLD = ("rPr", "b", (W_VAL,), True, {W_VAL: "0"})
+_SPACE_BEFORE = ("pPr", "spacing", (qn('w:before'), qn('w:beforeLines'), qn('w:beforeAutospacing')), False,
+                 {qn('w:before'): "0"})
+_SPACE_AFTER = ("pPr", "spacing", (qn('w:after'), qn('w:afterLines'), qn('w:afterAutospacing')), False,
+                {qn('w:after'): "0"})
+_LINE_SPACING = ("pPr", "spacing", (qn('w:line'), qn('w:lineRule')), False, {qn('w:line'): "240", qn('w:lineRule'): "auto"})
+_FIRST_LINE = ("pPr", "ind", FIRST_LINE_ATTRS, False, {qn('w:firstLine'): "0"})
+
+
+def _written_properties(rule):
+    """write_style_format 按该规则会修改的属性"""
+    props = [_FONT_EAST_ASIA, _FONT_ASCII, _SIZE, _SPACE_BEFORE, _SPACE_AFTER]
+    if rule.bold is not None:
+        props.append(_BOLD)
+    if rule.line_spacing is not None:
+        props.append(_LINE_SPACING)
+    if rule.first_line_indent is not None:
+        props.append(_FIRST_LINE)
+    return props
+
+
+def _own_value(el, prop):
+    """el（w:style 或 docDefaults 中的 w:rPrDefault / w:pPrDefault）自身设置的属性值，
+    返回 {属性: 值}（开关元素可能为空字典），没有设置时返回None"""
+    container, tag, attrs, flag, _ = prop
+    parent = el.find(qn(f"w:{container}"))
+    child = parent.find(qn(f"w:{tag}")) if parent is not None else None
+    if child is None:
+        return None
+    values = {attr: child.get(attr) for attr in attrs if child.get(attr) is not None}
+    return values if values or flag else None
+
+
+def _style_chain(style_el, by_id):
+    """样式及其 basedOn 链上的各级基础样式"""
+    seen = set()
+    while style_el is not None and id(style_el) not in seen:
+        seen.add(id(style_el))
+        yield style_el
+        based_on = style_el.find(W_BASED_ON)
+        style_el = by_id.get(based_on.get(W_VAL)) if based_on is not None else None
+
+
+def pin_inherited_format(style_el, props):
+    """把派生样式从 style_el 继承的 props 属性固定为当前的有效值
+
+    修改 style_el 之前调用；有效值来自 style_el 的 basedOn 链，链上都没有设置时来自
+    docDefaults，再没有时使用 Word 的默认值。派生样式自身或中间样式已设置的属性不变。
+    """
+    styles_el = style_el.getparent()
+    by_id = {el.get(W_STYLE_ID): el for el in styles_el.iterchildren(W_STYLE) if el.get(W_TYPE) == "paragraph"}
+    defaults = styles_el.find(W_DOC_DEFAULTS)
+    current = []
+    for prop in props:
+        sources = list(_style_chain(style_el, by_id))
+        default = defaults.find(qn(f"w:{prop[0]}Default")) if defaults is not None else None
+        if default is not None:
+            sources.append(default)
+        values = (_own_value(el, prop) for el in sources)
+        current.append((prop, next((value for value in values if value is not None), prop[4])))
+
+    for el in by_id.values():
+        if el is style_el:
+            continue
+        chain = list(_style_chain(el, by_id))
+        if not any(base is style_el for base in chain):
+            continue
+        between = chain[:next(i for i, base in enumerate(chain) if base is style_el)]
+        for prop, value in current:
+            if value is None or any(_own_value(base, prop) is not None for base in between):
+                continue
+            container, tag, attrs, _, _ = prop
+            parent = getattr(el, f"get_or_add_{container}")()
+            child = getattr(parent, f"get_or_add_{tag}")()
+            for attr in attrs:
+                child.attrib.pop(attr, None)
+            for attr, v in value.items():
+                child.set(attr, v)
+
+
+def write_style_format(style, rule):
+    """把一条格式规则（rules.FormatRule）写入样式定义，规则未设置的粗体、行距和首行缩进不修改
+
+    以该样式为基础、没有自己设置这些属性的样式保持原来的有效值（见 pin_inherited_format）。
+    """
+    pin_inherited_format(style.element, _written_properties(rule))
+    rPr = style.element.get_or_add_rPr()
+    rFonts = rPr.get_or_add_rFonts()
+    for attr in RUN_FONT_ATTRS:
+        rFonts.attrib.pop(attr, None)
+    rFonts.set(W_EAST_ASIA, rule.cz_font_name)
+    rFonts.set(W_ASCII, rule.font_name)
+    style.font.size = rule.font_size
+    if rule.bold is not None:
+        style.font.bold = rule.bold
+
+    pf = style.paragraph_format
+    pf.space_before = rule.space_before
+    pf.space_after = rule.space_after
+    if rule.line_spacing is not None:
+        pf.line_spacing = rule.line_spacing
+    if rule.first_line_indent is not None:
+        pf.first_line_indent = rule.first_line_indent
+
+
+def _strip_attrs(parent, child, attrs):
+    """删除 child 上的指定属性，属性删空后移除 child 本身"""
+    if child is None:
+        return
+    for attr in attrs:
+        child.attrib.pop(attr, None)
+    if not child.attrib and len(child) == 0:
+        parent.remove(child)
+
+
+def strip_run_format(r, strip_bold=False):
+    """清除 run 上与样式冲突的直接格式（中英文字体、字号，标题还包括粗体）"""
+    rPr = r.rPr
+    if rPr is None:
+        return
+    _strip_attrs(rPr, rPr.rFonts, RUN_FONT_ATTRS)
+    rPr.sz_val = None
+    if strip_bold:
+        rPr._remove_b()
+    if len(rPr) == 0 and not rPr.attrib:
+        r.remove(rPr)
+
+
+def strip_paragraph_format(p):
+    """清除段落上与样式冲突的直接格式（段前段后、行距、首行缩进）"""
+    pPr = p.pPr
+    if pPr is None:
+        return
+    _strip_attrs(pPr, pPr.spacing, SPACING_ATTRS)
+    _strip_attrs(pPr, pPr.ind, FIRST_LINE_ATTRS)
+
+
+def has_first_line_indent(p):
+    """段落是否直接设置了首行缩进或悬挂缩进"""
+    pPr = p.pPr
+    ind = pPr.ind if pPr is not None else None
+    return ind is not None and any(ind.get(attr) is not None for attr in FIRST_LINE_ATTRS)
@@ -0,0 +1,33 @@
+"""表格单元格遍历
+
+python-docx 的 row.cells 每次调用都要重新计算整张表的横向合并（gridSpan）和
+纵向合并（vMerge），行数多时总耗时随行数平方增长；合并单元格还会在结果中
+重复出现、被重复设置格式；单元格中的嵌套表格则完全不会被访问。这里直接
+遍历 w:tr/w:tc 元素，每个物理单元格只访问一次，并递归进入嵌套表格。
+"""
+from docx.oxml.ns import qn
+
+W_P = qn('w:p')
+W_TBL = qn('w:tbl')
+
+
+def iter_cell_paragraphs(tbl, counts=None):
+    """按文档顺序产出表格（w:tbl 元素）中各单元格的段落元素，包括嵌套表格中的段落
+
+    与 row.cells 一致：纵向合并的后续单元格（vMerge="continue"）不单独处理，
+    横向合并的单元格只出现一次。给定 counts（如 Counter）时累加访问到的
+    表格数 "tables"（含嵌套表格）和单元格数 "cells"。
+    """
+    if counts is not None:
+        counts["tables"] += 1
+    for tr in tbl.tr_lst:
+        for tc in tr.tc_lst:
+            if tc.vMerge == "continue":
+                continue
+            if counts is not None:
+                counts["cells"] += 1
+            for child in tc.iterchildren(W_P, W_TBL):
+                if child.tag == W_P:
+                    yield child
+                else:
+                    yield from iter_cell_paragraphs(child, counts)
@@ -0,0 +1,5 @@
+"""测试从 WordCleaner 目录导入各模块（与直接运行脚本时相同）"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+"""只读分析（dry run）：报告的修改与实际处理结果一致，命令行写出 JSON 和 CSV 报告"""
+import csv
+import json
+from io import BytesIO
+
+import pytest
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from analysis import analyze_document
+from cli import EXIT_OK, main
+from fast_engine import process_document_fast
+
+
+@pytest.fixture(scope="module")
+def document():
+    doc = Document()
+    doc.add_heading("3.1 总则", level=1)
+    doc.add_heading("", level=2)
+    p = doc.add_paragraph("按大纲级别提升")
+    outline = OxmlElement("w:outlineLvl")
+    outline.set(qn("w:val"), "0")
+    p._p.get_or_add_pPr().append(outline)
+    doc.add_paragraph("正文")
+    doc.add_paragraph("引用", style="Quote")
+    table = doc.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "单元格"
+    quoted = table.cell(0, 1).paragraphs[0]
+    quoted.style = doc.styles["Quote"]
+    quoted.text = "引用单元格"
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def test_report_lists_planned_changes(document):
+    report = analyze_document(document)
+    assert report["profile"] == "default"
+    assert [(c["paragraph"], c["action"]) for c in report["changes"]] == [
+        (1, "renumber"), (2, "demote"), (3, "promote"), (3, "renumber")]
+    renumber = report["changes"][0]
+    assert (renumber["old_prefix"], renumber["new_number"], renumber["text"]) == ("3.1", "一、", "总则")
+    assert report["skipped_styles"] == ["Quote", "表格内：Quote"]
+    counts = report["counts"]
+    assert (counts["paragraphs"], counts["headings"], counts["promoted"], counts["demoted"]) == (5, 2, 1, 1)
+    assert (counts["formatted_paragraphs"], counts["skipped_paragraphs"]) == (3, 1)
+    assert (counts["table_paragraphs"], counts["skipped_table_paragraphs"]) == (1, 1)
+
+
+def test_report_matches_processing(document):
+    report = analyze_document(document)
+    processed = Document(process_document_fast(document)).paragraphs
+    for change in report["changes"]:
+        p = processed[change["paragraph"] - 1]
+        if change["action"] == "renumber":
+            assert p.text == change["new_number"] + change["text"]
+        else:
+            assert p.style.name == change["to_style"]
+
+
+def test_dry_run_writes_reports_without_touching_inputs(document, tmp_path, capsys):
+    path = tmp_path / "报告.docx"
+    path.write_bytes(document)
+
+    assert main([str(path), "--dry-run", "-j", "1"]) == EXIT_OK
+    report = json.loads(capsys.readouterr().out)
+    assert report["aggregate"]["documents_changed"] == 1
+    assert report["aggregate"]["skipped_styles"] == {"Quote": 1, "表格内：Quote": 1}
+    [entry] = report["files"]
+    assert entry["input"] == str(path) and entry["status"] == "ok"
+    assert entry["changes"] == analyze_document(document)["changes"]
+
+    csv_path = tmp_path / "plan.csv"
+    assert main([str(path), "--dry-run", "-j", "1", "--report", str(csv_path)]) == EXIT_OK
+    with open(csv_path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["action"] for row in rows] == ["skipped", "skipped", "renumber", "demote", "promote", "renumber"]
+    assert path.read_bytes() == document
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["plan.csv", "报告.docx"]
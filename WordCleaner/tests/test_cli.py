@@ -0,0 +1,41 @@
+"""命令行：-o 输出路径保持目录结构，同名输出在处理前报错"""
+import os
+
+import pytest
+from docx import Document
+
+from cli import EXIT_OK, EXIT_USAGE, collect_inputs, main
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for folder in ("a", "b"):
+        os.mkdir(tmp_path / folder)
+        doc = Document()
+        doc.add_paragraph(f"{folder} 目录中的正文")
+        doc.save(tmp_path / folder / "报告.docx")
+    return tmp_path
+
+
+def test_glob_inputs_keep_paths_relative_to_glob_root(tree):
+    inputs = collect_inputs([str(tree / "*" / "报告.docx")])
+    assert [rel for _, rel in inputs] == [os.path.join("a", "报告.docx"), os.path.join("b", "报告.docx")]
+    inputs = collect_inputs([str(tree / "**" / "*.docx")])
+    assert sorted(rel for _, rel in inputs) == [os.path.join("a", "报告.docx"), os.path.join("b", "报告.docx")]
+
+
+def test_glob_output_keeps_structure(tree, capsys):
+    out = tree / "out"
+    code = main([str(tree / "*" / "报告.docx"), "-o", str(out), "--no-cache", "-j", "1"])
+    assert code == EXIT_OK
+    for folder in ("a", "b"):
+        paragraphs = [p.text for p in Document(out / folder / "报告.docx").paragraphs]
+        assert paragraphs == [f"{folder} 目录中的正文"]
+
+
+def test_duplicate_outputs_are_rejected_before_processing(tree, capsys):
+    out = tree / "out"
+    code = main([str(tree / "a"), str(tree / "b"), "-o", str(out), "--no-cache"])
+    assert code == EXIT_USAGE
+    assert not out.exists()
+    assert "报告.docx" in capsys.readouterr().err
@@ -0,0 +1,20 @@
+"""单次遍历引擎（fast_engine）与原有多遍流程（"dom"）的输出一致"""
+import pytest
+
+from benchmark import make_synthetic_document
+from fast_engine import compare_with_dom
+
+
+@pytest.fixture(scope="module")
+def documents():
+    return {
+        "synthetic": make_synthetic_document(paragraphs=300, heading_depth=9, tables=2, table_rows=6, images=1,
+                                             image_kb=4),
+        "pasted": make_synthetic_document(paragraphs=200, runs=6, tables=1, table_rows=4, images=0, pasted=True),
+    }
+
+
+@pytest.mark.parametrize("name", ["synthetic", "pasted"])
+@pytest.mark.parametrize("profile, coalesce", [(None, False), (None, True), ("wordcleaner", False)])
+def test_fast_engine_matches_dom(documents, name, profile, coalesce):
+    assert compare_with_dom(documents[name], profile=profile, coalesce=coalesce) == []
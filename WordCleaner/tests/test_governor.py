@@ -0,0 +1,79 @@
+"""资源限制：超时、内存超限和进程异常退出时终止处理并报告原因，其余文档照常处理"""
+import os
+import time
+
+import pytest
+
+from batch import process_batch, run_one
+from governor import MB, UNLIMITED, ResourceLimitExceeded, rss_bytes, run_governed
+
+LIMITS = UNLIMITED._replace(timeout=30)
+
+
+def echo(file_bytes):
+    return file_bytes.upper()
+
+
+def sleep(file_bytes):
+    time.sleep(30)
+    return file_bytes
+
+
+def allocate(file_bytes):
+    # 逐块分配并写入，RSS 随之增长
+    blocks = [bytearray(16 * MB) for _ in range(64)]
+    time.sleep(30)
+    return bytes(len(blocks))
+
+
+def crash(file_bytes):
+    os._exit(3)
+
+
+def fail(file_bytes):
+    raise ValueError("处理失败")
+
+
+def test_result_is_returned_within_limits():
+    data, peak = run_governed(echo, b"abc", limits=LIMITS)
+    assert data == b"ABC"
+    assert peak is None or peak > 0
+
+
+def test_timeout_stops_processing():
+    start = time.perf_counter()
+    with pytest.raises(ResourceLimitExceeded) as info:
+        run_governed(sleep, b"", limits=LIMITS._replace(timeout=0.5))
+    assert info.value.code == "timeout"
+    assert info.value.limit == 0.5 and info.value.actual >= 0.5
+    assert time.perf_counter() - start < 10
+
+
+@pytest.mark.skipif(rss_bytes() is None, reason="无法读取进程的常驻内存")
+def test_memory_limit_stops_processing():
+    limit = rss_bytes() + 256 * MB
+    start = time.perf_counter()
+    with pytest.raises(ResourceLimitExceeded) as info:
+        run_governed(allocate, b"", limits=LIMITS._replace(max_rss_bytes=limit))
+    assert info.value.code == "memory"
+    assert info.value.actual > limit
+    assert time.perf_counter() - start < 10
+
+
+def test_worker_exit_and_errors_are_reported():
+    with pytest.raises(ResourceLimitExceeded) as info:
+        run_governed(crash, b"", limits=LIMITS)
+    assert info.value.code == "worker_died" and info.value.actual == 3
+    with pytest.raises(ValueError, match="处理失败"):
+        run_governed(fail, b"", limits=LIMITS)
+
+
+def test_batch_reports_limit_codes():
+    result = run_one(sleep, "slow.docx", b"", {}, limits=LIMITS._replace(timeout=0.5))
+    assert result.data is None and result.error_code == "timeout"
+    assert "ResourceLimitExceeded" in result.error
+
+    results = {r.key: r for r in process_batch([("a", b"a"), ("b", b"b")], func=echo, max_workers=1,
+                                               limits=LIMITS)}
+    assert {key: r.data for key, r in results.items()} == {"a": b"A", "b": b"B"}
+    assert all(r.error is None and r.error_code is None for r in results.values())
@@ -0,0 +1,37 @@
+"""标题原有序号的识别和中文数字转换"""
+import pytest
+
+from heading_numbers import num_to_cn, prefix_lengths
+
+
+@pytest.mark.parametrize("text, rest", [
+    ("一、概述", "概述"),
+    ("（二）范围", "范围"),
+    ("十二）说明", "说明"),
+    ("一百零一、附录", "附录"),
+    ("3、目标", "目标"),
+    ("12. 方法", " 方法"),
+    ("1.2.3 设计", "设计"),
+    ("1.2.3.设计", "设计"),
+    ("一、1.2 设计", "设计"),
+    ("①要求", "要求"),
+    # 不是序号的数字保持不变
+    ("2.5D建模", "2.5D建模"),
+    ("1.5倍行距设置", "1.5倍行距设置"),
+    ("1.2.3标题", "1.2.3标题"),
+    ("20240101 会议纪要", "20240101 会议纪要"),
+    ("2024 年度报告", "2024 年度报告"),
+])
+def test_prefix_lengths(text, rest):
+    (length,) = prefix_lengths([text])
+    assert text[length:] == rest
+
+
+@pytest.mark.parametrize("num, text", [(0, "零"), (10, "十"), (105, "一百零五"), (10010, "一万零一十")])
+def test_num_to_cn(num, text):
+    assert num_to_cn(num) == text
+
+
+def test_num_to_cn_rejects_negative():
+    with pytest.raises(ValueError):
+        num_to_cn(-1)
@@ -0,0 +1,45 @@
+"""增量处理：再次处理时清单随文档更新"""
+from io import BytesIO
+
+from docx import Document
+from docx.oxml.ns import qn
+
+from benchmark import make_synthetic_document
+from fast_engine import process_document_incremental
+from incremental import element_digest, load_manifest
+from instrumentation import TraceRecorder, use_recorder
+
+
+def _process(file_bytes):
+    """增量处理一次，返回 (输出字节, 记录的统计)"""
+    recorder = TraceRecorder()
+    with use_recorder(recorder):
+        output = process_document_incremental(file_bytes).getvalue()
+    return output, recorder.notes["incremental"]
+
+
+def _check_manifest(output, stats):
+    """输出文档中的清单与本次处理的统计和文档内容一致"""
+    doc = Document(BytesIO(output))
+    manifest = load_manifest(doc)
+    assert manifest["stats"] == stats
+    body = doc.element.body
+    paragraphs = [element_digest(p) for p in body.iterchildren(qn("w:p"))]
+    assert [digest for digest, _ in manifest["paragraphs"]] == paragraphs
+    assert manifest["tables"] == [element_digest(t) for t in body.iterchildren(qn("w:tbl"))]
+
+
+def test_manifest_updated_on_every_run():
+    source = make_synthetic_document(paragraphs=120, tables=2, table_rows=4, images=1, image_kb=4)
+    first, first_stats = _process(source)
+    _check_manifest(first, first_stats)
+    assert first_stats["processed"] > 0
+
+    second, second_stats = _process(first)
+    _check_manifest(second, second_stats)
+    assert second_stats["processed"] == 0
+    assert second_stats["reused"] == first_stats["processed"]
+
+    third, third_stats = _process(second)
+    _check_manifest(third, third_stats)
+    assert third_stats == second_stats
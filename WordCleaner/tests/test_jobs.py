@@ -0,0 +1,78 @@
+"""后台任务：结果按 ttl 过期、按总字节数淘汰，过期的任务状态一并清除"""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import jobs
+from jobs import DONE, JobManager, ResultStore
+from result_cache import ResultCache, cache_key, rules_fingerprint
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """替换 jobs 模块使用的时钟，now 为当前秒数"""
+    fake = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(jobs, "time", SimpleNamespace(monotonic=lambda: fake.now, time=lambda: fake.now))
+    return fake
+
+
+def test_results_expire_after_ttl(tmp_path, clock):
+    store = ResultStore(ttl=60, directory=str(tmp_path))
+    store.put("a", b"result")
+    path = store.path("a")
+    clock.now += 59
+    assert store.get("a") == b"result"
+    clock.now += 2
+    assert store.get("a") is None
+    assert store.path("a") is None
+    assert not os.path.exists(path)
+    assert len(store) == 0 and store.stored_bytes() == 0
+    store.close()
+    assert not os.path.exists(store.directory)
+
+
+def test_oldest_results_are_evicted_over_max_bytes(tmp_path, clock):
+    store = ResultStore(ttl=60, max_bytes=10, directory=str(tmp_path))
+    store.put("a", b"aaaaaa")
+    path = store.path("a")
+    store.put("b", b"bbbbbb")
+    assert store.get("a") is None and not os.path.exists(path)
+    assert store.get("b") == b"bbbbbb"
+    assert store.stored_bytes() == 6
+    store.close()
+
+
+def test_finished_jobs_expire_with_their_results(tmp_path, clock):
+    cache = ResultCache(None)
+    manager = JobManager(max_workers=1, store=ResultStore(ttl=60, directory=str(tmp_path)), cache=cache)
+    cache.put(cache_key(b"input", rules_fingerprint(manager.func)), b"output")
+    try:
+        job_id = manager.submit("session", "a.docx", b"input")
+        [status] = manager.jobs("session")
+        assert (status.id, status.state, status.cached) == (job_id, DONE, True)
+        assert manager.result(job_id) == b"output"
+        assert manager.jobs("other") == []
+
+        clock.now += 61
+        assert manager.jobs("session") == []
+        assert manager.result(job_id) is None
+        assert manager.stats()["stored_results"] == 0
+    finally:
+        manager.shutdown()
+        manager.store.close()
+
+
+def test_forget_deletes_finished_results(tmp_path, clock):
+    cache = ResultCache(None)
+    manager = JobManager(max_workers=1, store=ResultStore(ttl=60, directory=str(tmp_path)), cache=cache)
+    cache.put(cache_key(b"input", rules_fingerprint(manager.func)), b"output")
+    try:
+        job_id = manager.submit("session", "a.docx", b"input")
+        path = manager.result_path(job_id)
+        manager.forget("session")
+        assert manager.jobs("session") == []
+        assert not os.path.exists(path)
+    finally:
+        manager.shutdown()
+        manager.store.close()
@@ -0,0 +1,57 @@
+"""结果缓存：格式规则文件修改后缓存键变化，旧结果不再命中"""
+import json
+import os
+
+from result_cache import ResultCache, cache_key, rules_fingerprint
+from rules import PROFILE_DIR
+
+INPUT = b"docx bytes"
+
+
+def write_profile(path, font_size, mtime_ns):
+    with open(os.path.join(PROFILE_DIR, "default.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    data["body"]["font_size"] = font_size
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_fingerprint_follows_profile_file_content(tmp_path):
+    path = str(tmp_path / "house.json")
+    write_profile(path, 10.5, 1_000_000_000_000)
+    first = rules_fingerprint("fast_engine.process_document_fast", profile=path)
+    assert rules_fingerprint("fast_engine.process_document_fast", profile=path) == first
+
+    write_profile(path, 12, 2_000_000_000_000)
+    changed = rules_fingerprint("fast_engine.process_document_fast", profile=path)
+    assert changed != first
+
+    # 只改修改时间、内容不变时指纹不变
+    write_profile(path, 12, 3_000_000_000_000)
+    assert rules_fingerprint("fast_engine.process_document_fast", profile=path) == changed
+
+
+def test_fingerprint_distinguishes_profiles_and_options():
+    fingerprints = {
+        rules_fingerprint("fast_engine.process_document_fast"),
+        rules_fingerprint("fast_engine.process_document_fast", profile="wordcleaner"),
+        rules_fingerprint("fast_engine.process_document_fast", style_mode=True),
+        rules_fingerprint("WordCleaner.process_document"),
+    }
+    assert len(fingerprints) == 4
+
+
+def test_changed_profile_misses_cached_result(tmp_path):
+    path = str(tmp_path / "house.json")
+    write_profile(path, 10.5, 1_000_000_000_000)
+    cache = ResultCache(str(tmp_path / "cache"))
+    old_key = cache_key(INPUT, rules_fingerprint(profile=path))
+    cache.put(old_key, b"old result")
+    assert cache.get(cache_key(INPUT, rules_fingerprint(profile=path))) == b"old result"
+
+    write_profile(path, 12, 2_000_000_000_000)
+    new_key = cache_key(INPUT, rules_fingerprint(profile=path))
+    assert new_key != old_key
+    assert cache.get(new_key) is None
+    assert ResultCache(str(tmp_path / "cache")).get(new_key) is None
@@ -0,0 +1,127 @@
+"""格式规则的编译：片段合并与逐个设置 python-docx 属性的结果相同，非法规则报错"""
+import json
+import os
+
+import pytest
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.shared import Cm, Pt
+from docx.text.font import Font
+from docx.text.parfmt import ParagraphFormat
+from lxml import etree
+
+from rules import (
+    PROFILE_DIR, apply_paragraph_format, apply_run_format, available_profiles, compile_profile, compile_rule,
+    load_profile,
+)
+
+SPEC = {
+    "cz_font_name": "宋体",
+    "font_name": "Times New Roman",
+    "font_size": 10.5,
+    "bold": True,
+    "space_before": "6pt",
+    "space_after": 6,
+    "line_spacing": 1.5,
+    "first_line_indent": "0.75cm",
+}
+
+# 已有直接格式的段落：其他属性保留，字体、间距和缩进按规则合并
+PARAGRAPH = (
+    f'<w:p {nsdecls("w")}><w:pPr><w:spacing w:before="100" w:beforeLines="50"/>'
+    '<w:ind w:left="420" w:hanging="420"/><w:jc w:val="center"/></w:pPr>'
+    '<w:r><w:rPr><w:rFonts w:hAnsi="Arial" w:ascii="Arial"/><w:i/><w:sz w:val="30"/></w:rPr>'
+    '<w:t>正文</w:t></w:r></w:p>'
+)
+
+
+def test_compile_rule_converts_lengths():
+    rule = compile_rule(SPEC, "body")
+    assert rule.font_size == Pt(10.5)
+    assert rule.space_before == Pt(6) and rule.space_after == Pt(6)
+    assert rule.first_line_indent == Cm(0.75)
+    assert rule.line_spacing == 1.5 and rule.bold is True
+
+
+@pytest.mark.parametrize("spec", [SPEC, dict(SPEC, bold=None, line_spacing=None, first_line_indent=None)])
+def test_fragments_match_python_docx_setters(spec):
+    spec = {key: value for key, value in spec.items() if value is not None}
+    rule = compile_rule(spec, "body")
+
+    expected = parse_xml(PARAGRAPH)
+    r = expected.r_lst[0]
+    rFonts = r.get_or_add_rPr().get_or_add_rFonts()
+    rFonts.set(qn("w:eastAsia"), rule.cz_font_name)
+    rFonts.set(qn("w:ascii"), rule.font_name)
+    font = Font(r)
+    font.size = rule.font_size
+    if rule.bold is not None:
+        font.bold = rule.bold
+    pf = ParagraphFormat(expected)
+    pf.space_before = rule.space_before
+    pf.space_after = rule.space_after
+    if rule.line_spacing is not None:
+        pf.line_spacing = rule.line_spacing
+    if rule.first_line_indent is not None:
+        pf.first_line_indent = rule.first_line_indent
+
+    actual = parse_xml(PARAGRAPH)
+    apply_run_format(actual.r_lst[0], rule)
+    apply_paragraph_format(actual, rule)
+    assert etree.tostring(actual) == etree.tostring(expected)
+    # 片段是复制后合并的，重复应用结果不变
+    apply_run_format(actual.r_lst[0], rule)
+    apply_paragraph_format(actual, rule)
+    assert etree.tostring(actual) == etree.tostring(expected)
+
+
+@pytest.mark.parametrize("change, message", [
+    ({"font_size": None}, "缺少字段"),
+    ({"colour": "red"}, "未知字段"),
+    ({"space_before": "12px"}, "space_before"),
+    ({"space_after": True}, "space_after"),
+    ({"bold": "yes"}, "bold"),
+    ({"line_spacing": "1.5"}, "line_spacing"),
+])
+def test_invalid_rules_are_rejected(change, message):
+    spec = {key: value for key, value in dict(SPEC, **change).items() if value is not None}
+    with pytest.raises(ValueError, match=message):
+        compile_rule(spec, "body")
+
+
+@pytest.mark.parametrize("data, message", [
+    ({"body": SPEC}, "缺少 table"),
+    ({"body": SPEC, "table": SPEC, "headings": {"10": SPEC}}, "标题级别"),
+    ({"body": SPEC, "table": SPEC, "headings": []}, "headings"),
+])
+def test_invalid_profiles_are_rejected(data, message):
+    with pytest.raises(ValueError, match=message):
+        compile_profile(data, "broken")
+
+
+def test_builtin_profiles_compile_once():
+    assert {"default", "wordcleaner"} <= set(available_profiles())
+    for name in available_profiles():
+        profile = load_profile(name)
+        assert load_profile(name) is profile
+        assert profile.body.font_size is not None
+    assert load_profile(None) is load_profile("default")
+    with pytest.raises(ValueError, match="未知的格式规则"):
+        load_profile("no-such-profile")
+
+
+def test_profile_file_is_recompiled_after_change(tmp_path):
+    with open(os.path.join(PROFILE_DIR, "default.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    path = str(tmp_path / "house.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.utime(path, ns=(1_000_000_000_000, 1_000_000_000_000))
+    first = load_profile(path)
+    assert first.name == "default" and load_profile(path) is first
+
+    data["body"]["font_size"] = 12
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.utime(path, ns=(2_000_000_000_000, 2_000_000_000_000))
+    assert load_profile(path).body.font_size == Pt(12)
@@ -0,0 +1,110 @@
+"""合并相邻 run：文字和每个字符的格式保持不变，格式相同的相邻 run 都被合并"""
+import random
+from collections import Counter
+
+import pytest
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from lxml import etree
+
+from benchmark import make_synthetic_document
+from fast_engine import process_document_fast
+from run_merge import coalesce_element, coalesce_runs
+
+W_R = qn("w:r")
+W_RPR = qn("w:rPr")
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+FORMATS = ["", "<w:b/>", "<w:i/>", '<w:rFonts w:eastAsia="宋体" w:ascii="Arial"/><w:sz w:val="21"/>', "<w:rPr/>"]
+
+
+def run(text, rpr=""):
+    if rpr == "<w:rPr/>":
+        rpr, props = "", "<w:rPr/>"
+    else:
+        props = f"<w:rPr>{rpr}</w:rPr>" if rpr else ""
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    content = f"<w:t{space}>{text}</w:t>" if text else ""
+    return f"<w:r>{props}{content}</w:r>"
+
+
+def paragraph(*children):
+    return parse_xml(f'<w:p {nsdecls("w")}>{"".join(children)}</w:p>')
+
+
+def characters(p):
+    """段落中每个字符（制表符、换行记为 \\t、\\n）及其 run 格式，空 w:rPr 与没有 w:rPr 相同"""
+    result = []
+    for r in p.iter(W_R):
+        rPr = r.find(W_RPR)
+        key = b"" if rPr is None or (len(rPr) == 0 and not rPr.attrib) else etree.tostring(rPr, method="c14n")
+        for el in r:
+            if el.tag == qn("w:t"):
+                result.extend((ch, key) for ch in el.text or "")
+            elif el.tag in (qn("w:tab"), qn("w:br")):
+                result.append(("\t" if el.tag == qn("w:tab") else "\n", key))
+            elif el.tag != W_RPR:
+                result.append((el.tag, key))
+    return result
+
+
+def run_keys(container):
+    return [etree.tostring(r.find(W_RPR), method="c14n") if r.find(W_RPR) is not None else b""
+            for r in container.iterchildren(W_R)]
+
+
+def test_merges_same_format_runs():
+    p = paragraph(run("第一", "<w:b/>"), run(" 段 ", "<w:b/>"), run(""), run("落", "<w:b/>"),
+                  run("斜体", "<w:i/>"), '<w:r><w:rPr><w:i/></w:rPr><w:tab/></w:r>', run("x", "<w:rPr/>"),
+                  run("y"))
+    before = characters(p)
+    counts = Counter()
+    coalesce_runs(p, counts)
+    assert characters(p) == before
+    assert [r.xpath("string(.)") for r in p.iterchildren(W_R)] == ["第一 段 落", "斜体", "xy"]
+    assert (counts["runs_before_coalesce"], counts["runs_after_coalesce"]) == (8, 3)
+    merged = p.find(W_R).find(qn("w:t"))
+    assert merged.get(XML_SPACE) == "preserve"
+    assert len(p.r_lst[1]) == 3  # w:rPr、w:t、w:tab
+
+
+def test_keeps_runs_apart_across_other_content():
+    p = paragraph(run("a", "<w:b/>"), '<w:bookmarkStart w:id="0" w:name="m"/>', run("b", "<w:b/>"),
+                  '<w:r><w:rPr><w:b/></w:rPr><w:fldChar w:fldCharType="begin"/></w:r>', run("c", "<w:b/>"),
+                  f'<w:hyperlink>{run("d", "<w:i/>")}{run("e", "<w:i/>")}</w:hyperlink>', run("f", "<w:i/>"))
+    before = characters(p)
+    coalesce_runs(p, Counter())
+    assert characters(p) == before
+    assert len(p.r_lst) == 5
+    assert [r.xpath("string(.)") for r in p.find(qn("w:hyperlink")).iterchildren(W_R)] == ["de"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_paragraphs(seed):
+    rng = random.Random(seed)
+    children = []
+    for _ in range(rng.randint(1, 30)):
+        if rng.random() < 0.1:
+            children.append('<w:r><w:tab/></w:r>')
+        else:
+            text = "".join(rng.choice("ab 文字") for _ in range(rng.randint(0, 4)))
+            children.append(run(text, rng.choice(FORMATS)))
+    p = paragraph(*children)
+    before = characters(p)
+    coalesce_element(p, Counter())
+    assert characters(p) == before
+    keys = run_keys(p)
+    assert all(a != b for a, b in zip(keys, keys[1:]))
+
+
+def test_processed_documents_keep_text_and_formatting():
+    source = make_synthetic_document(paragraphs=120, runs=6, tables=1, table_rows=4, images=1, image_kb=2,
+                                     pasted=True)
+    plain = Document(process_document_fast(source)).element.body
+    merged = Document(process_document_fast(source, coalesce=True)).element.body
+    plain_paragraphs = list(plain.iter(qn("w:p")))
+    merged_paragraphs = list(merged.iter(qn("w:p")))
+    assert len(plain_paragraphs) == len(merged_paragraphs)
+    for a, b in zip(plain_paragraphs, merged_paragraphs):
+        assert characters(b) == characters(a)
+    assert len(list(merged.iter(W_R))) < len(list(plain.iter(W_R)))
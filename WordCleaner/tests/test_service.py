@@ -0,0 +1,88 @@
+"""常驻服务：各接口的状态码，profile 参数只接受内置规则名"""
+import http.client
+import json
+import os
+import shutil
+import threading
+from io import BytesIO
+
+import pytest
+from docx import Document
+
+from rules import PROFILE_DIR
+from service import ProcessingService, make_server, parse_options
+
+
+@pytest.fixture(scope="module")
+def server():
+    service = ProcessingService(max_workers=1)
+    server = make_server(service, port=0, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+@pytest.fixture(scope="module")
+def document():
+    doc = Document()
+    doc.add_heading("总则", level=1)
+    doc.add_paragraph("正文")
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=60)
+    try:
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def test_health(server):
+    status, body = request(server, "GET", "/health")
+    assert status == 200
+    assert json.loads(body)["workers"] == 1
+
+
+@pytest.mark.parametrize("query", ["", "?engine=stream&profile=wordcleaner", "?style_mode=1&coalesce=1"])
+def test_process(server, document, query):
+    status, body = request(server, "POST", f"/process{query}", document)
+    assert status == 200
+    assert [p.text for p in Document(BytesIO(body)).paragraphs] == ["一、总则", "正文"]
+
+
+@pytest.mark.parametrize("query", [
+    "?profile=/etc/passwd.json",
+    "?profile=../profiles/default.json",
+    "?profile=no-such-profile",
+    "?engine=turbo",
+    "?colour=red",
+])
+def test_invalid_options_are_rejected(server, document, query):
+    status, body = request(server, "POST", f"/process{query}", document)
+    assert status == 400
+    assert "error" in json.loads(body)
+
+
+def test_unknown_path_and_broken_document(server):
+    assert request(server, "GET", "/process")[0] == 404
+    status, body = request(server, "POST", "/process", b"not a docx")
+    assert status == 422
+    assert json.loads(body)["error"]
+
+
+def test_parse_options_accepts_builtin_profile_names_only(tmp_path):
+    assert parse_options("profile=default&style_mode=yes") == {
+        "engine": "fast", "style_mode": True, "incremental": False, "profile": "default"}
+    # 有效的规则文件也不接受
+    path = tmp_path / "house.json"
+    shutil.copy(os.path.join(PROFILE_DIR, "default.json"), path)
+    with pytest.raises(ValueError, match="未知的格式规则"):
+        parse_options(f"profile={path}")
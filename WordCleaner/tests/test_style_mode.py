@@ -0,0 +1,85 @@
+"""样式模式（style_mode）不改变以 Normal 等样式为基础、没有对应规则的样式"""
+import io
+
+import pytest
+from docx import Document
+from docx.oxml.ns import qn
+
+from fast_engine import process_document_fast
+
+DEPENDENT_STYLES = ["Quote", "Heading 4", "Header", "Footer", "Caption", "Intense Quote"]
+# (容器, 子元素, 同组属性, 都未设置时的值)：同组属性中任一个设置即覆盖基础样式
+PROPERTIES = [
+    ("rPr", "rFonts", ("eastAsia", "eastAsiaTheme"), None),
+    ("rPr", "rFonts", ("ascii", "asciiTheme"), None),
+    ("rPr", "sz", ("val",), {"val": "20"}),
+    ("rPr", "b", ("val",), {"val": "0"}),
+    ("pPr", "spacing", ("before", "beforeLines", "beforeAutospacing"), {"before": "0"}),
+    ("pPr", "spacing", ("after", "afterLines", "afterAutospacing"), {"after": "0"}),
+    ("pPr", "spacing", ("line", "lineRule"), {"line": "240", "lineRule": "auto"}),
+    ("pPr", "ind", ("firstLine", "hanging", "firstLineChars", "hangingChars"), {"firstLine": "0"}),
+]
+
+
+def make_document():
+    doc = Document()
+    doc.add_heading("第一章 总则", level=1)
+    doc.add_paragraph("正文段落。" * 10)
+    doc.add_paragraph("引用段落", style="Quote")
+    doc.add_paragraph("重要引用", style="Intense Quote")
+    doc.add_heading("四级标题", level=4)
+    doc.add_paragraph("图 1 示意图", style="Caption")
+    doc.sections[0].header.paragraphs[0].text = "页眉"
+    doc.sections[0].footer.paragraphs[0].text = "页脚"
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def effective(style, container, tag, attrs, default):
+    """按 basedOn 链和 docDefaults 解析样式的有效属性值"""
+    sources = []
+    while style is not None:
+        sources.append(style.element)
+        style = style.base_style
+    defaults = sources[0].getparent().find(qn("w:docDefaults"))
+    if defaults is not None:
+        sources.append(defaults.find(qn(f"w:{container}Default")))
+    for el in sources:
+        parent = el.find(qn(f"w:{container}")) if el is not None else None
+        child = parent.find(qn(f"w:{tag}")) if parent is not None else None
+        if child is None:
+            continue
+        values = {attr: child.get(qn(f"w:{attr}")) for attr in attrs if child.get(qn(f"w:{attr}")) is not None}
+        if values:
+            return values
+        if tag == "b":
+            return {"val": "1"}
+    return default
+
+
+def style_properties(docx_bytes, name):
+    style = Document(io.BytesIO(docx_bytes)).styles[name]
+    return [effective(style, *prop) for prop in PROPERTIES]
+
+
+@pytest.fixture(scope="module")
+def outputs():
+    source = make_document()
+    return tuple(process_document_fast(source, style_mode=mode).getvalue() for mode in (False, True))
+
+
+@pytest.mark.parametrize("name", DEPENDENT_STYLES)
+def test_style_mode_keeps_dependent_styles(outputs, name):
+    run_mode, style_mode = outputs
+    assert style_properties(style_mode, name) == style_properties(run_mode, name)
+
+
+def test_style_mode_formats_body_and_headings(outputs):
+    run_mode, style_mode = outputs
+    doc = Document(io.BytesIO(style_mode))
+    body = doc.paragraphs[1]
+    assert body.style.name == "Normal"
+    assert body.paragraph_format.first_line_indent is None
+    assert doc.styles["Normal"].paragraph_format.first_line_indent is not None
+    assert doc.styles["Heading 1"].font.size is not None
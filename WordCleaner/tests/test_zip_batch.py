@@ -0,0 +1,57 @@
+"""ZIP 批量输入与输出：解压前检查资源上限，成员名不会写到解压目录之外"""
+import json
+import os
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from governor import DEFAULT_LIMITS, MB, UNLIMITED, ResourceLimitExceeded
+from zip_batch import MANIFEST_NAME, extract_documents, write_results_zip
+
+
+def make_zip(members):
+    out = BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    out.seek(0)
+    return zipfile.ZipFile(out)
+
+
+def test_extract_documents_within_limits(tmp_path):
+    zf = make_zip({"a.docx": b"a" * 100, "sub/b.docx": b"b" * 100, "readme.txt": b"x"})
+    documents, skipped = extract_documents(zf, str(tmp_path))
+    assert [name for name, _ in documents] == ["a.docx", "sub/b.docx"]
+    assert skipped == ["readme.txt"]
+    assert open(documents[1][1], "rb").read() == b"b" * 100
+
+
+@pytest.mark.parametrize("members, limits, code", [
+    ({"bomb.docx": bytes(4 * MB)}, DEFAULT_LIMITS, "compression_ratio"),
+    ({"a.docx": b"a" * 100}, DEFAULT_LIMITS._replace(max_part_bytes=50), "part_too_large"),
+    ({"a.docx": b"a" * 100, "b.docx": b"b" * 100}, DEFAULT_LIMITS._replace(max_total_bytes=150),
+     "package_too_large"),
+])
+def test_extract_documents_rejects_oversized_members(tmp_path, members, limits, code):
+    with pytest.raises(ResourceLimitExceeded) as info:
+        extract_documents(make_zip(members), str(tmp_path), limits)
+    assert info.value.code == code
+    assert os.listdir(tmp_path) == []
+
+
+def test_extract_documents_unlimited(tmp_path):
+    documents, _ = extract_documents(make_zip({"bomb.docx": bytes(4 * MB)}), str(tmp_path), UNLIMITED)
+    assert os.path.getsize(documents[0][1]) == 4 * MB
+
+
+def test_member_names_are_normalized_and_unique():
+    names = ["../evil.docx", "/abs/a.docx", "a/../../a.docx", "sub\\..\\..\\b.docx", MANIFEST_NAME]
+    out = BytesIO()
+    manifest = write_results_zip(((name, b"data", {}) for name in names), out)
+    with zipfile.ZipFile(out) as zf:
+        members = zf.namelist()
+        stored = json.loads(zf.read(MANIFEST_NAME))
+    assert members == ["evil.docx", "abs/a.docx", "a.docx", "b.docx", "manifest (2).json", MANIFEST_NAME]
+    assert [entry["output"] for entry in manifest["files"]] == members[:-1]
+    assert [entry["input"] for entry in stored["files"]] == names
@@ -0,0 +1,139 @@
+"""ZIP 批量输入与输出
+
+输入：一个包含多个 .docx 的 ZIP。文档先逐个解压到临时目录，工作进程按路径读取，
+主进程不必同时持有全部文档。解压前按资源上限（governor.Limits）检查这些文档解压后的
+大小、总大小和压缩比，超限时整个 ZIP 不解压。
+输出：一个 ZIP，每处理完一个文档就立即写入并释放，内存占用只与单个文档有关；
+最后写入 manifest.json，记录每个文件的状态、耗时和大小。
+"""
+import json
+import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
+
+from batch import DEFAULT_FUNC, process_batch
+from governor import DEFAULT_LIMITS, check_members
+
+MANIFEST_NAME = "manifest.json"
+
+
+def is_document_member(info):
+    """ZIP 成员是否为待处理的 .docx（跳过目录、Word 临时文件和 macOS 的资源目录）"""
+    name = info.filename
+    base = posixpath.basename(name)
+    return (
+        not info.is_dir()
+        and base.lower().endswith(".docx")
+        and not base.startswith("~$")
+        and not name.startswith("__MACOSX/")
+    )
+
+
+def extract_documents(zf, directory, limits=DEFAULT_LIMITS):
+    """把 ZIP 中的 .docx 逐个解压到 directory，返回 ([(成员名, 文件路径)], 跳过的成员名列表)
+
+    解压前按 limits 检查待解压的成员（见 governor.check_members），超限时抛出
+    ResourceLimitExceeded，不写任何文件。解压后的文件按序号命名，不使用成员路径，
+    避免 "../" 等路径写到目录之外。
+    """
+    members = []
+    skipped = []
+    for index, info in enumerate(zf.infolist()):
+        if info.is_dir():
+            continue
+        if not is_document_member(info):
+            skipped.append(info.filename)
+            continue
+        members.append((index, info))
+    check_members([info for _, info in members], limits)
+    documents = []
+    for index, info in members:
+        path = os.path.join(directory, f"{index}.docx")
+        with zf.open(info) as src, open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        documents.append((info.filename, path))
+    return documents, skipped
+
+
+def _safe_name(name):
+    """输出 ZIP 中的成员名：规范化路径，去掉开头的 "/" 和 ".."，不会解压到目录之外"""
+    parts = posixpath.normpath(name.replace("\\", "/")).split("/")
+    while parts and parts[0] in ("", ".", ".."):
+        parts.pop(0)
+    return "/".join(parts) or "document.docx"
+
+
+def _unique_name(name, used):
+    """输出 ZIP 中的成员名去重：重名时在扩展名前加序号"""
+    name = _safe_name(name)
+    candidate = name
+    base, ext = posixpath.splitext(name)
+    n = 2
+    while candidate in used:
+        candidate = f"{base} ({n}){ext}"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def write_results_zip(results, out, skipped=()):
+    """把处理结果逐个写入输出 ZIP，最后写入 manifest.json，返回清单字典
+
+    :param results: 可迭代的 (名称, 结果, 信息字典)，结果为字节、可读的文件对象（分块复制后关闭）
+        或None（失败）；信息字典中的 status、error、seconds、cached 等字段原样写入清单。
+        名称规范化为 ZIP 内的相对路径（见 _safe_name），重名时加序号
+    :param out: 输出文件路径或可写的文件对象
+    :param skipped: 未处理的输入成员名，记入清单
+    """
+    manifest = {"files": [], "succeeded": 0, "failed": 0, "skipped": list(skipped)}
+    used = {MANIFEST_NAME}
+    # .docx 本身已经是压缩包，再次压缩几乎没有收益，直接存储
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zf:
+        for name, data, info in results:
+            entry = dict(info, input=name, output=None, output_bytes=0)
+            if data is not None:
+                entry["output"] = _unique_name(name, used)
+                if hasattr(data, "read"):
+                    with data, zf.open(entry["output"], "w") as dst:
+                        shutil.copyfileobj(data, dst)
+                    entry["output_bytes"] = zf.getinfo(entry["output"]).file_size
+                else:
+                    entry["output_bytes"] = len(data)
+                    zf.writestr(entry["output"], data)
+                manifest["succeeded"] += 1
+            else:
+                manifest["failed"] += 1
+            manifest["files"].append(entry)
+        zf.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    return manifest
+
+
+def process_zip(source, out, func=DEFAULT_FUNC, max_workers=None, cache=None, limits=None, **options):
+    """处理 ZIP 中的全部 .docx，结果按完成顺序写入输出 ZIP，返回清单字典
+
+    :param source: 输入 ZIP 的路径或文件对象
+    :param out: 输出 ZIP 的路径或可写文件对象
+    其余参数同 batch.process_batch；limits 为None 时解压仍按 DEFAULT_LIMITS 检查，
+    传入 governor.UNLIMITED 才不检查。输入 ZIP 超限时抛出 ResourceLimitExceeded。
+    """
+    with tempfile.TemporaryDirectory(prefix="wordcleaner-zip-") as directory:
+        with zipfile.ZipFile(source) as zf:
+            documents, skipped = extract_documents(zf, directory, DEFAULT_LIMITS if limits is None else limits)
+        sizes = {name: os.path.getsize(path) for name, path in documents}
+
+        def results():
+            for result in process_batch(documents, func=func, max_workers=max_workers, cache=cache,
+                                        limits=limits, **options):
+                yield result.key, result.data, {
+                    "status": "ok" if result.error is None else "error",
+                    "error": result.error,
+                    "error_code": result.error_code,
+                    "seconds": round(result.seconds, 4),
+                    "cached": result.cached,
+                    "input_bytes": sizes[result.key],
+                    "peak_rss_bytes": result.peak_rss,
+                }
+
+        return write_results_zip(results(), out, skipped)